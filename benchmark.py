@@ -0,0 +1,34 @@
+import argparse
+from src.simulator.benchmark import *
+
+
+if __name__ == '__main__':
+    # e.g. "python benchmark.py --save-baseline" before a change, then "python benchmark.py --compare" after it.
+    parser = argparse.ArgumentParser(description="Run the end-to-end benchmark on the synthetic city.")
+    parser.add_argument("--compare", action="store_true",
+                        help="compare the results with the baseline, and exit with 1 if any regressed")
+    parser.add_argument("--save-baseline", action="store_true", help="save the results as the baseline")
+    parser.add_argument("--baseline", default=PATH_TO_BENCHMARK_BASELINE, help="the path to the baseline")
+    parser.add_argument("--scenarios", nargs="+", choices=[scenario["name"] for scenario in BENCHMARK_SCENARIOS],
+                        help="run only these scenarios (default: all)")
+    parser.add_argument("--repeats", type=int, default=1, help="runs per scenario, of which the fastest is kept")
+    parser.add_argument("--tolerance", type=float, default=BENCHMARK_REGRESSION_TOLERANCE)
+    args = parser.parse_args()
+
+    print("Initializing the benchmark ...")
+    scenarios = [scenario for scenario in BENCHMARK_SCENARIOS if args.scenarios is None
+                 or scenario["name"] in args.scenarios]
+    results = run_benchmark(PATH_TO_BENCHMARK_CITY, scenarios, args.repeats)
+    benchmark_time_stamp = get_time_stamp_datetime().strftime('%Y-%m-%d-%H-%M-%S')
+    save_benchmark_results(results, f"{PATH_TO_BENCHMARK_RESULTS}/benchmark-{benchmark_time_stamp}.json")
+    if args.save_baseline:
+        save_benchmark_results(results, args.baseline)
+    if args.compare:
+        print(f"Comparing with the baseline \"{args.baseline}\" (tolerance {100 * args.tolerance:.0f}%):")
+        regressions = compare_benchmark_results(results, load_benchmark_results(args.baseline), args.tolerance)
+        if regressions:
+            print(f"[WARNING] {len(regressions)} regressions:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            sys.exit(1)
+        print("[INFO] No regressions.")
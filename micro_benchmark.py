@@ -0,0 +1,19 @@
+import argparse
+from src.simulator.micro_benchmark import *
+
+
+if __name__ == '__main__':
+    # e.g. "python micro_benchmark.py --functions validate_schedule --capacities 4 --schedule-lengths 0 8 16".
+    parser = argparse.ArgumentParser(description="Run the micro-benchmark of the dispatch functions.")
+    parser.add_argument("--functions", nargs="+", help="run only the cases of these functions (default: all)")
+    parser.add_argument("--capacities", nargs="+", type=int, default=MICRO_BENCHMARK_CAPACITIES)
+    parser.add_argument("--schedule-lengths", nargs="+", type=int, default=MICRO_BENCHMARK_SCHEDULE_LENGTHS)
+    parser.add_argument("--output", help="the path to save the results to (default: in the benchmark results)")
+    args = parser.parse_args()
+
+    print("Initializing the micro-benchmark ...")
+    results = run_micro_benchmark(PATH_TO_BENCHMARK_CITY, args.functions, tuple(args.capacities),
+                                  tuple(args.schedule_lengths))
+    micro_benchmark_time_stamp = get_time_stamp_datetime().strftime('%Y-%m-%d-%H-%M-%S')
+    save_benchmark_results(results, args.output if args.output is not None
+                           else f"{PATH_TO_BENCHMARK_RESULTS}/micro-benchmark-{micro_benchmark_time_stamp}.json")
@@ -4,8 +4,9 @@ from itertools import permutations
 
 
 def assign_orders_through_optimal_schedule_pool_assign(new_received_order_ids: list[int],
-                                                       orders: list[Order],
+                                                       orders: OrderStore,
                                                        vehicles: list[Vehicle],
+                                                       vehicle_index: VehiclePositionIndex,
                                                        system_time_ms: int,
                                                        router_func: Router):
     t = timer_start()
@@ -23,11 +24,8 @@ def assign_orders_through_optimal_schedule_pool_assign(new_received_order_ids: l
 
     # 1. Get the list of considered orders, normally including all picking and pending orders.
     #    If re-assigning picking orders to different vehicles is not enabled, only new_received_orders are considered.
-    considered_order_ids = []
     if enable_reoptimization:
-        for order in orders:
-            if order.status == OrderStatus.PICKING or order.status == OrderStatus.PENDING:
-                considered_order_ids.append(order.id)
+        considered_order_ids = orders.get_order_ids_with_status(OrderStatus.PICKING, OrderStatus.PENDING)
     else:
         considered_order_ids = new_received_order_ids
 
@@ -35,12 +33,18 @@ def assign_orders_through_optimal_schedule_pool_assign(new_received_order_ids: l
         print(f"        -Assigning {len(considered_order_ids)} orders to vehicles through OSP...")
 
     # 2. Compute all possible vehicle trip pairs, each indicating the orders in the trip can be served by the vehicle.
+    phase_start_ns = epoch_instrumentation.start_phase()
     feasible_vehicle_trip_pairs = \
-        compute_feasible_vehicle_trip_pairs(considered_order_ids, orders, vehicles, system_time_ms, router_func,
-                                            cutoff_time_for_a_size_k_trip_search_per_vehicle_ms, enable_reoptimization)
+        compute_feasible_vehicle_trip_pairs(considered_order_ids, orders, vehicles, vehicle_index, system_time_ms,
+                                            router_func, cutoff_time_for_a_size_k_trip_search_per_vehicle_ms,
+                                            enable_reoptimization)
+    epoch_instrumentation.end_phase("search", phase_start_ns)
+    record_vt_pair_counts(considered_order_ids, feasible_vehicle_trip_pairs)
 
     # 3. Score the candidate vehicle_trip_pairs.
+    phase_start_ns = epoch_instrumentation.start_phase()
     score_vt_pairs_with_num_of_orders_and_schedule_cost(feasible_vehicle_trip_pairs, orders, vehicles, system_time_ms)
+    epoch_instrumentation.end_phase("score", phase_start_ns)
 
     # 4. Compute the assignment policy, indicating which vehicle to pick which trip.
     selected_vehicle_trip_pair_indices = ilp_assignment(feasible_vehicle_trip_pairs,
@@ -51,8 +55,10 @@ def assign_orders_through_optimal_schedule_pool_assign(new_received_order_ids: l
     # 5. Update the assigned vehicles' schedules and the considered orders' statuses.
     for order_id in considered_order_ids:
         orders[order_id].status == OrderStatus.PENDING
+    phase_start_ns = epoch_instrumentation.start_phase()
     upd_schedule_for_vehicles_in_selected_vt_pairs(feasible_vehicle_trip_pairs, selected_vehicle_trip_pair_indices,
                                                    orders, vehicles, router_func)
+    epoch_instrumentation.end_phase("upd_schedules", phase_start_ns)
 
     # # 6. Update the schedule of vehicles, of which the assigned (picking) orders are reassigned to other vehicles.
     # #    (This is only needed when using GreedyAssignment.)
@@ -68,8 +74,9 @@ def assign_orders_through_optimal_schedule_pool_assign(new_received_order_ids: l
 
 
 def compute_feasible_vehicle_trip_pairs(considered_order_ids: list[int],
-                                        orders: list[Order],
+                                        orders: OrderStore,
                                         vehicles: list[Vehicle],
+                                        vehicle_index: VehiclePositionIndex,
                                         system_time_ms: int,
                                         router_func: Router,
                                         cutoff_time_for_a_size_k_trip_search_per_vehicle_ms: int,
@@ -78,9 +85,17 @@ def compute_feasible_vehicle_trip_pairs(considered_order_ids: list[int],
     if DEBUG_PRINT:
         print("                *Computing feasible vehicle trip pairs...", end=" ")
     feasible_vehicle_trip_pairs = []
+
+    # Get the orders that each vehicle can reach in time, by looking up the vehicles near each order's origin.
+    reachable_order_ids_of_vehicles = [[] for _ in range(len(vehicles))]
+    for order_id in considered_order_ids:
+        for vehicle_id in get_candidate_vehicle_ids_of_order(orders[order_id], vehicle_index, system_time_ms):
+            reachable_order_ids_of_vehicles[vehicle_id].append(order_id)
+
     for vehicle in vehicles:
         feasible_trips_for_this_vehicles = \
-            compute_feasible_trips_for_one_vehicle(considered_order_ids, orders, vehicle, system_time_ms, router_func,
+            compute_feasible_trips_for_one_vehicle(considered_order_ids, reachable_order_ids_of_vehicles[vehicle.id],
+                                                   orders, vehicle, system_time_ms, router_func,
                                                    cutoff_time_for_a_size_k_trip_search_per_vehicle_ms,
                                                    enable_reoptimization)
         feasible_vehicle_trip_pairs.extend(feasible_trips_for_this_vehicles)
@@ -92,7 +107,8 @@ def compute_feasible_vehicle_trip_pairs(considered_order_ids: list[int],
 
 
 def compute_feasible_trips_for_one_vehicle(considered_order_ids: list[int],
-                                           orders: list[Order],
+                                           reachable_order_ids: list[int],
+                                           orders: OrderStore,
                                            vehicle: Vehicle,
                                            system_time_ms: int,
                                            router_func: Router,
@@ -104,8 +120,8 @@ def compute_feasible_trips_for_one_vehicle(considered_order_ids: list[int],
     basic_schedules = \
         compute_basic_schedules_of_vehicle(orders, vehicle, system_time_ms, router_func, enable_reoptimization)
 
-    # 2. Compute trips of size 1.
-    feasible_trips_of_size_1 = compute_size_1_trips_for_one_vehicle(considered_order_ids,
+    # 2. Compute trips of size 1, only from the considered orders that the vehicle can reach in time.
+    feasible_trips_of_size_1 = compute_size_1_trips_for_one_vehicle(reachable_order_ids,
                                                                     orders,
                                                                     vehicle,
                                                                     basic_schedules,
@@ -150,17 +166,24 @@ def compute_feasible_trips_for_one_vehicle(considered_order_ids: list[int],
 
 
 def compute_size_1_trips_for_one_vehicle(considered_order_ids: list[int],
-                                         orders: list[Order],
+                                         orders: OrderStore,
                                          vehicle: Vehicle,
                                          basic_schedules: list[list[Waypoint]],
                                          system_time_ms: int,
                                          router_func: Router) -> list[SchedulingResult]:
     feasible_trips_of_size_1 = []
+    if len(considered_order_ids) == 0:
+        return feasible_trips_of_size_1
 
-    for order_id in considered_order_ids:
+    # Check all considered orders at once, to quickly filter out the orders that the vehicle can not reach in time.
+    origins_node_ids = orders.get_live_values("origin_node_id", considered_order_ids)
+    max_pickup_time_ms = orders.get_live_values("max_pickup_time_ms", considered_order_ids)
+    passed_quick_check = router_func.get_durations_ms(vehicle.pos.node_id, origins_node_ids) \
+        + vehicle.step_to_pos_duration_ms + system_time_ms <= max_pickup_time_ms
+
+    for order_idx in np.flatnonzero(passed_quick_check):
+        order_id = considered_order_ids[order_idx]
         order = orders[order_id]
-        if not pass_quick_check(order, vehicle, system_time_ms, router_func):
-            continue
         scheduling_result_this_pair = compute_schedule_of_inserting_order_to_vehicle(
             order, orders, vehicle, basic_schedules, system_time_ms, router_func)
         if scheduling_result_this_pair.success:
@@ -172,7 +195,7 @@ def compute_size_1_trips_for_one_vehicle(considered_order_ids: list[int],
 
 def compute_size_k_trips_for_one_vehicle(considered_order_ids: list[int],
                                          feasible_trips_of_size_k_minus_1: list[SchedulingResult],
-                                         orders: list[Order],
+                                         orders: OrderStore,
                                          vehicle: Vehicle,
                                          system_time_ms: int,
                                          router_func: Router,
@@ -232,7 +255,7 @@ def compute_size_k_trips_for_one_vehicle(considered_order_ids: list[int],
     return feasible_trips_of_size_k
 
 
-def compute_basic_schedules_of_vehicle(orders: list[Order],
+def compute_basic_schedules_of_vehicle(orders: OrderStore,
                                        vehicle: Vehicle,
                                        system_time_ms: int,
                                        router_func: Router,
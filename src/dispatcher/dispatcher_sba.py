@@ -4,8 +4,9 @@ from src.dispatcher.dispatcher_osp import *
 from multiprocessing.dummy import Pool as ThreadPool
 
 def assign_orders_through_single_request_batch_assign(new_received_order_ids: list[int],
-                                                      orders: list[Order],
+                                                      orders: OrderStore,
                                                       vehicles: list[Vehicle],
+                                                      vehicle_index: VehiclePositionIndex,
                                                       system_time_ms: int,
                                                       router_func: Router):
     t = timer_start()
@@ -13,11 +14,16 @@ def assign_orders_through_single_request_batch_assign(new_received_order_ids: li
         print(f"        -Assigning {len(new_received_order_ids)} orders to vehicles through SBA...")
 
     # 1. Compute all possible vehicle order pairs, each indicating that the order can be served by the vehicle.
+    phase_start_ns = epoch_instrumentation.start_phase()
     feasible_vehicle_order_pairs = compute_feasible_vehicle_order_pairs(new_received_order_ids, orders, vehicles,
-                                                                        system_time_ms, router_func)
+                                                                        vehicle_index, system_time_ms, router_func)
+    epoch_instrumentation.end_phase("search", phase_start_ns)
+    record_vt_pair_counts(new_received_order_ids, feasible_vehicle_order_pairs)
 
     # 2. Score the candidate vehicle_order_pairs.
+    phase_start_ns = epoch_instrumentation.start_phase()
     score_vt_pairs_with_num_of_orders_and_schedule_cost(feasible_vehicle_order_pairs, orders, vehicles, system_time_ms)
+    epoch_instrumentation.end_phase("score", phase_start_ns)
 
     # 3. Compute the assignment policy, indicating which vehicle to pick which order.
     selected_vehicle_order_pair_indices = ilp_assignment(feasible_vehicle_order_pairs,
@@ -25,8 +31,10 @@ def assign_orders_through_single_request_batch_assign(new_received_order_ids: li
     # selected_vehicle_order_pair_indices = greedy_assignment(feasible_vehicle_order_pairs)
 
     # 4. Update the assigned vehicles' schedules and the assigned orders' statuses.
+    phase_start_ns = epoch_instrumentation.start_phase()
     upd_schedule_for_vehicles_in_selected_vt_pairs(feasible_vehicle_order_pairs, selected_vehicle_order_pair_indices,
                                                    orders, vehicles, router_func)
+    epoch_instrumentation.end_phase("upd_schedules", phase_start_ns)
     if DEBUG_PRINT:
         num_of_assigned_orders = 0
         for order_id in new_received_order_ids:
@@ -36,8 +44,9 @@ def assign_orders_through_single_request_batch_assign(new_received_order_ids: li
 
 
 def compute_feasible_vehicle_order_pairs(new_received_order_ids: list[int],
-                                         orders: list[Order],
+                                         orders: OrderStore,
                                          vehicles: list[Vehicle],
+                                         vehicle_index: VehiclePositionIndex,
                                          system_time_ms: int,
                                          router_func: Router) -> list[SchedulingResult]:
     t = timer_start()
@@ -47,7 +56,7 @@ def compute_feasible_vehicle_order_pairs(new_received_order_ids: list[int],
     feasible_vehicle_order_pairs = []
 
     # 1. Compute the feasible orders for each vehicle.
-    feasible_vehicle_order_pairs = search_from_order(new_received_order_ids, orders, vehicles,
+    feasible_vehicle_order_pairs = search_from_order(new_received_order_ids, orders, vehicles, vehicle_index,
                                                      system_time_ms, router_func)
     # feasible_vehicle_order_pairs = search_from_vehicle(new_received_order_ids, orders, vehicles,
     #                                                    system_time_ms, router_func)
@@ -72,8 +81,9 @@ def compute_feasible_vehicle_order_pairs(new_received_order_ids: list[int],
 # "search_from_order" runs faster than "search_from_vehicle", because num_of_orders << num_of_vehicles
 # and the code is running in Python.
 def search_from_order(new_received_order_ids: list[int],
-                      orders: list[Order],
+                      orders: OrderStore,
                       vehicles: list[Vehicle],
+                      vehicle_index: VehiclePositionIndex,
                       system_time_ms: int,
                       router_func: Router) -> list[SchedulingResult]:
     feasible_vehicle_order_pairs = []
@@ -82,9 +92,8 @@ def search_from_order(new_received_order_ids: list[int],
     # t1 = timer_start()
     for order_id in new_received_order_ids:
         order = orders[order_id]
-        for vehicle in vehicles:
-            if not pass_quick_check(order, vehicle, system_time_ms, router_func):
-                continue
+        for vehicle_id in get_candidate_vehicle_ids_of_order(order, vehicle_index, system_time_ms):
+            vehicle = vehicles[vehicle_id]
             basic_schedules = [vehicle.schedule]
             scheduling_result_this_pair = compute_schedule_of_inserting_order_to_vehicle(
                 order, orders, vehicle, basic_schedules, system_time_ms, router_func)
@@ -126,7 +135,7 @@ def order_task(order_pair, system_time_ms, router_func, orders):
 
 
 def search_from_vehicle(new_received_order_ids: list[int],
-                        orders: list[Order],
+                        orders: OrderStore,
                         vehicles: list[Vehicle],
                         system_time_ms: int,
                         router_func: Router) -> list[SchedulingResult]:
@@ -6,7 +6,7 @@ from gurobipy import GRB
 
 def ilp_assignment(vehicle_trip_pairs: list[SchedulingResult],
                    considered_order_ids: list[int],
-                   orders: list[Order],
+                   orders: OrderStore,
                    vehicles: list[Vehicle],
                    ensure_assigning_orders_that_are_picking: bool = True) -> list[int]:
     t = timer_start()
@@ -18,53 +18,18 @@ def ilp_assignment(vehicle_trip_pairs: list[SchedulingResult],
         return selected_vehicle_trip_pair_indices
 
     try:
-        # 1. Create a new model
-        model = gp.Model("ilp")
-        model.setParam("LogToConsole", 0)
-
-        # 2. Create variables
-        var_vt_pair = []  # var_vt_pair[i] = 1 indicates selecting the i_th vehicle_trip_pair.
-        for i in range(len(vehicle_trip_pairs)):
-            var_vt_pair.append(model.addVar(vtype=GRB.BINARY))
-        var_order = []    # var_order[j] = 0 indicates assigning the i_th order in the list.
-        for j in range(len(considered_order_ids)):
-            var_order.append(model.addVar(vtype=GRB.BINARY))
-
-        # 3. Set objective: maximize Σ var_vt_pair[i] * score(vt_pair).
-        obj_expr = 0.0
-        for i in range(len(vehicle_trip_pairs)):
-            obj_expr += var_vt_pair[i] * vehicle_trip_pairs[i].score
-        model.setObjective(obj_expr, GRB.MAXIMIZE)
-
-        # 4. Add constraints.
-        # Add constraint 1: each vehicle (v) can only be assigned at most one schedule (trip).
-        #     Σ var_vt_pair[i] * Θ_vt(v) = 1, ∀ v ∈ V (Θ_vt(v) = 1 if v is in vt).
-        for vehicle in vehicles:  #
-            con_this_vehicle = 0.0
-            for i in range(len(vehicle_trip_pairs)):
-                if vehicle_trip_pairs[i].vehicle_id == vehicle.id:
-                    con_this_vehicle += var_vt_pair[i]
-            model.addConstr(con_this_vehicle == 1)
-
-        # Add constraint 2: each order/request (r) can only be assigned to at most one vehicle.
-        #     Σ var_vt_pair[i] * Θ_vt(r) + var_order[j] = 1, ∀ r ∈ R. (Θ_vt(order) = 1 if r is in vt).
-        for j in range(len(considered_order_ids)):
-            order = orders[considered_order_ids[j]]
-            con_this_order = 0.0
-            for i in range(len(vehicle_trip_pairs)):
-                if order.id in vehicle_trip_pairs[i].trip_ids:
-                    con_this_order += var_vt_pair[i]
-            con_this_order += var_order[j]
-            model.addConstr(con_this_order == 1)
-
-        # Add constraint 3: no currently picking order is ignored.
-        if ensure_assigning_orders_that_are_picking:
-            for j in range(len(considered_order_ids)):
-                if orders[considered_order_ids[j]].status == OrderStatus.PICKING:
-                    model.addConstr(var_order[j] == 0)
+        # 1. - 4. Create the model, its variables, objective and constraints.
+        phase_start_ns = epoch_instrumentation.start_phase()
+        model, var_vt_pair, var_order = build_ilp_model(vehicle_trip_pairs, considered_order_ids, orders, vehicles,
+                                                        ensure_assigning_orders_that_are_picking)
+        epoch_instrumentation.end_phase("ilp_build", phase_start_ns)
+        epoch_instrumentation.add_count("num_of_ilp_variables", model.NumVars)
+        epoch_instrumentation.add_count("num_of_ilp_constraints", model.NumConstrs)
 
         # 5. Optimize model.
+        phase_start_ns = epoch_instrumentation.start_phase()
         model.optimize()
+        epoch_instrumentation.end_phase("ilp_solve", phase_start_ns)
 
         # 6. Get the result.
         for i in range(len(vehicle_trip_pairs)):
@@ -73,10 +38,10 @@ def ilp_assignment(vehicle_trip_pairs: list[SchedulingResult],
 
         # Check the results of orders
         if ensure_assigning_orders_that_are_picking:
-            for j in range(len(considered_order_ids)):
-                if orders[considered_order_ids[j]].status == OrderStatus.PICKING:
-                    assert (var_order[j].getAttr(GRB.Attr.X) == 0
-                            and "Order that was picking is not assigned at this epoch!")
+            for j in np.flatnonzero(orders.get_live_values("status", considered_order_ids)
+                                    == OrderStatus.PICKING.value).tolist():
+                assert (var_order[j].getAttr(GRB.Attr.X) == 0
+                        and "Order that was picking is not assigned at this epoch!")
 
         # print(f"\n[GUROBI] Objective:{model.getObjective().getValue()}")
 
@@ -90,6 +55,61 @@ def ilp_assignment(vehicle_trip_pairs: list[SchedulingResult],
     return selected_vehicle_trip_pair_indices
 
 
+def build_ilp_model(vehicle_trip_pairs: list[SchedulingResult],
+                    considered_order_ids: list[int],
+                    orders: OrderStore,
+                    vehicles: list[Vehicle],
+                    ensure_assigning_orders_that_are_picking: bool = True) -> tuple[gp.Model, list, list]:
+    # 1. Create a new model
+    model = gp.Model("ilp")
+    model.setParam("LogToConsole", 0)
+
+    # 2. Create variables
+    var_vt_pair = []  # var_vt_pair[i] = 1 indicates selecting the i_th vehicle_trip_pair.
+    for i in range(len(vehicle_trip_pairs)):
+        var_vt_pair.append(model.addVar(vtype=GRB.BINARY))
+    var_order = []    # var_order[j] = 0 indicates assigning the i_th order in the list.
+    for j in range(len(considered_order_ids)):
+        var_order.append(model.addVar(vtype=GRB.BINARY))
+
+    # 3. Set objective: maximize Σ var_vt_pair[i] * score(vt_pair).
+    obj_expr = 0.0
+    for i in range(len(vehicle_trip_pairs)):
+        obj_expr += var_vt_pair[i] * vehicle_trip_pairs[i].score
+    model.setObjective(obj_expr, GRB.MAXIMIZE)
+
+    # 4. Add constraints.
+    # Add constraint 1: each vehicle (v) can only be assigned at most one schedule (trip).
+    #     Σ var_vt_pair[i] * Θ_vt(v) = 1, ∀ v ∈ V (Θ_vt(v) = 1 if v is in vt).
+    for vehicle in vehicles:  #
+        con_this_vehicle = 0.0
+        for i in range(len(vehicle_trip_pairs)):
+            if vehicle_trip_pairs[i].vehicle_id == vehicle.id:
+                con_this_vehicle += var_vt_pair[i]
+        model.addConstr(con_this_vehicle == 1)
+
+    # Add constraint 2: each order/request (r) can only be assigned to at most one vehicle.
+    #     Σ var_vt_pair[i] * Θ_vt(r) + var_order[j] = 1, ∀ r ∈ R. (Θ_vt(order) = 1 if r is in vt).
+    for j in range(len(considered_order_ids)):
+        order_id = considered_order_ids[j]
+        con_this_order = 0.0
+        for i in range(len(vehicle_trip_pairs)):
+            if order_id in vehicle_trip_pairs[i].trip_ids:
+                con_this_order += var_vt_pair[i]
+        con_this_order += var_order[j]
+        model.addConstr(con_this_order == 1)
+
+    # Add constraint 3: no currently picking order is ignored. (The considered orders are active, so their statuses
+    #     are read from the live columns.)
+    if ensure_assigning_orders_that_are_picking:
+        for j in np.flatnonzero(orders.get_live_values("status", considered_order_ids)
+                                == OrderStatus.PICKING.value).tolist():
+            model.addConstr(var_order[j] == 0)
+
+    model.update()
+    return model, var_vt_pair, var_order
+
+
 def greedy_assignment(vehicle_trip_pairs: list[SchedulingResult]) -> list[int]:
     t = timer_start()
     if DEBUG_PRINT:
@@ -1,6 +1,6 @@
 import numpy as np
 from src.utility.utility_functions import *
-from src.simulator.router import *
+from src.simulator.vehicle_index import *
 
 
 class SchedulingResult(object):
@@ -15,7 +15,7 @@ class SchedulingResult(object):
 
 
 def compute_schedule_of_inserting_order_to_vehicle(order: Order,
-                                                   orders: list[Order],
+                                                   orders: OrderStore,
                                                    vehicle: Vehicle,
                                                    sub_schedules: list[list[Waypoint]],
                                                    system_time_ms: int,
@@ -54,20 +54,23 @@ def generator_schedule_from_sub_schedule(order: Order,
                                          router_func: Router) -> list[Waypoint]:
     new_schedule = []
     pre_pos = vehicle.pos
+    # (The order is a view of the order table, so its origin and destination are looked up once.)
+    origin = order.origin
+    destination = order.destination
     idx = 0
     while True:
         if idx == pickup_idx:
-            route = router_func.get_route(copy.deepcopy(pre_pos), order.origin, RoutingType.TIME_ONLY)
-            new_schedule.append(Waypoint(order.origin, WaypointOp.PICKUP, order.id, route))
-            pre_pos = order.origin
+            route = router_func.get_route(pre_pos, origin, RoutingType.TIME_ONLY)
+            new_schedule.append(Waypoint(origin, WaypointOp.PICKUP, order.id, route))
+            pre_pos = origin
         if idx == dropoff_idx:
-            route = router_func.get_route(copy.deepcopy(pre_pos), order.destination, RoutingType.TIME_ONLY)
-            new_schedule.append(Waypoint(order.destination, WaypointOp.DROPOFF, order.id, route))
-            pre_pos = order.destination
+            route = router_func.get_route(pre_pos, destination, RoutingType.TIME_ONLY)
+            new_schedule.append(Waypoint(destination, WaypointOp.DROPOFF, order.id, route))
+            pre_pos = destination
         if idx >= len(sub_schedule):
             assert (len(new_schedule) != 0)
             return new_schedule
-        route = router_func.get_route(copy.deepcopy(pre_pos), sub_schedule[idx].pos, RoutingType.TIME_ONLY)
+        route = router_func.get_route(pre_pos, sub_schedule[idx].pos, RoutingType.TIME_ONLY)
         new_schedule.append(Waypoint(sub_schedule[idx].pos,
                                      sub_schedule[idx].op,
                                      sub_schedule[idx].order_id,
@@ -80,29 +83,33 @@ def validate_schedule(schedule: list[Waypoint],
                       pickup_idx: int,
                       dropoff_idx: int,
                       order: Order,
-                      orders: list[Order],
+                      orders: OrderStore,
                       vehicle: Vehicle,
                       system_time_ms: int,
                       router_func: Router) -> tuple[bool, int]:
     load = vehicle.load
-    accumulated_time_ms = system_time_ms + vehicle.step_to_pos.duration_ms
+    accumulated_time_ms = system_time_ms + vehicle.step_to_pos_duration_ms
+    # (The orders in a schedule are active, so their deadlines are read from the live columns.)
+    live_start_id = orders.live_start_id
+    max_pickup_times_ms = orders.get_live_column_array("max_pickup_time_ms")
+    max_dropoff_times_ms = orders.get_live_column_array("max_dropoff_time_ms")
     for idx, wp in enumerate(schedule):
         accumulated_time_ms += wp.route.duration_ms
         if idx >= pickup_idx:
-            if wp.op == WaypointOp.PICKUP and accumulated_time_ms > orders[wp.order_id].max_pickup_time_ms:
+            if wp.op == WaypointOp.PICKUP and accumulated_time_ms > max_pickup_times_ms[wp.order_id - live_start_id]:
                 if wp.order_id == order.id:
                     return False, 2
                 if idx <= dropoff_idx:
                     return False, 1
                 return False, 0
-            elif wp.op == WaypointOp.DROPOFF and accumulated_time_ms > orders[wp.order_id].max_dropoff_time_ms:
+            elif wp.op == WaypointOp.DROPOFF \
+                    and accumulated_time_ms > max_dropoff_times_ms[wp.order_id - live_start_id]:
                 if idx <= dropoff_idx or wp.order_id == order.id:
                     return False, 1
                 return False, 0
             elif wp.op == WaypointOp.REPOSITION:
                 direct_time_to_reposition_point_ms = \
-                    router_func.get_route(vehicle.pos, wp.pos, RoutingType.TIME_ONLY).duration_ms \
-                    + vehicle.step_to_pos.duration_ms
+                    router_func.get_duration_ms(vehicle.pos.node_id, wp.pos.node_id) + vehicle.step_to_pos_duration_ms
                 if accumulated_time_ms > direct_time_to_reposition_point_ms * 2:
                     return False, 0
 
@@ -117,16 +124,25 @@ def validate_schedule(schedule: list[Waypoint],
 
 
 def pass_quick_check(order: Order, vehicle: Vehicle, system_time_ms: int, router_func: Router) -> bool:
-    if router_func.get_route(vehicle.pos, order.origin, RoutingType.TIME_ONLY).duration_ms + \
-            vehicle.step_to_pos.duration_ms + system_time_ms > order.max_pickup_time_ms:
+    if router_func.get_duration_ms(vehicle.pos.node_id, order.origin_node_id) + \
+            vehicle.step_to_pos_duration_ms + system_time_ms > order.max_pickup_time_ms:
         return False
     else:
         return True
 
 
+def get_candidate_vehicle_ids_of_order(order: Order,
+                                      vehicle_index: VehiclePositionIndex,
+                                      system_time_ms: int) -> np.ndarray:
+    # The same as running pass_quick_check on every vehicle, but only looking up the vehicles at the nodes that can
+    # reach the order's origin before its max pickup time. The result is sorted by vehicle id.
+    return vehicle_index.get_vehicle_ids_within_duration_to(order.origin_node_id,
+                                                            order.max_pickup_time_ms - system_time_ms)
+
+
 def upd_schedule_for_vehicles_in_selected_vt_pairs(vehicle_trip_pairs: list[SchedulingResult],
                                                    selected_vehicle_trip_pair_indices: list[int],
-                                                   orders: list[Order],
+                                                   orders: OrderStore,
                                                    vehicles: list[Vehicle],
                                                    router_func: Router):
     t = timer_start()
@@ -134,7 +150,7 @@ def upd_schedule_for_vehicles_in_selected_vt_pairs(vehicle_trip_pairs: list[Sche
     for idx in selected_vehicle_trip_pair_indices:
         vt_pair = vehicle_trip_pairs[idx]
         for order_id in vt_pair.trip_ids:
-            orders[order_id].status = OrderStatus.PICKING
+            orders.set_order_status(order_id, OrderStatus.PICKING)
         vehicle = vehicles[vt_pair.vehicle_id]
         schedule = vt_pair.feasible_schedules[vt_pair.best_schedule_idx]
         upd_vehicle_schedule_and_build_route(vehicle, schedule, router_func)
@@ -155,12 +171,15 @@ def upd_vehicle_schedule_and_build_route(vehicle: Vehicle, schedule: list[Waypoi
                 break
         assert (len(schedule) % 2 == 0)
 
-    # 1. Update vehicle's schedule with detailed route.
+    # 1. Update vehicle's schedule with detailed route. Only the leg that the vehicle begins now (and the next one, if
+    #    prefetched) gets its full route, the later legs keep TIME_ONLY routes until the vehicle begins them. (Most of
+    #    them are replaced by re-optimization before that, see build_full_route_of_leg() in upd_vehicle_pos().)
     vehicle.schedule = copy.deepcopy(schedule)
+    num_of_full_route_legs = 2 if PREFETCH_NEXT_LEG_FULL_ROUTE else 1
     pre_pos = vehicle.pos
-    for wp in vehicle.schedule:
-        route = router_func.get_route(pre_pos, wp.pos, RoutingType.FULL_ROUTE)
-        wp.route = route
+    for idx, wp in enumerate(vehicle.schedule):
+        routing_type = RoutingType.FULL_ROUTE if idx < num_of_full_route_legs else RoutingType.TIME_ONLY
+        wp.route = router_func.get_route(pre_pos, wp.pos, routing_type)
         pre_pos = wp.pos
 
     # 2. Update vehicle's status.
@@ -176,46 +195,60 @@ def upd_vehicle_schedule_and_build_route(vehicle: Vehicle, schedule: list[Waypoi
         return
 
     # 3. Add vehicle's pre-route, when vehicle is currently on the road link instead of a waypoint node.
-    if vehicle.step_to_pos.duration_ms > 0:
-        route = vehicle.schedule[0].route
-        route.duration_ms += vehicle.step_to_pos.duration_ms
-        route.distance_mm += vehicle.step_to_pos.distance_mm
-        route.steps.insert(0, copy.deepcopy(vehicle.step_to_pos))
-        assert (route.steps[0].poses[0].node_id == route.steps[0].poses[1].node_id)
+    if vehicle.step_to_pos_duration_ms > 0:
+        vehicle.schedule[0].route.prepend_head_step(vehicle.step_to_pos)
 
 
-def compute_schedule_cost(schedule: list[Waypoint], orders: list[Order], vehicle: Vehicle, system_time_ms: int) -> int:
+def compute_schedule_cost(schedule: list[Waypoint], orders: OrderStore, vehicle: Vehicle, system_time_ms: int) -> int:
     if len(schedule) == 0:
         return 0
 
-    accumulated_time_ms = vehicle.step_to_pos.duration_ms
+    accumulated_time_ms = vehicle.step_to_pos_duration_ms
     cost_pickup_delay_ms = 0
     cost_total_delay_ms = 0
 
     first_route = schedule[0].route
-    if len(first_route.steps) != 0 and accumulated_time_ms != 0:
+    if first_route.has_steps() and accumulated_time_ms != 0:
         accumulated_time_ms = 0
-        first_step = first_route.steps[0]
+        first_step = first_route.get_first_step()
         assert (first_step.poses[0].node_id == vehicle.pos.node_id)
         assert (first_step.poses[0].node_id == first_step.poses[1].node_id)
-        assert (first_step.duration_ms == vehicle.step_to_pos.duration_ms)
+        assert (first_step.duration_ms == vehicle.step_to_pos_duration_ms)
 
+    # (The orders in a schedule are active, so their times are read from the live columns.)
+    live_start_id = orders.live_start_id
+    request_times_ms = orders.get_live_column_array("request_time_ms")
+    shortest_travel_times_ms = orders.get_live_column_array("shortest_travel_time_ms")
     for wp in schedule:
         accumulated_time_ms += wp.route.duration_ms
         if wp.op == WaypointOp.PICKUP:
-            cost_pickup_delay_ms += system_time_ms + accumulated_time_ms - orders[wp.order_id].request_time_ms
-            assert (system_time_ms + accumulated_time_ms - orders[wp.order_id].request_time_ms >= 0)
+            pickup_delay_ms = system_time_ms + accumulated_time_ms - int(request_times_ms[wp.order_id - live_start_id])
+            assert (pickup_delay_ms >= 0)
+            cost_pickup_delay_ms += pickup_delay_ms
         if wp.op == WaypointOp.DROPOFF:
-            cost_total_delay_ms += system_time_ms + accumulated_time_ms - \
-                                   (orders[wp.order_id].request_time_ms + orders[wp.order_id].shortest_travel_time_ms)
-            assert (system_time_ms + accumulated_time_ms -
-                    (orders[wp.order_id].request_time_ms + orders[wp.order_id].shortest_travel_time_ms) >= 0)
+            row = wp.order_id - live_start_id
+            total_delay_ms = system_time_ms + accumulated_time_ms - \
+                (int(request_times_ms[row]) + int(shortest_travel_times_ms[row]))
+            assert (total_delay_ms >= 0)
+            cost_total_delay_ms += total_delay_ms
 
     return cost_total_delay_ms
 
 
+def record_vt_pair_counts(considered_order_ids: list[int], vehicle_trip_pairs: list[SchedulingResult]):
+    # Record the counts of the epoch's assignment problem. (The empty trips of the basic schedules are not counted as
+    # trips, while they are counted as pairs.)
+    if not epoch_instrumentation.enabled:
+        return
+    epoch_instrumentation.add_count("num_of_considered_orders", len(considered_order_ids))
+    epoch_instrumentation.add_count("num_of_pairs", len(vehicle_trip_pairs))
+    epoch_instrumentation.add_count("num_of_trips", len({tuple(sorted(vt_pair.trip_ids))
+                                                         for vt_pair in vehicle_trip_pairs
+                                                         if len(vt_pair.trip_ids) > 0}))
+
+
 def score_vt_pairs_with_num_of_orders_and_schedule_cost(vehicle_trip_pairs: list[SchedulingResult],
-                                                        orders: list[Order],
+                                                        orders: OrderStore,
                                                         vehicles: list[Vehicle],
                                                         system_time_ms: int):
 
@@ -2,16 +2,14 @@
 from src.dispatcher.scheduling import *
 
 
-def reposition_idle_vehicles_to_nearest_pending_orders(orders: list[Order],
+def reposition_idle_vehicles_to_nearest_pending_orders(orders: OrderStore,
                                                        vehicles: list[Vehicle],
+                                                       vehicle_index: VehiclePositionIndex,
                                                        router_func: Router):
     t = timer_start()
 
     # 1. Get a list of the unassigned orders.
-    pending_order_ids = []
-    for order in orders:
-        if order.status == OrderStatus.PENDING:
-            pending_order_ids.append(order.id)
+    pending_order_ids = orders.get_order_ids_with_status(OrderStatus.PENDING)
 
     if DEBUG_PRINT:
         num_of_idle_vehicles = 0
@@ -21,36 +19,76 @@ def reposition_idle_vehicles_to_nearest_pending_orders(orders: list[Order],
         print(f"        -Repositioning {num_of_idle_vehicles} idle vehicles to "
               f"{len(pending_order_ids)} locations through NPO...")
 
-    # 2. Compute all rebalancing candidates.
-    rebalancing_candidates = []
-    for order_id in pending_order_ids:
-        for vehicle in vehicles:
-            if not vehicle.status == VehicleStatus.IDLE:
-                continue
-            rebalancing_route = router_func.get_route(vehicle.pos, orders[order_id].origin, RoutingType.TIME_ONLY)
-            rebalancing_schedule = \
-                [Waypoint(orders[order_id].origin, WaypointOp.REPOSITION, orders[order_id].id, rebalancing_route)]
-            rebalancing_candidates.append([vehicle.id, rebalancing_schedule])
+    # 2. Compute the rebalancing candidates within the reachability radius, by looking up the idle vehicles near
+    #    each pending order's origin in the vehicle index.
+    idle_vehicle_ids = [vehicle.id for vehicle in vehicles if vehicle.status == VehicleStatus.IDLE]
+    vehicles_are_idle = np.zeros(len(vehicles), dtype=bool)
+    vehicles_are_idle[idle_vehicle_ids] = True
+    nearby_order_indices = []
+    nearby_vehicle_ids = []
+    nearby_durations_ms = []
+    for order_idx, order_id in enumerate(pending_order_ids):
+        nearby_node_ids, durations_ms = router_func.get_nodes_within_duration_to(
+            orders[order_id].origin.node_id, router_func.reachability_radius_ms)
+        vehicle_ids, node_indices = vehicle_index.get_vehicle_ids_at_nodes(nearby_node_ids)
+        idle_vehicle_mask = vehicles_are_idle[vehicle_ids]
+        nearby_order_indices.append(np.full(idle_vehicle_mask.sum(), order_idx))
+        nearby_vehicle_ids.append(vehicle_ids[idle_vehicle_mask])
+        nearby_durations_ms.append(durations_ms[node_indices[idle_vehicle_mask]])
 
-    # 3. Select suitable rebalancing candidates. Greedily from the one with the shortest travel time.
-    rebalancing_candidates.sort(key=lambda e: e[1][0].route.duration_ms)
+    # 3. Select suitable rebalancing candidates. Greedily from the one with the shortest travel time (ties are broken
+    #    by the order and then the vehicle).
     selected_vehicle_ids = []
-    selected_order_ids = []
-    for rebalancing_task in rebalancing_candidates:
-        vehicle_id = rebalancing_task[0]
-        pending_order_id = rebalancing_task[1][0].order_id
-        # Check if the vehicle has been selected to do a rebalancing task.
-        if vehicle_id in selected_vehicle_ids:
-            continue
-        # Check if the visiting point in the current rebalancing task has been visited.
-        if pending_order_id in selected_order_ids:
-            continue
-        selected_vehicle_ids.append(vehicle_id)
-        selected_order_ids.append(pending_order_id)
-        # 4. Push the rebalancing task to the assigned vehicle.
-        rebalancing_vehicle = vehicles[vehicle_id]
-        rebalancing_schedule = rebalancing_task[1]
-        upd_vehicle_schedule_and_build_route(rebalancing_vehicle, rebalancing_schedule, router_func)
+    selected_vehicle_id_set = set()
+    selected_order_id_set = set()
+    for phase in ["nearby", "remaining"]:
+        if phase == "nearby":
+            if len(pending_order_ids) == 0:
+                break
+            candidate_order_indices = np.concatenate(nearby_order_indices)
+            candidate_vehicle_ids = np.concatenate(nearby_vehicle_ids)
+            sorted_candidate_indices = np.lexsort((candidate_vehicle_ids, candidate_order_indices,
+                                                   np.concatenate(nearby_durations_ms)))
+            candidate_order_indices = candidate_order_indices[sorted_candidate_indices]
+            candidate_vehicle_ids = candidate_vehicle_ids[sorted_candidate_indices]
+        else:
+            # The idle vehicles and pending orders left unmatched are farther apart than the reachability radius,
+            # so they are paired through the full duration matrix among them.
+            remaining_vehicle_ids = np.array([vehicle_id for vehicle_id in idle_vehicle_ids
+                                              if vehicle_id not in selected_vehicle_id_set], dtype=np.int64)
+            remaining_order_indices = np.array([order_idx for order_idx, order_id in enumerate(pending_order_ids)
+                                                if order_id not in selected_order_id_set], dtype=np.int64)
+            if len(remaining_vehicle_ids) == 0 or len(remaining_order_indices) == 0:
+                break
+            remaining_vehicles_node_ids = np.array([vehicles[vehicle_id].pos.node_id
+                                                    for vehicle_id in remaining_vehicle_ids], dtype=np.int64)
+            remaining_orders_origin_node_ids = np.array([orders[pending_order_ids[order_idx]].origin.node_id
+                                                         for order_idx in remaining_order_indices], dtype=np.int64)
+            rebalancing_durations_ms = router_func.get_durations_ms(remaining_vehicles_node_ids[None, :],
+                                                                    remaining_orders_origin_node_ids[:, None])
+            sorted_candidate_indices = np.argsort(rebalancing_durations_ms, axis=None, kind="stable")
+            candidate_order_indices = remaining_order_indices[sorted_candidate_indices // len(remaining_vehicle_ids)]
+            candidate_vehicle_ids = remaining_vehicle_ids[sorted_candidate_indices % len(remaining_vehicle_ids)]
+
+        for order_idx, vehicle_id in zip(candidate_order_indices.tolist(), candidate_vehicle_ids.tolist()):
+            pending_order_id = pending_order_ids[order_idx]
+            # Check if the vehicle has been selected to do a rebalancing task.
+            if vehicle_id in selected_vehicle_id_set:
+                continue
+            # Check if the visiting point in the current rebalancing task has been visited.
+            if pending_order_id in selected_order_id_set:
+                continue
+            selected_vehicle_id_set.add(vehicle_id)
+            selected_order_id_set.add(pending_order_id)
+            selected_vehicle_ids.append(vehicle_id)
+            # 4. Push the rebalancing task to the assigned vehicle.
+            rebalancing_vehicle = vehicles[vehicle_id]
+            rebalancing_route = router_func.get_route(rebalancing_vehicle.pos, orders[pending_order_id].origin,
+                                                      RoutingType.TIME_ONLY)
+            rebalancing_schedule = \
+                [Waypoint(orders[pending_order_id].origin, WaypointOp.REPOSITION, pending_order_id, rebalancing_route)]
+            upd_vehicle_schedule_and_build_route(rebalancing_vehicle, rebalancing_schedule, router_func)
+    epoch_instrumentation.add_count("num_of_rebalancing_vehicles", len(selected_vehicle_ids))
 
     if DEBUG_PRINT:
         print(f"            +Rebalancing vehicles: {len(selected_vehicle_ids)} ({timer_end(t)})")
@@ -0,0 +1,138 @@
+import sys
+import json
+import resource
+from src.simulator.sweep import *
+from src.utility.synthetic_city import *
+
+##################################################################################
+# End-to-end Benchmark
+##################################################################################
+# Runs short simulations of fixed scenarios (a dispatcher and a fleet size) on the synthetic city (see
+# synthetic_city.py), so that the runtime of the simulator can be compared between changes on the same machine. For
+# each scenario, it records the throughput (epochs/s), the percentiles of the epoch latency and the peak RSS, plus a
+# few KPIs of the simulation, which show whether a change also changed the results. Each scenario runs in its own
+# process, forked from the one that built the router (see map_with_inherited_router()), one after the other so that
+# they do not compete for the CPU. (The peak RSS of a forked process includes the memory it shares with its parent,
+# e.g. the router.)
+# The results are saved as a json file, which can be stored as the baseline that later runs are compared to.
+BENCHMARK_FORMAT_NAME = "amod-benchmark"
+BENCHMARK_FORMAT_VERSION = 1
+BENCHMARK_SCENARIOS = [{"name": f"{dispatcher}-{fleet_size}", "dispatcher": dispatcher, "fleet_size": fleet_size}
+                       for dispatcher, fleet_sizes in (("SBA", (50, 100, 200)), ("OSP", (50, 100)))
+                       for fleet_size in fleet_sizes]
+# The settings of all scenarios: 5 + 15 min of simulation, i.e. 40 epochs.
+BENCHMARK_CONFIG = {"rebalancer": "NPO",
+                    "veh_capacity": 4,
+                    "demand_generator": "REPLAY",
+                    "request_density": 1,
+                    "simulation_start_time": f"{SYNTHETIC_CITY_DATE} 18:00:00",
+                    "cycle_s": 30,
+                    "warmup_duration_min": 5,
+                    "simulation_duration_min": 15,
+                    "winddown_duration_min": 0}
+# A scenario regresses if its throughput drops, or its p50/p95 epoch latency or peak RSS rises, by more than the
+# tolerance (as a fraction of the baseline).
+BENCHMARK_LOWER_IS_BETTER_METRICS = ("p50_epoch_ms", "p95_epoch_ms", "peak_rss_mb")
+BENCHMARK_HIGHER_IS_BETTER_METRICS = ("epochs_per_s",)
+BENCHMARK_RESULT_METRICS = ("num_of_orders", "num_of_service_orders", "avg_wait_s", "avg_delay_s")
+
+
+def run_benchmark_scenario(router_func: Router, scenario: dict, path_to_taxi_data: str) -> dict:
+    config = SimulationConfig(dispatcher=scenario["dispatcher"], fleet_size=scenario["fleet_size"],
+                              path_to_taxi_data=path_to_taxi_data, **BENCHMARK_CONFIG)
+    platform = Platform(router_func, create_demand_generator(config), config)
+    epoch_runtimes_ms = []
+    for epoch_start_time_ms in range(platform.system_time_ms, platform.system_shutdown_time_ms, platform.cycle_ms):
+        epoch_start_ns = time.perf_counter_ns()
+        platform.run_cycle(epoch_start_time_ms)
+        epoch_runtimes_ms.append((time.perf_counter_ns() - epoch_start_ns) / 1e6)
+    report_metrics = platform.compute_report_metrics()
+    result = dict(scenario)
+    result.update({"num_of_epochs": len(epoch_runtimes_ms),
+                   "epochs_per_s": len(epoch_runtimes_ms) / (sum(epoch_runtimes_ms) / 1000),
+                   "p50_epoch_ms": float(np.percentile(epoch_runtimes_ms, 50)),
+                   "p95_epoch_ms": float(np.percentile(epoch_runtimes_ms, 95)),
+                   "p99_epoch_ms": float(np.percentile(epoch_runtimes_ms, 99)),
+                   "max_epoch_ms": max(epoch_runtimes_ms),
+                   # (ru_maxrss is in KB on Linux.)
+                   "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024})
+    result.update({name: report_metrics[name] for name in BENCHMARK_RESULT_METRICS})
+    return result
+
+
+def run_benchmark(path_to_city: str, scenarios: list[dict] = None, num_of_repeats: int = 1) -> dict:
+    # Run each scenario num_of_repeats times and keep its fastest run (the least disturbed by the rest of the machine).
+    t = timer_start()
+    scenarios = scenarios if scenarios is not None else BENCHMARK_SCENARIOS
+    city_paths = load_or_build_synthetic_city(path_to_city)
+    router_func = Router(city_paths["network_nodes"], city_paths["vehicle_stations"],
+                         city_paths["shortest_path_table"], city_paths["mean_travel_time_table"],
+                         city_paths["travel_distance_table"], REACHABILITY_RADIUS_MS)
+    scenario_results = []
+    for scenario in scenarios:
+        # (A new process for each run, so that its peak RSS is of this run only.)
+        runs = [map_with_inherited_router(router_func, run_benchmark_scenario, [(scenario, city_paths["taxi_data"])],
+                                          num_of_workers=1)[0]
+                for _ in range(num_of_repeats)]
+        scenario_results.append(max(runs, key=lambda run: run["epochs_per_s"]))
+        print(f"[INFO] Benchmark {scenario['name']}: {scenario_results[-1]['epochs_per_s']:.2f} epochs/s, "
+              f"p95 = {scenario_results[-1]['p95_epoch_ms']:.0f} ms, "
+              f"peak RSS = {scenario_results[-1]['peak_rss_mb']:.0f} MB.")
+    with open(f"{path_to_city}/city.json", "r") as f:
+        city = json.load(f)
+    print(f"[INFO] Ran the benchmark of {len(scenarios)} scenarios. ({timer_end(t)})")
+    return {"format": BENCHMARK_FORMAT_NAME,
+            "version": BENCHMARK_FORMAT_VERSION,
+            "time_stamp": get_time_stamp_datetime().strftime('%Y-%m-%d %H:%M:%S'),
+            "python_version": sys.version.split()[0],
+            "numpy_version": np.__version__,
+            "cpu_count": os.cpu_count(),
+            "num_of_repeats": num_of_repeats,
+            "city": city,
+            "config": BENCHMARK_CONFIG,
+            "scenarios": scenario_results}
+
+
+def save_benchmark_results(results: dict, path_to_results: str):
+    os.makedirs(os.path.dirname(os.path.abspath(path_to_results)), exist_ok=True)
+    with open(path_to_results, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"[INFO] Benchmark results saved to \"{path_to_results}\".")
+
+
+def load_benchmark_results(path_to_results: str) -> dict:
+    with open(path_to_results, "r") as f:
+        results = json.load(f)
+    assert (results["format"] == BENCHMARK_FORMAT_NAME and "Not a benchmark result file!")
+    assert (results["version"] == BENCHMARK_FORMAT_VERSION and "Unsupported benchmark result format version!")
+    return results
+
+
+def compare_benchmark_results(results: dict, baseline: dict, tolerance: float = BENCHMARK_REGRESSION_TOLERANCE) \
+        -> list[str]:
+    # Print the change of each metric of each scenario against the baseline, and return the regressions.
+    if results["city"] != baseline["city"] or results["config"] != baseline["config"]:
+        print("[WARNING] The baseline was run with another city or config, the results might not be comparable.")
+    baseline_scenarios = {scenario["name"]: scenario for scenario in baseline["scenarios"]}
+    regressions = []
+    for scenario in results["scenarios"]:
+        baseline_scenario = baseline_scenarios.get(scenario["name"])
+        if baseline_scenario is None:
+            print(f"  {scenario['name']}: not in the baseline.")
+            continue
+        changes = []
+        for metric in BENCHMARK_HIGHER_IS_BETTER_METRICS + BENCHMARK_LOWER_IS_BETTER_METRICS:
+            change = scenario[metric] / baseline_scenario[metric] - 1 if baseline_scenario[metric] > 0 else 0.0
+            regressed = change < -tolerance if metric in BENCHMARK_HIGHER_IS_BETTER_METRICS else change > tolerance
+            changes.append(f"{metric} = {scenario[metric]:.2f} ({100 * change:+.1f}%"
+                           f"{', REGRESSION' if regressed else ''})")
+            if regressed:
+                regressions.append(f"{scenario['name']}: {metric} {baseline_scenario[metric]:.2f} -> "
+                                   f"{scenario[metric]:.2f} ({100 * change:+.1f}%)")
+        print(f"  {scenario['name']}: " + ", ".join(changes))
+        # The KPIs are deterministic, a change of them means that the simulation itself has changed.
+        changed_results = [metric for metric in BENCHMARK_RESULT_METRICS
+                           if scenario[metric] != baseline_scenario[metric]]
+        if changed_results:
+            print(f"    (the simulation results differ from the baseline: {', '.join(changed_results)})")
+    return regressions
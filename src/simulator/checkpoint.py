@@ -0,0 +1,70 @@
+import io
+from src.simulator.router import *
+
+##################################################################################
+# Simulation Checkpoint
+##################################################################################
+# A checkpoint is the pickled state of a Platform (see Platform.save_checkpoint()), preceded by a one-line json header.
+# The router is not saved: the poses of the network nodes (and the router's node pose list), which are shared by the
+# orders, vehicles and routes, are saved as references to the node ids and resolved to the poses of the router that the
+# checkpoint is loaded with. So the checkpoint stays small, and the restored state shares the router's poses as before.
+CHECKPOINT_FORMAT_NAME = "amod-checkpoint"
+CHECKPOINT_FORMAT_VERSION = 2
+
+
+class CheckpointPickler(pickle.Pickler):
+    def __init__(self, file, router_func: Router):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.router_func = router_func
+
+    def persistent_id(self, obj):
+        if obj is self.router_func.node_poses:
+            return "node_poses"
+        if type(obj) is Pos and 1 <= obj.node_id <= len(self.router_func.node_poses) \
+                and self.router_func.node_poses[obj.node_id - 1] is obj:
+            return obj.node_id
+        return None
+
+
+class CheckpointUnpickler(pickle.Unpickler):
+    def __init__(self, file, router_func: Router):
+        super().__init__(file)
+        self.router_func = router_func
+
+    def persistent_load(self, pid):
+        if pid == "node_poses":
+            return self.router_func.node_poses
+        return self.router_func.get_node_pos(pid)
+
+
+def write_checkpoint_file(state: dict, path_to_checkpoint: str, router_func: Router):
+    # The checkpoint is written to a temporary file first, so that a crash while saving keeps the previous checkpoint.
+    t = timer_start()
+    os.makedirs(os.path.dirname(os.path.abspath(path_to_checkpoint)), exist_ok=True)
+    buffer = io.BytesIO()
+    CheckpointPickler(buffer, router_func).dump(state)
+    header = {"format": CHECKPOINT_FORMAT_NAME,
+              "version": CHECKPOINT_FORMAT_VERSION,
+              "num_of_nodes": router_func.get_num_of_nodes(),
+              "system_time_ms": state["system_time_ms"]}
+    path_to_temporary_file = f"{path_to_checkpoint}.tmp"
+    with open(path_to_temporary_file, "wb") as f:
+        f.write((json.dumps(header) + "\n").encode())
+        f.write(buffer.getbuffer())
+    os.replace(path_to_temporary_file, path_to_checkpoint)
+    print(f"[INFO] Saved checkpoint at T = {round(state['system_time_ms'] / 1000)}s to \"{path_to_checkpoint}\" "
+          f"({buffer.tell() / 1024 / 1024:.2f} MB). ({timer_end(t)})")
+
+
+def read_checkpoint_file(path_to_checkpoint: str, router_func: Router) -> dict:
+    t = timer_start()
+    with open(path_to_checkpoint, "rb") as f:
+        header = json.loads(f.readline().decode())
+        assert (header["format"] == CHECKPOINT_FORMAT_NAME and "Not a checkpoint file!")
+        assert (header["version"] == CHECKPOINT_FORMAT_VERSION and "Unsupported checkpoint format version!")
+        assert (header["num_of_nodes"] == router_func.get_num_of_nodes()
+                and "The checkpoint was saved with a different road network!")
+        state = CheckpointUnpickler(f, router_func).load()
+    print(f"[INFO] Loaded checkpoint at T = {round(state['system_time_ms'] / 1000)}s from \"{path_to_checkpoint}\". "
+          f"({timer_end(t)})")
+    return state
@@ -26,7 +26,9 @@ FLEET_SIZE = 1000
 VEH_CAPACITY = 8
 
 # request_config:
-REQUEST_DENSITY = 1    # <= 1
+DEMAND_GENERATOR = "REPLAY"   # 2 options: REPLAY (the recorded taxi data), SYNTHETIC (Poisson arrivals fitted from it)
+REQUEST_DENSITY = 1    # <= 1 for REPLAY, any (e.g. 2, 5, 10) for SYNTHETIC
+SYNTHETIC_DEMAND_SEED = 0
 MAX_PICKUP_WAIT_TIME_MIN = 5
 MAX_ONBOARD_DETOUR = 1.3   # < 2
 
@@ -38,4 +40,69 @@ CYCLE_S = 30
 WARMUP_DURATION_MIN = 30        # 30 min
 SIMULATION_DURATION_MIN = 60   # <= 1370 min
 WINDDOWN_DURATION_MIN = 39      # 39 min
+REACHABILITY_RADIUS_MS = MAX_PICKUP_WAIT_TIME_MIN * 60 * 1000   # the radius of the router's reachability indices
+ROUTE_CACHE_CAPACITY = 20000    # max number of (origin, destination) full routes kept in the router's LRU cache
+USE_COMPACT_TRAVEL_TABLES = False   # quantize the travel tables to int32 ms / uint32 mm / uint16 node ids
+PREFETCH_NEXT_LEG_FULL_ROUTE = False    # also build the full route of a vehicle's next leg, not only the current one
+ORDER_CHUNK_SIZE = 10000    # the finished orders are compacted in chunks of this many orders (see OrderStore)
+SPILL_FINISHED_ORDERS_TO_DISK = False    # keep the compacted orders in memory-mapped files instead of in memory
+PATH_TO_ORDER_CHUNKS = f"{ROOT_PATH}/datalog-gitignore/order-chunks"
+
+# checkpoint_config:
+PATH_TO_CHECKPOINT = f"{ROOT_PATH}/datalog-gitignore/checkpoints/{DATA_DATE}-{FLEET_SIZE}x{VEH_CAPACITY}.ckpt"
+RESUME_FROM_CHECKPOINT = False          # start from the state saved in PATH_TO_CHECKPOINT, instead of from T = 0
+SAVE_CHECKPOINT_AFTER_WARMUP = False    # save the state at the end of the warm up, e.g. to compare dispatchers from it
+CHECKPOINT_INTERVAL_MIN = 0     # also save the state every ... min of simulated time (0: never), to resume crashed runs
+
+# instrumentation_config:
+RECORD_EPOCH_TIMINGS = False    # record the runtime of each phase of each epoch (see epoch_instrumentation.py)
+PATH_TO_EPOCH_TIMINGS = f"{ROOT_PATH}/datalog-gitignore/timings/epoch-timings.csv"    # a .csv or .jsonl file
+PROFILE_SLOW_EPOCHS = False     # sample the stacks of the epochs slower than SLOW_EPOCH_FACTOR x the recent median
+SLOW_EPOCH_FACTOR = 3.0
+PATH_TO_SLOW_EPOCH_PROFILES = f"{ROOT_PATH}/datalog-gitignore/slow-epoch-profiles"
+SAVE_METRICS_TIME_SERIES = False    # save the KPIs after each epoch (see metrics.py) as a csv table
+PATH_TO_METRICS_TIME_SERIES = f"{ROOT_PATH}/datalog-gitignore/timings/metrics-time-series.csv"
 DEBUG_PRINT = False
+
+# benchmark_config:
+PATH_TO_BENCHMARK_CITY = f"{ROOT_PATH}/datalog-gitignore/benchmark/city"   # generated on the first run
+PATH_TO_BENCHMARK_RESULTS = f"{ROOT_PATH}/datalog-gitignore/benchmark/results"
+PATH_TO_BENCHMARK_BASELINE = f"{ROOT_PATH}/datalog-gitignore/benchmark/baseline.json"
+BENCHMARK_REGRESSION_TOLERANCE = 0.1    # flag the metrics more than 10% worse than the baseline as regressions
+
+
+##################################################################################
+# Per-Platform Config
+##################################################################################
+class SimulationConfig(object):
+    # The settings that may differ between the Platforms of one process, e.g. in a parameter sweep (see sweep.py).
+    # Each setting defaults to the module constant above at the time the config is built, and can be overridden by
+    # keyword, e.g. SimulationConfig(fleet_size=2000, dispatcher="OSP"). The other constants are shared by all Platforms.
+    def __init__(self, **overrides):
+        self.dispatcher = DISPATCHER
+        self.rebalancer = REBALANCER
+        self.fleet_size = FLEET_SIZE
+        self.veh_capacity = VEH_CAPACITY
+        self.data_date = DATA_DATE
+        self.path_to_taxi_data = PATH_TO_TAXI_DATA
+        self.demand_generator = DEMAND_GENERATOR
+        self.request_density = REQUEST_DENSITY
+        self.synthetic_demand_seed = SYNTHETIC_DEMAND_SEED
+        self.simulation_start_time = SIMULATION_START_TIME
+        self.cycle_s = CYCLE_S
+        self.warmup_duration_min = WARMUP_DURATION_MIN
+        self.simulation_duration_min = SIMULATION_DURATION_MIN
+        self.winddown_duration_min = WINDDOWN_DURATION_MIN
+        for name, value in overrides.items():
+            assert (hasattr(self, name) and "Unknown simulation config!")
+            setattr(self, name, value)
+        # The taxi data of another date is in the same folder, unless its path is given as well.
+        if self.data_date != DATA_DATE and "path_to_taxi_data" not in overrides:
+            self.path_to_taxi_data = \
+                os.path.join(os.path.dirname(PATH_TO_TAXI_DATA), f"manhattan-taxi-{self.data_date}.pickle")
+
+    def get_total_duration_min(self) -> float:
+        return self.warmup_duration_min + self.simulation_duration_min + self.winddown_duration_min
+
+    def to_dict(self) -> dict:
+        return dict(vars(self))
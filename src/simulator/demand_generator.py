@@ -1,5 +1,6 @@
 
-from src.utility.utility_functions import *
+
+from src.utility.demand_store import *
 
 
 class DemandGenerator(object):
@@ -10,12 +11,10 @@ class DemandGenerator(object):
                  _init_request_idx: int = 0):
         t = timer_start()
         self.system_time_ms = 0
-        with open(_path_to_taxi_data, "rb") as f:
-            self.all_requests = pickle.load(f)
+        self.demand_store = load_demand_store(_path_to_taxi_data)
         self.init_request_time_ms = compute_the_accumulated_seconds_from_0_clock(_simulation_start_time) * 1000
-        self.init_request_idx = _init_request_idx
-        while self.all_requests[self.init_request_idx].request_time_ms < self.init_request_time_ms:
-            self.init_request_idx += 1
+        self.init_request_idx = \
+            max(_init_request_idx, self.demand_store.get_first_request_idx_at_or_after(self.init_request_time_ms))
         self.current_request_count = 0
         self.request_density = _request_density
         print(f"[INFO] Demand Generator is ready. ({timer_end(t)})")
@@ -23,14 +22,110 @@ class DemandGenerator(object):
     def get_requests(self, target_system_time_ms: int) -> list[Request]:
         assert (self.system_time_ms <= target_system_time_ms)
         self.system_time_ms = target_system_time_ms
-        requests = []
 
+        # The requests before end_request_idx are the ones generated before the target system time.
+        end_request_idx = \
+            self.demand_store.get_first_request_idx_at_or_after(self.system_time_ms + self.init_request_time_ms)
+        new_request_indices = []
         new_request_idx = self.init_request_idx + int(self.current_request_count / self.request_density)
-        while self.all_requests[new_request_idx].request_time_ms < self.system_time_ms + self.init_request_time_ms:
-            new_request = copy.deepcopy(self.all_requests[new_request_idx])
-            new_request.request_time_ms -= self.init_request_time_ms
+        while new_request_idx < end_request_idx:
+            new_request_indices.append(new_request_idx)
             self.current_request_count += 1
             new_request_idx = self.init_request_idx + int(self.current_request_count / self.request_density)
-            requests.append(new_request)
 
-        return requests
+        return self.demand_store.get_requests(new_request_indices, self.init_request_time_ms)
+
+    def get_cursor(self) -> dict:
+        # The state of the generator, which is saved in the simulation checkpoints (the demand store is not saved).
+        return {"system_time_ms": self.system_time_ms,
+                "init_request_time_ms": self.init_request_time_ms,
+                "init_request_idx": self.init_request_idx,
+                "current_request_count": self.current_request_count}
+
+    def set_cursor(self, cursor: dict):
+        assert (cursor["init_request_time_ms"] == self.init_request_time_ms
+                and "The checkpoint was saved with a different simulation start time!")
+        assert ("current_request_count" in cursor and "The checkpoint was saved with a different demand generator!")
+        self.system_time_ms = cursor["system_time_ms"]
+        self.init_request_idx = cursor["init_request_idx"]
+        self.current_request_count = cursor["current_request_count"]
+
+
+class SyntheticDemandGenerator(object):
+    # Draw requests as Poisson arrivals from an OD-rate matrix fitted from the recorded taxi data, so that the demand
+    # can be scaled beyond the historical peak (request density > 1). The OD-rate matrix is kept sparse, as the rates
+    # of the OD pairs observed in the fitting window, which by default is the whole simulated period.
+    def __init__(self,
+                 _path_to_taxi_data: str,
+                 _simulation_start_time: str,
+                 _request_density: float,
+                 _seed: int = SYNTHETIC_DEMAND_SEED,
+                 _fitting_duration_min: float = WARMUP_DURATION_MIN + SIMULATION_DURATION_MIN + WINDDOWN_DURATION_MIN):
+        t = timer_start()
+        self.system_time_ms = 0
+        self.demand_store = load_demand_store(_path_to_taxi_data)
+        self.init_request_time_ms = compute_the_accumulated_seconds_from_0_clock(_simulation_start_time) * 1000
+        self.request_density = _request_density
+        self.rng = np.random.default_rng(_seed)
+
+        # 1. Count the requests of each OD pair in the fitting window.
+        fitting_duration_ms = int(_fitting_duration_min * 60 * 1000)
+        start_idx = self.demand_store.get_first_request_idx_at_or_after(self.init_request_time_ms)
+        end_idx = self.demand_store.get_first_request_idx_at_or_after(self.init_request_time_ms + fitting_duration_ms)
+        assert (end_idx > start_idx and "No requests to fit the synthetic demand from!")
+        origin_node_ids = np.asarray(self.demand_store.origin_node_ids[start_idx:end_idx], dtype=np.int64)
+        destination_node_ids = np.asarray(self.demand_store.destination_node_ids[start_idx:end_idx], dtype=np.int64)
+        key_base = int(max(origin_node_ids.max(), destination_node_ids.max())) + 1
+        od_keys, od_counts = np.unique(origin_node_ids * key_base + destination_node_ids, return_counts=True)
+        self.od_origin_node_ids = od_keys // key_base
+        self.od_destination_node_ids = od_keys % key_base
+
+        # 2. The OD rates (requests per ms), scaled by the request density.
+        self.od_rates_per_ms = od_counts / fitting_duration_ms * self.request_density
+        self.total_rate_per_ms = float(self.od_rates_per_ms.sum())
+        self.od_cumulative_probabilities = np.cumsum(self.od_rates_per_ms) / self.total_rate_per_ms
+        print(f"[INFO] Synthetic Demand Generator is ready ({len(od_keys)} OD pairs, "
+              f"{self.total_rate_per_ms * 3600 * 1000:.0f} requests/h). ({timer_end(t)})")
+
+    def get_requests(self, target_system_time_ms: int) -> list[Request]:
+        assert (self.system_time_ms <= target_system_time_ms)
+        last_system_time_ms = self.system_time_ms
+        self.system_time_ms = target_system_time_ms
+
+        # Independent Poisson arrivals per OD pair are equivalent to a Poisson number of arrivals in total, each
+        # falling on an OD pair with a probability proportional to the pair's rate and at a uniform time.
+        num_of_requests = self.rng.poisson(self.total_rate_per_ms * (target_system_time_ms - last_system_time_ms))
+        od_indices = np.searchsorted(self.od_cumulative_probabilities, self.rng.random(num_of_requests), side="right")
+        od_indices = np.minimum(od_indices, len(self.od_cumulative_probabilities) - 1)
+        # Like the recorded data, the request times are in whole seconds.
+        request_times_ms = \
+            np.sort(self.rng.integers(last_system_time_ms, target_system_time_ms, num_of_requests)) // 1000 * 1000
+
+        return [Request(onid, dnid, request_time_ms,
+                        self.demand_store.convert_time_ms_to_date(request_time_ms + self.init_request_time_ms))
+                for onid, dnid, request_time_ms in zip(self.od_origin_node_ids[od_indices].tolist(),
+                                                       self.od_destination_node_ids[od_indices].tolist(),
+                                                       request_times_ms.tolist())]
+
+    def get_cursor(self) -> dict:
+        # The OD rates are fitted again from the same data when the generator is built, so only the random state is
+        # saved in the simulation checkpoints.
+        return {"system_time_ms": self.system_time_ms,
+                "init_request_time_ms": self.init_request_time_ms,
+                "rng_state": self.rng.bit_generator.state}
+
+    def set_cursor(self, cursor: dict):
+        assert (cursor["init_request_time_ms"] == self.init_request_time_ms
+                and "The checkpoint was saved with a different simulation start time!")
+        assert ("rng_state" in cursor and "The checkpoint was saved with a different demand generator!")
+        self.system_time_ms = cursor["system_time_ms"]
+        self.rng.bit_generator.state = cursor["rng_state"]
+
+
+def create_demand_generator(config: SimulationConfig):
+    if config.demand_generator == "SYNTHETIC":
+        return SyntheticDemandGenerator(config.path_to_taxi_data, config.simulation_start_time, config.request_density,
+                                        config.synthetic_demand_seed, config.get_total_duration_min())
+    assert (config.demand_generator == "REPLAY"
+            and "[DEBUG] WRONG DEMAND GENERATOR SETTING! Please check the name of demand generator in config!")
+    return DemandGenerator(config.path_to_taxi_data, config.simulation_start_time, config.request_density)
@@ -0,0 +1,174 @@
+import csv
+import math
+from src.utility.utility_functions import *
+
+##################################################################################
+# Streaming Metrics
+##################################################################################
+# The KPIs of the report are accumulated while the simulation runs, instead of being derived by scanning all orders and
+# vehicles at the end: the OrderStore reports each order's status transitions, and the vehicles report their travel
+# when they accumulate it (see add_travel_to_vehicle_statistics()), to the MetricsAccumulator attached to them. So the
+# KPIs are available during the run (e.g. in the progress bar and in the per-epoch time series), and the final report
+# costs O(1). The wait and delay distributions are kept in log-bucketed quantile sketches of bounded size.
+TRAVEL_STATISTICS = ("dist_traveled_mm", "loaded_dist_traveled_mm", "empty_dist_traveled_mm", "rebl_dist_traveled_mm",
+                     "time_traveled_ms", "loaded_time_traveled_ms", "empty_time_traveled_ms", "rebl_time_traveled_ms")
+METRICS_TIME_SERIES_FIELDS = ("epoch_start_time_ms", "num_of_received_orders", "num_of_pending_orders",
+                              "num_of_picking_orders", "num_of_onboard_orders", "num_of_complete_orders",
+                              "num_of_walkaway_orders", "num_of_idle_vehicles", "num_of_rebalancing_vehicles",
+                              "service_rate", "avg_wait_s", "p95_wait_s", "avg_delay_s", "p95_delay_s")
+
+
+class QuantileSketch(object):
+    # A log-bucketed histogram (as DDSketch): each value v > 0 falls in the bucket ceil(log(v) / log(gamma)), so any
+    # quantile is estimated within the relative error alpha, with a number of buckets logarithmic in the value range.
+    # (Values within ±1 are counted as 0, the negative values are bucketed by their absolute value.)
+    def __init__(self, _relative_error: float = 0.01):
+        self.gamma = (1 + _relative_error) / (1 - _relative_error)
+        self.log_gamma = math.log(self.gamma)
+        self.positive_bucket_counts = {}
+        self.negative_bucket_counts = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value: float):
+        self.count += 1
+        if -1 < value < 1:
+            self.zero_count += 1
+            return
+        bucket_counts = self.positive_bucket_counts if value > 0 else self.negative_bucket_counts
+        bucket_idx = math.ceil(math.log(abs(value)) / self.log_gamma)
+        bucket_counts[bucket_idx] = bucket_counts.get(bucket_idx, 0) + 1
+
+    def get_quantile(self, quantile: float) -> float:
+        if self.count == 0:
+            return 0.0
+        rank = quantile * (self.count - 1)
+        # The buckets in ascending order of value: the negative ones from the largest absolute value, 0, the positive.
+        num_of_values_so_far = 0
+        for bucket_idx in sorted(self.negative_bucket_counts, reverse=True):
+            num_of_values_so_far += self.negative_bucket_counts[bucket_idx]
+            if num_of_values_so_far > rank:
+                return -self.get_bucket_value(bucket_idx)
+        num_of_values_so_far += self.zero_count
+        if num_of_values_so_far > rank:
+            return 0.0
+        for bucket_idx in sorted(self.positive_bucket_counts):
+            num_of_values_so_far += self.positive_bucket_counts[bucket_idx]
+            if num_of_values_so_far > rank:
+                return self.get_bucket_value(bucket_idx)
+        return self.get_bucket_value(max(self.positive_bucket_counts))
+
+    def get_bucket_value(self, bucket_idx: int) -> float:
+        # The value in the middle of the bucket (gamma^(i-1), gamma^i], in relative terms.
+        return 2 * self.gamma ** bucket_idx / (self.gamma + 1)
+
+
+class MetricsAccumulator(object):
+    def __init__(self, _main_sim_start_time_ms: int, _main_sim_end_time_ms: int, _num_of_vehicles: int):
+        # Only the orders received during the main study are counted, as in the report.
+        self.main_sim_start_time_ms = _main_sim_start_time_ms
+        self.main_sim_end_time_ms = _main_sim_end_time_ms
+        self.num_of_vehicles = _num_of_vehicles
+        self.num_of_orders = 0
+        self.num_of_orders_by_status = {status: 0 for status in OrderStatus}
+        self.total_wait_time_ms = 0
+        self.total_delay_time_ms = 0
+        self.total_order_time_ms = 0
+        self.wait_time_s_sketch = QuantileSketch()
+        self.delay_time_s_sketch = QuantileSketch()
+        # The vehicles' travel (accumulated during the main study only, see Platform.advance_vehicles()).
+        self.total_traveled = dict.fromkeys(TRAVEL_STATISTICS, 0.0)
+        self.time_series = []
+
+    def is_counted(self, order: Order) -> bool:
+        return self.main_sim_start_time_ms < order.request_time_ms <= self.main_sim_end_time_ms
+
+    def add_order(self, order: Order):
+        if self.is_counted(order):
+            self.num_of_orders += 1
+            self.num_of_orders_by_status[order.status] += 1
+
+    def upd_order_status(self, order: Order, previous_status: OrderStatus):
+        if not self.is_counted(order):
+            return
+        self.num_of_orders_by_status[previous_status] -= 1
+        self.num_of_orders_by_status[order.status] += 1
+        if order.status == OrderStatus.COMPLETE:
+            wait_time_ms = order.pickup_time_ms - order.request_time_ms
+            delay_time_ms = order.dropoff_time_ms - (order.request_time_ms + order.shortest_travel_time_ms)
+            self.total_wait_time_ms += wait_time_ms
+            self.total_delay_time_ms += delay_time_ms
+            self.total_order_time_ms += order.shortest_travel_time_ms
+            self.wait_time_s_sketch.add(wait_time_ms / 1000.0)
+            self.delay_time_s_sketch.add(delay_time_ms / 1000.0)
+
+    def add_travel(self, statistic: str, amount: float):
+        self.total_traveled[statistic] += amount
+
+    def compute_report_metrics(self) -> dict:
+        # (The averages over no orders or no travel are 0.)
+        num_of_complete_orders = self.num_of_orders_by_status[OrderStatus.COMPLETE]
+        num_of_service_orders = num_of_complete_orders + self.num_of_orders_by_status[OrderStatus.ONBOARD]
+        total_traveled = self.total_traveled
+        return {"num_of_orders": self.num_of_orders,
+                "num_of_walkaway_orders": self.num_of_orders_by_status[OrderStatus.WALKAWAY],
+                "num_of_complete_orders": num_of_complete_orders,
+                "num_of_onboard_orders": self.num_of_orders_by_status[OrderStatus.ONBOARD],
+                "num_of_picking_orders": self.num_of_orders_by_status[OrderStatus.PICKING],
+                "num_of_pending_orders": self.num_of_orders_by_status[OrderStatus.PENDING],
+                "num_of_service_orders": num_of_service_orders,
+                "avg_shortest_travel_s": self.total_order_time_ms / 1000.0 / max(num_of_complete_orders, 1),
+                "avg_wait_s": self.total_wait_time_ms / 1000.0 / max(num_of_complete_orders, 1),
+                "p50_wait_s": self.wait_time_s_sketch.get_quantile(0.5),
+                "p95_wait_s": self.wait_time_s_sketch.get_quantile(0.95),
+                "avg_delay_s": self.total_delay_time_ms / 1000.0 / max(num_of_complete_orders, 1),
+                "p50_delay_s": self.delay_time_s_sketch.get_quantile(0.5),
+                "p95_delay_s": self.delay_time_s_sketch.get_quantile(0.95),
+                "total_dist_traveled_km": total_traveled["dist_traveled_mm"] / 1000000.0,
+                "avg_dist_traveled_km": total_traveled["dist_traveled_mm"] / 1000000.0 / self.num_of_vehicles,
+                "avg_empty_dist_traveled_km":
+                    total_traveled["empty_dist_traveled_mm"] / 1000000.0 / self.num_of_vehicles,
+                "avg_rebl_dist_traveled_km": total_traveled["rebl_dist_traveled_mm"] / 1000000.0 / self.num_of_vehicles,
+                "avg_time_traveled_s": total_traveled["time_traveled_ms"] / 1000.0 / self.num_of_vehicles,
+                "avg_empty_time_traveled_s": total_traveled["empty_time_traveled_ms"] / 1000.0 / self.num_of_vehicles,
+                "avg_rebl_time_traveled_s": total_traveled["rebl_time_traveled_ms"] / 1000.0 / self.num_of_vehicles,
+                "average_load_dist":
+                    total_traveled["loaded_dist_traveled_mm"] / max(total_traveled["dist_traveled_mm"], 1),
+                "average_load_time":
+                    total_traveled["loaded_time_traveled_ms"] / max(total_traveled["time_traveled_ms"], 1)}
+
+    def add_epoch_to_time_series(self, epoch_start_time_ms: int, orders: OrderStore, fleet_state: FleetState):
+        # The order counts are of all orders received so far, the service rate and the wait and delay times are of the
+        # orders of the main study.
+        num_of_complete_orders = self.num_of_orders_by_status[OrderStatus.COMPLETE]
+        num_of_service_orders = num_of_complete_orders + self.num_of_orders_by_status[OrderStatus.ONBOARD]
+        self.time_series.append(
+            (epoch_start_time_ms,
+             len(orders),
+             orders.get_num_of_orders_with_status(OrderStatus.PENDING),
+             orders.get_num_of_orders_with_status(OrderStatus.PICKING),
+             orders.get_num_of_orders_with_status(OrderStatus.ONBOARD),
+             orders.get_num_of_orders_with_status(OrderStatus.COMPLETE),
+             orders.get_num_of_orders_with_status(OrderStatus.WALKAWAY),
+             int(np.count_nonzero(fleet_state.statuses == VehicleStatus.IDLE.value)),
+             int(np.count_nonzero(fleet_state.statuses == VehicleStatus.REBALANCING.value)),
+             round(num_of_service_orders / max(self.num_of_orders, 1), 4),
+             round(self.total_wait_time_ms / 1000.0 / max(num_of_complete_orders, 1), 2),
+             round(self.wait_time_s_sketch.get_quantile(0.95), 2),
+             round(self.total_delay_time_ms / 1000.0 / max(num_of_complete_orders, 1), 2),
+             round(self.delay_time_s_sketch.get_quantile(0.95), 2)))
+
+    def get_live_summary(self) -> str:
+        # A short summary of the latest epoch, e.g. for the progress bar.
+        if len(self.time_series) == 0:
+            return ""
+        record = dict(zip(METRICS_TIME_SERIES_FIELDS, self.time_series[-1]))
+        return f"service={100.0 * record['service_rate']:.1f}%, wait={record['avg_wait_s']:.0f}s " \
+               f"(p95 {record['p95_wait_s']:.0f}s), delay={record['avg_delay_s']:.0f}s"
+
+    def save_time_series(self, path_to_time_series: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path_to_time_series)), exist_ok=True)
+        with open(path_to_time_series, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(METRICS_TIME_SERIES_FIELDS)
+            writer.writerows(self.time_series)
@@ -0,0 +1,332 @@
+import tracemalloc
+from src.simulator.benchmark import *
+
+##################################################################################
+# Micro-benchmark
+##################################################################################
+# Measures the throughput (calls/s) and the memory allocated per call of the functions that dominate the dispatch, on
+# fixtures of controlled sizes built on the synthetic city (see synthetic_city.py): vehicles of a given capacity with
+# a schedule of a given number of waypoints, and the orders to insert into it. Each function is timed over batches of
+# calls long enough for the timer (the fastest of a few batches is kept), then traced by tracemalloc for a few calls,
+# to get the peak memory allocated during a call and the memory still held after it and its result are gone (e.g. by
+# the route cache).
+# (tracemalloc sees the allocations of Python and numpy, not those inside gurobi.)
+MICRO_BENCHMARK_CAPACITIES = (1, 2, 4, 8)
+MICRO_BENCHMARK_SCHEDULE_LENGTHS = (0, 2, 4, 8, 16)
+MICRO_BENCHMARK_ILP_SIZES = ((20, 20, 100), (50, 50, 500), (100, 100, 2000))   # (vehicles, orders, vt pairs)
+MICRO_BENCHMARK_NUM_OF_CONSIDERED_ORDERS = 8    # the orders of the size-k trip search of a vehicle
+MICRO_BENCHMARK_SCHEDULE_SLACK_MS = 600 * 1000  # the slack of the deadlines of the orders in a fixture schedule
+
+
+class MicroBenchmarkFixtures(object):
+    # Builds orders and vehicles at the system time of 1 h, from a seeded random generator.
+    def __init__(self, _router_func: Router, _seed: int = 0):
+        self.router_func = _router_func
+        self.rng = np.random.default_rng(_seed)
+        self.orders = OrderStore(_router_func.node_poses)
+        self.system_time_ms = 3600 * 1000
+        self.num_of_vehicles = 0
+        self.all_node_ids = np.arange(1, len(_router_func.node_ids) + 1)
+
+    def get_random_node_id(self, near_node_id: int = None) -> int:
+        # A random node, or a random node that can be reached from near_node_id within half the max pickup wait time,
+        # which is where the pickups of the orders considered for a vehicle are.
+        if near_node_id is None:
+            return int(self.rng.choice(self.all_node_ids))
+        durations_ms = self.router_func.get_durations_ms(near_node_id, self.all_node_ids)
+        near_node_ids = self.all_node_ids[durations_ms <= self.router_func.reachability_radius_ms / 2]
+        return int(self.rng.choice(near_node_ids))
+
+    def add_order(self, origin_node_id: int, destination_node_id: int, request_time_ms: int) -> int:
+        # The deadlines as in Platform.generator_orders().
+        max_pickup_wait_time_ms = MAX_PICKUP_WAIT_TIME_MIN * 60 * 1000
+        shortest_travel_time_ms = self.router_func.get_duration_ms(origin_node_id, destination_node_id)
+        max_pickup_time_ms = \
+            request_time_ms + min(max_pickup_wait_time_ms, shortest_travel_time_ms * (2 - MAX_ONBOARD_DETOUR))
+        max_dropoff_time_ms = \
+            request_time_ms + shortest_travel_time_ms \
+            + min(max_pickup_wait_time_ms * 2, max_pickup_time_ms - request_time_ms
+                  + shortest_travel_time_ms * (MAX_ONBOARD_DETOUR - 1))
+        return self.orders.add_order(origin_node_id, destination_node_id, request_time_ms, shortest_travel_time_ms,
+                                     max_pickup_time_ms, max_dropoff_time_ms)
+
+    def add_new_order(self, near_node_id: int) -> int:
+        # A pending order requested 30 s ago, whose pickup is near the given node.
+        origin_node_id = self.get_random_node_id(near_node_id)
+        destination_node_id = self.get_random_node_id()
+        while destination_node_id == origin_node_id:
+            destination_node_id = self.get_random_node_id()
+        return self.add_order(origin_node_id, destination_node_id, self.system_time_ms - 30 * 1000)
+
+    def build_vehicle(self, capacity: int, schedule_length: int) -> Vehicle:
+        # A vehicle at a node with a feasible schedule of schedule_length waypoints: the dropoffs of its onboard orders
+        # (it is half full), then the picking orders in groups of half its capacity, each group picked up before any of
+        # them is dropped off. So a new order can be inserted anywhere in the schedule, as far as the capacity goes.
+        # The deadlines of the orders leave some slack to the schedule.
+        vehicle = Vehicle(FleetState(1), 0)
+        vehicle.id = self.num_of_vehicles
+        self.num_of_vehicles += 1
+        vehicle.capacity = capacity
+        vehicle.pos = self.router_func.get_node_pos(self.get_random_node_id())
+        num_of_onboard_orders = min(max(capacity // 2, schedule_length % 2), schedule_length)
+        if (schedule_length - num_of_onboard_orders) % 2 == 1:
+            num_of_onboard_orders -= 1
+        num_of_picking_orders = (schedule_length - num_of_onboard_orders) // 2
+        group_size = (capacity + 1) // 2
+
+        # 1. The orders, around the vehicle (as the orders that a dispatcher assigns to it), requested 10 min before
+        #    their shortest travel time ends, so that all their delays are >= 0.
+        order_ids = []
+        for _ in range(num_of_onboard_orders + num_of_picking_orders):
+            origin_node_id = self.get_random_node_id(vehicle.pos.node_id)
+            destination_node_id = self.get_random_node_id(origin_node_id)
+            shortest_travel_time_ms = self.router_func.get_duration_ms(origin_node_id, destination_node_id)
+            request_time_ms = self.system_time_ms - 600 * 1000 - shortest_travel_time_ms
+            order_id = self.add_order(origin_node_id, destination_node_id, request_time_ms)
+            self.orders.set_order_status(order_id, OrderStatus.PICKING)
+            order_ids.append(order_id)
+        onboard_order_ids = order_ids[:num_of_onboard_orders]
+        picking_order_ids = order_ids[num_of_onboard_orders:]
+        for order_id in onboard_order_ids:
+            self.orders[order_id].pickup_time_ms = self.orders[order_id].request_time_ms + 120 * 1000
+            self.orders.set_order_status(order_id, OrderStatus.ONBOARD)
+        vehicle.load = num_of_onboard_orders
+        vehicle.onboard_order_ids = list(onboard_order_ids)
+
+        # 2. The schedule, and the deadlines of its orders.
+        waypoint_ops_and_order_ids = [(WaypointOp.DROPOFF, order_id) for order_id in onboard_order_ids]
+        for group_start_idx in range(0, num_of_picking_orders, group_size):
+            group_order_ids = picking_order_ids[group_start_idx:group_start_idx + group_size]
+            waypoint_ops_and_order_ids += [(WaypointOp.PICKUP, order_id) for order_id in group_order_ids]
+            waypoint_ops_and_order_ids += [(WaypointOp.DROPOFF, order_id) for order_id in group_order_ids]
+        pre_pos = vehicle.pos
+        arrival_time_ms = self.system_time_ms
+        for waypoint_op, order_id in waypoint_ops_and_order_ids:
+            order = self.orders[order_id]
+            pos = order.origin if waypoint_op == WaypointOp.PICKUP else order.destination
+            route = self.router_func.get_route(pre_pos, pos, RoutingType.TIME_ONLY)
+            vehicle.schedule.append(Waypoint(pos, waypoint_op, order_id, route))
+            arrival_time_ms += route.duration_ms
+            if waypoint_op == WaypointOp.PICKUP:
+                order.max_pickup_time_ms = arrival_time_ms + MICRO_BENCHMARK_SCHEDULE_SLACK_MS
+            else:
+                order.max_dropoff_time_ms = arrival_time_ms + MICRO_BENCHMARK_SCHEDULE_SLACK_MS
+            pre_pos = pos
+        vehicle.status = VehicleStatus.WORKING if schedule_length > 0 else VehicleStatus.IDLE
+        return vehicle
+
+    def build_vehicle_trip_pairs(self, num_of_vehicles: int, num_of_orders: int, num_of_pairs: int) \
+            -> tuple[list[SchedulingResult], list[int], list[Vehicle]]:
+        # The input of an ILP assignment: each vehicle has its empty trip, the other pairs are random trips of 1 or 2
+        # of the orders, with random scores.
+        vehicles = [self.build_vehicle(4, 0) for _ in range(num_of_vehicles)]
+        considered_order_ids = [self.add_new_order(vehicle.pos.node_id) for vehicle in vehicles[:num_of_orders]]
+        vehicle_trip_pairs = []
+        for pair_idx in range(max(num_of_pairs, num_of_vehicles)):
+            vt_pair = SchedulingResult()
+            vt_pair.success = True
+            if pair_idx < num_of_vehicles:
+                vt_pair.vehicle_id = vehicles[pair_idx].id
+            else:
+                vt_pair.vehicle_id = vehicles[int(self.rng.integers(num_of_vehicles))].id
+                trip_size = int(self.rng.integers(1, 3))
+                vt_pair.trip_ids = sorted(self.rng.choice(considered_order_ids, trip_size, replace=False).tolist())
+            vt_pair.score = float(self.rng.uniform(0, 1000))
+            vehicle_trip_pairs.append(vt_pair)
+        return vehicle_trip_pairs, considered_order_ids, vehicles
+
+
+class MicroBenchmarkCase(object):
+    # make_args(num_of_calls) returns the arguments of each of num_of_calls calls of func, e.g. fresh copies of the
+    # inputs that func changes, which are made before the calls are timed.
+    def __init__(self, _function_name: str, _params: dict, _func, _make_args):
+        self.function_name = _function_name
+        self.params = _params
+        self.func = _func
+        self.make_args = _make_args
+
+
+def build_micro_benchmark_cases(fixtures: MicroBenchmarkFixtures,
+                                uncached_router_func: Router,
+                                capacities: tuple = MICRO_BENCHMARK_CAPACITIES,
+                                schedule_lengths: tuple = MICRO_BENCHMARK_SCHEDULE_LENGTHS,
+                                ilp_sizes: tuple = MICRO_BENCHMARK_ILP_SIZES) -> list[MicroBenchmarkCase]:
+    router_func = fixtures.router_func
+    orders = fixtures.orders
+    system_time_ms = fixtures.system_time_ms
+    cases = []
+
+    # 1. Routing, between random nodes. The cached full routes are of a few pairs, which hit the route cache.
+    od_poses = [(router_func.get_node_pos(fixtures.get_random_node_id()),
+                 router_func.get_node_pos(fixtures.get_random_node_id())) for _ in range(1000)]
+    od_poses = [(origin, destination) for origin, destination in od_poses if origin is not destination]
+    cases.append(MicroBenchmarkCase("Router.get_route", {"routing_type": "TIME_ONLY"}, router_func.get_route,
+                                    lambda n: [od_poses[i % len(od_poses)] + (RoutingType.TIME_ONLY,)
+                                               for i in range(n)]))
+    cases.append(MicroBenchmarkCase("Router.get_route", {"routing_type": "FULL_ROUTE", "cache": "hit"},
+                                    router_func.get_route,
+                                    lambda n: [od_poses[i % 16] + (RoutingType.FULL_ROUTE,) for i in range(n)]))
+    cases.append(MicroBenchmarkCase("Router.get_route", {"routing_type": "FULL_ROUTE", "cache": "none"},
+                                    uncached_router_func.get_route,
+                                    lambda n: [od_poses[i % len(od_poses)] + (RoutingType.FULL_ROUTE,)
+                                               for i in range(n)]))
+
+    # 2. Moving along a full route, by a random part of it. (Each call advances its own copy of the route.)
+    full_routes = [router_func.get_route(origin, destination, RoutingType.FULL_ROUTE)
+                   for origin, destination in od_poses[:100]]
+    times_ms = [int(fixtures.rng.uniform(0, route.duration_ms)) for route in full_routes]
+    cases.append(MicroBenchmarkCase("truncate_route_by_time", {}, truncate_route_by_time,
+                                    lambda n: [(copy.deepcopy(full_routes[i % 100]), times_ms[i % 100])
+                                               for i in range(n)]))
+
+    # 3. Inserting a new order into a vehicle's schedule, and the trip search of OSP.
+    for schedule_length in schedule_lengths:
+        vehicle = fixtures.build_vehicle(max(capacities), schedule_length)
+        order = orders[fixtures.add_new_order(vehicle.pos.node_id)]
+        args = (order, vehicle, vehicle.schedule, schedule_length // 2, schedule_length, router_func)
+        cases.append(MicroBenchmarkCase("generator_schedule_from_sub_schedule", {"schedule_length": schedule_length},
+                                        generator_schedule_from_sub_schedule, lambda n, args=args: [args] * n))
+    for capacity in capacities:
+        for schedule_length in schedule_lengths:
+            params = {"capacity": capacity, "schedule_length": schedule_length}
+            vehicle = fixtures.build_vehicle(capacity, schedule_length)
+            # The order inserted is the first of a few new orders near the vehicle that can be inserted (about half
+            # of them can), and the schedule validated is its best one, which is checked to the end.
+            for _ in range(20):
+                order = orders[fixtures.add_new_order(vehicle.pos.node_id)]
+                scheduling_result = compute_schedule_of_inserting_order_to_vehicle(
+                    order, orders, vehicle, [vehicle.schedule], system_time_ms, router_func)
+                if scheduling_result.success:
+                    break
+            if scheduling_result.success:
+                new_schedule = scheduling_result.feasible_schedules[scheduling_result.best_schedule_idx]
+                pickup_idx, dropoff_idx = [idx for idx, waypoint in enumerate(new_schedule)
+                                           if waypoint.order_id == order.id]
+                dropoff_idx -= 1
+            else:
+                pickup_idx, dropoff_idx = schedule_length // 2, schedule_length
+                new_schedule = generator_schedule_from_sub_schedule(
+                    order, vehicle, vehicle.schedule, pickup_idx, dropoff_idx, router_func)
+            args = (new_schedule, pickup_idx, dropoff_idx, order, orders, vehicle, system_time_ms, router_func)
+            cases.append(MicroBenchmarkCase("validate_schedule", dict(params, feasible=scheduling_result.success),
+                                            validate_schedule,
+                                            lambda n, args=args: [args] * n))
+            args = (order, orders, vehicle, [vehicle.schedule], system_time_ms, router_func)
+            cases.append(MicroBenchmarkCase("compute_schedule_of_inserting_order_to_vehicle", params,
+                                            compute_schedule_of_inserting_order_to_vehicle,
+                                            lambda n, args=args: [args] * n))
+            # The size 2 trips of the vehicle, from its size 1 trips with the considered orders. (There is no size 2
+            # trip search with less than 2 size 1 trips, e.g. for a full vehicle.)
+            considered_order_ids = [fixtures.add_new_order(vehicle.pos.node_id)
+                                    for _ in range(MICRO_BENCHMARK_NUM_OF_CONSIDERED_ORDERS)]
+            feasible_trips_of_size_1 = compute_size_1_trips_for_one_vehicle(
+                considered_order_ids, orders, vehicle, [vehicle.schedule], system_time_ms, router_func)
+            if len(feasible_trips_of_size_1) >= 2:
+                args = (considered_order_ids, feasible_trips_of_size_1, orders, vehicle, system_time_ms, router_func,
+                        3600 * 1000)
+                cases.append(MicroBenchmarkCase("compute_size_k_trips_for_one_vehicle",
+                                                dict(params, num_of_size_1_trips=len(feasible_trips_of_size_1)),
+                                                compute_size_k_trips_for_one_vehicle,
+                                                lambda n, args=args: [args] * n))
+
+    # 4. Building the ILP model of an assignment.
+    for num_of_vehicles, num_of_orders, num_of_pairs in ilp_sizes:
+        vehicle_trip_pairs, considered_order_ids, vehicles = \
+            fixtures.build_vehicle_trip_pairs(num_of_vehicles, num_of_orders, num_of_pairs)
+        args = (vehicle_trip_pairs, considered_order_ids, orders, vehicles)
+        cases.append(MicroBenchmarkCase("build_ilp_model", {"num_of_vehicles": num_of_vehicles,
+                                                            "num_of_orders": num_of_orders,
+                                                            "num_of_pairs": num_of_pairs},
+                                        build_ilp_model, lambda n, args=args: [args] * n))
+    return cases
+
+
+def measure_micro_benchmark_case(case: MicroBenchmarkCase,
+                                 min_batch_duration_s: float = 0.02,
+                                 num_of_batches: int = 3,
+                                 num_of_traced_calls: int = 10) -> dict:
+    func = case.func
+    # 1. Warm up (e.g. the route cache), then find the number of calls of a batch that takes min_batch_duration_s.
+    for args in case.make_args(2):
+        func(*args)
+    num_of_calls = 1
+    while True:
+        calls_args = case.make_args(num_of_calls)
+        start_ns = time.perf_counter_ns()
+        for args in calls_args:
+            func(*args)
+        batch_duration_s = (time.perf_counter_ns() - start_ns) / 1e9
+        if batch_duration_s >= min_batch_duration_s:
+            break
+        num_of_calls *= max(2, min(10, int(min_batch_duration_s / max(batch_duration_s, 1e-6))))
+
+    # 2. Time the batches and keep the fastest (the least disturbed by the rest of the machine).
+    best_batch_duration_s = batch_duration_s
+    for _ in range(num_of_batches - 1):
+        calls_args = case.make_args(num_of_calls)
+        start_ns = time.perf_counter_ns()
+        for args in calls_args:
+            func(*args)
+        best_batch_duration_s = min(best_batch_duration_s, (time.perf_counter_ns() - start_ns) / 1e9)
+
+    # 3. Trace the allocations of a few calls.
+    calls_args = case.make_args(min(num_of_calls, num_of_traced_calls))
+    peak_allocated_bytes = 0
+    retained_bytes = 0
+    tracemalloc.start()
+    for args in calls_args:
+        tracemalloc.reset_peak()
+        traced_bytes_before_call, _ = tracemalloc.get_traced_memory()
+        result = func(*args)
+        _, traced_peak_bytes = tracemalloc.get_traced_memory()
+        del result
+        traced_bytes_after_call, _ = tracemalloc.get_traced_memory()
+        peak_allocated_bytes += traced_peak_bytes - traced_bytes_before_call
+        retained_bytes += traced_bytes_after_call - traced_bytes_before_call
+    tracemalloc.stop()
+
+    return {"function": case.function_name,
+            "params": case.params,
+            "calls_per_s": num_of_calls / best_batch_duration_s,
+            "us_per_call": best_batch_duration_s / num_of_calls * 1e6,
+            "peak_allocated_bytes_per_call": peak_allocated_bytes / len(calls_args),
+            "held_bytes_per_call": retained_bytes / len(calls_args)}
+
+
+def run_micro_benchmark(path_to_city: str,
+                        function_names: list[str] = None,
+                        capacities: tuple = MICRO_BENCHMARK_CAPACITIES,
+                        schedule_lengths: tuple = MICRO_BENCHMARK_SCHEDULE_LENGTHS) -> dict:
+    t = timer_start()
+    # (Otherwise gurobi logs the parameters of each model built.)
+    gp.setParam("LogToConsole", 0)
+    city_paths = load_or_build_synthetic_city(path_to_city)
+    router_args = (city_paths["network_nodes"], city_paths["vehicle_stations"], city_paths["shortest_path_table"],
+                   city_paths["mean_travel_time_table"], city_paths["travel_distance_table"], REACHABILITY_RADIUS_MS)
+    router_func = Router(*router_args)
+    uncached_router_func = Router(*router_args, _route_cache_capacity=0)
+    fixtures = MicroBenchmarkFixtures(router_func)
+    cases = build_micro_benchmark_cases(fixtures, uncached_router_func, capacities, schedule_lengths)
+    if function_names is not None:
+        cases = [case for case in cases if case.function_name in function_names]
+    case_results = []
+    for case in cases:
+        case_results.append(measure_micro_benchmark_case(case))
+        print_micro_benchmark_result(case_results[-1])
+    with open(f"{path_to_city}/city.json", "r") as f:
+        city = json.load(f)
+    print(f"[INFO] Ran the micro-benchmark of {len(cases)} cases. ({timer_end(t)})")
+    return {"format": BENCHMARK_FORMAT_NAME,
+            "version": BENCHMARK_FORMAT_VERSION,
+            "time_stamp": get_time_stamp_datetime().strftime('%Y-%m-%d %H:%M:%S'),
+            "python_version": sys.version.split()[0],
+            "numpy_version": np.__version__,
+            "city": city,
+            "cases": case_results}
+
+
+def print_micro_benchmark_result(case_result: dict):
+    params = ", ".join(f"{name}={value}" for name, value in case_result["params"].items())
+    print(f"  {case_result['function'] + '(' + params + ')':<96} {case_result['calls_per_s']:>12,.0f} calls/s "
+          f"{case_result['us_per_call']:>12,.1f} us/call {case_result['peak_allocated_bytes_per_call']:>12,.0f} B peak "
+          f"{case_result['held_bytes_per_call']:>10,.0f} B held")
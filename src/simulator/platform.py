@@ -1,68 +1,252 @@
 
+import multiprocessing
 from src.simulator.vehicle import *
 from src.simulator.demand_generator import *
+from src.simulator.timer_queue import *
+from src.simulator.checkpoint import *
+from src.simulator.slow_epoch_profiler import *
+from src.simulator.metrics import *
 from src.dispatcher.dispatcher_sba import *
 from src.dispatcher.dispatcher_osp import *
 from src.rebalancer.rebalancing_npo import *
 
 
 class Platform(object):
-    def __init__(self, _router_func: Router, _demand_generator_func: DemandGenerator):
+    def __init__(self, _router_func: Router, _demand_generator_func: DemandGenerator, _config: SimulationConfig = None):
+        self.config = _config if _config is not None else SimulationConfig()
         self.main_sim_start_time_stamp = get_time_stamp_datetime()
         self.main_sim_end_time_stamp = get_time_stamp_datetime()
         self.router_func = _router_func
         self.demand_generator = _demand_generator_func
-        self.orders = []
+        self.orders = OrderStore(self.router_func.node_poses)
+        # The pending orders walk away at their expiry times, min(request time + 150 s, max pickup time).
+        self.order_expiry_queue = TimerQueue()
 
         # Initialize the fleet.
+        self.fleet_state = FleetState(self.config.fleet_size)
         self.vehicles = []
         num_of_stations = self.router_func.get_num_of_vehicle_stations()
-        for i in range(FLEET_SIZE):
-            station_idx = int(i * num_of_stations / FLEET_SIZE)
-            vehicle = Vehicle()
+        for i in range(self.config.fleet_size):
+            station_idx = int(i * num_of_stations / self.config.fleet_size)
+            vehicle = Vehicle(self.fleet_state, i)
             vehicle.id = i
-            vehicle.capacity = VEH_CAPACITY
+            vehicle.capacity = self.config.veh_capacity
             vehicle.pos = self.router_func.get_node_pos(self.router_func.get_vehicle_station_id(station_idx))
             self.vehicles.append(vehicle)
+        self.vehicle_index = VehiclePositionIndex(self.fleet_state, self.router_func)
 
         # Initialize the simulation times.
         self.system_time_ms = 0
-        self.cycle_ms = CYCLE_S * 1000
-        self.main_sim_start_time_ms = WARMUP_DURATION_MIN * 60 * 1000
-        self.main_sim_end_time_ms = self.main_sim_start_time_ms + SIMULATION_DURATION_MIN * 60 * 1000
-        self.system_shutdown_time_ms = self.main_sim_end_time_ms + WINDDOWN_DURATION_MIN * 60 * 1000
+        self.cycle_ms = self.config.cycle_s * 1000
+        self.main_sim_start_time_ms = self.config.warmup_duration_min * 60 * 1000
+        self.main_sim_end_time_ms = self.main_sim_start_time_ms + self.config.simulation_duration_min * 60 * 1000
+        self.system_shutdown_time_ms = self.main_sim_end_time_ms + self.config.winddown_duration_min * 60 * 1000
+
+        # The KPIs are accumulated as the orders change status and the vehicles travel.
+        self.metrics = MetricsAccumulator(self.main_sim_start_time_ms, self.main_sim_end_time_ms, len(self.vehicles))
+        self.orders.metrics = self.metrics
+        self.fleet_state.metrics = self.metrics
 
         # Initialize the dispatcher and the rebalancer.
-        if DISPATCHER == "SBA":
+        if self.config.dispatcher == "SBA":
             self.dispatcher = DispatcherMethod.SBA
-        elif DISPATCHER == "OSP":
+        elif self.config.dispatcher == "OSP":
             self.dispatcher = DispatcherMethod.OSP
         else:
             assert (False and "[DEBUG] WRONG DISPATCHER SETTING! Please check the name of dispatcher in config!")
-        if REBALANCER == "NONE":
+        if self.config.rebalancer == "NONE":
             self.rebalancer = RebalancerMethod.NONE
-        elif REBALANCER == "NPO":
+        elif self.config.rebalancer == "NPO":
             self.rebalancer = RebalancerMethod.NPO
         else:
             assert (False and "[DEBUG] WRONG REBALANCER SETTING! Please check the name of rebalancer in config!")
 
+        # Optionally profile the epochs that are much slower than the recent ones.
+        self.slow_epoch_profiler = SlowEpochProfiler(PATH_TO_SLOW_EPOCH_PROFILES) if PROFILE_SLOW_EPOCHS else None
+
         print("[INFO] Platform is ready.")
 
     def run_simulation(self, simulation_start_time_stamp: datetime, total_init_time_s: float):
         self.create_report(simulation_start_time_stamp, total_init_time_s, 0.0)
-        if DEBUG_PRINT:
-            for epoch_start_time_ms in range(0, self.system_shutdown_time_ms, self.cycle_ms):
-                self.run_cycle(epoch_start_time_ms)
-        else:
-            for epoch_start_time_ms in tqdm(range(0, self.system_shutdown_time_ms, self.cycle_ms), desc=f"AMoD"):
-                self.run_cycle(epoch_start_time_ms)
-
+        if RECORD_EPOCH_TIMINGS:
+            epoch_instrumentation.open(PATH_TO_EPOCH_TIMINGS)
+        self.run_epochs()
+        epoch_instrumentation.close()
+        if SAVE_METRICS_TIME_SERIES:
+            self.metrics.save_time_series(PATH_TO_METRICS_TIME_SERIES)
         main_sim_runtime_s = (self.main_sim_end_time_stamp - self.main_sim_start_time_stamp).seconds
         self.create_report(simulation_start_time_stamp, total_init_time_s, main_sim_runtime_s)
 
+    def run_epochs(self, show_progress_bar: bool = True, save_checkpoints: bool = True):
+        # Run the epochs from T = 0, or from the system time of the loaded checkpoint, until the shutdown.
+        epoch_start_times_ms = range(self.system_time_ms, self.system_shutdown_time_ms, self.cycle_ms)
+        if show_progress_bar and not DEBUG_PRINT:
+            epoch_start_times_ms = tqdm(epoch_start_times_ms, desc=f"AMoD")
+        checkpoint_interval_ms = int(CHECKPOINT_INTERVAL_MIN * 60 * 1000)
+        for epoch_start_time_ms in epoch_start_times_ms:
+            self.run_cycle(epoch_start_time_ms)
+            if isinstance(epoch_start_times_ms, tqdm):
+                epoch_start_times_ms.set_postfix_str(self.metrics.get_live_summary(), refresh=False)
+            if save_checkpoints and \
+                    ((SAVE_CHECKPOINT_AFTER_WARMUP and self.system_time_ms == self.main_sim_start_time_ms)
+                     or (checkpoint_interval_ms > 0 and self.system_time_ms % checkpoint_interval_ms == 0)):
+                self.save_checkpoint(PATH_TO_CHECKPOINT)
+
+    def save_checkpoint(self, path_to_checkpoint: str):
+        # Save the state of the simulation between two epochs. The router, the vehicle index (which is rebuilt from
+        # the fleet state) and the dispatcher and rebalancer settings are not saved, so that the simulation can be
+        # resumed with other dispatch methods.
+        state = {"system_time_ms": self.system_time_ms,
+                 "cycle_ms": self.cycle_ms,
+                 "main_sim_start_time_stamp": self.main_sim_start_time_stamp,
+                 "main_sim_end_time_stamp": self.main_sim_end_time_stamp,
+                 "orders": self.orders,
+                 "order_expiry_queue": self.order_expiry_queue,
+                 "fleet_state": self.fleet_state,
+                 "vehicles": self.vehicles,
+                 "metrics": self.metrics,
+                 "demand_generator_cursor": self.demand_generator.get_cursor()}
+        write_checkpoint_file(state, path_to_checkpoint, self.router_func)
+
+    def load_checkpoint(self, path_to_checkpoint: str):
+        state = read_checkpoint_file(path_to_checkpoint, self.router_func)
+        assert (len(state["vehicles"]) == len(self.vehicles)
+                and "The checkpoint was saved with a different fleet size!")
+        assert (state["cycle_ms"] == self.cycle_ms and "The checkpoint was saved with a different cycle!")
+        assert (state["system_time_ms"] <= self.system_shutdown_time_ms)
+        self.system_time_ms = state["system_time_ms"]
+        self.main_sim_start_time_stamp = state["main_sim_start_time_stamp"]
+        self.main_sim_end_time_stamp = state["main_sim_end_time_stamp"]
+        self.orders = state["orders"]
+        self.order_expiry_queue = state["order_expiry_queue"]
+        self.fleet_state = state["fleet_state"]
+        self.vehicles = state["vehicles"]
+        self.metrics = state["metrics"]
+        assert (self.orders.metrics is self.metrics and self.fleet_state.metrics is self.metrics)
+        assert (self.metrics.main_sim_start_time_ms == self.main_sim_start_time_ms
+                and self.metrics.main_sim_end_time_ms == self.main_sim_end_time_ms
+                and "The checkpoint was saved with a different main study window!")
+        self.vehicle_index = VehiclePositionIndex(self.fleet_state, self.router_func)
+        self.demand_generator.set_cursor(state["demand_generator_cursor"])
+
+    def run_rollouts(self,
+                     rollout_dispatch_methods: list[tuple[DispatcherMethod, RebalancerMethod]],
+                     num_of_epochs: int,
+                     num_of_workers: int = None) -> list[dict]:
+        # Evaluate "what happens over the next num_of_epochs epochs" for each (dispatcher, rebalancer) option, starting
+        # from the current state. Each rollout runs in a process forked from this one, which shares the router's tables
+        # and the platform's state with it copy-on-write, so nothing is copied up front and this platform is unchanged.
+        # (The rollouts must start within the main study, see check_rollout_start_time().)
+        t = timer_start()
+        self.check_rollout_start_time()
+        num_of_workers = num_of_workers if num_of_workers is not None \
+            else min(len(rollout_dispatch_methods), os.cpu_count())
+        fork_context = multiprocessing.get_context("fork")
+        rollouts_metrics = []
+        for batch_start_idx in range(0, len(rollout_dispatch_methods), num_of_workers):
+            processes_and_connections = []
+            for dispatcher, rebalancer in rollout_dispatch_methods[batch_start_idx:batch_start_idx + num_of_workers]:
+                receiving_connection, sending_connection = fork_context.Pipe(duplex=False)
+                process = fork_context.Process(target=self.run_rollout_and_send_metrics,
+                                               args=(dispatcher, rebalancer, num_of_epochs, sending_connection))
+                process.start()
+                sending_connection.close()
+                processes_and_connections.append((process, receiving_connection, dispatcher, rebalancer))
+            for idx, (process, receiving_connection, dispatcher, rebalancer) in enumerate(processes_and_connections):
+                try:
+                    rollout_metrics = receiving_connection.recv()
+                except EOFError:
+                    rollout_metrics = None
+                process.join()
+                if rollout_metrics is None or process.exitcode != 0:
+                    # (The other rollouts of the batch are stopped, their results would be discarded anyway.)
+                    for other_process, _, _, _ in processes_and_connections[idx + 1:]:
+                        other_process.terminate()
+                        other_process.join()
+                    raise RuntimeError(f"The rollout of {dispatcher.name} + {rebalancer.name} from "
+                                       f"T = {round(self.system_time_ms / 1000)}s failed (exit code "
+                                       f"{process.exitcode}) without returning its metrics!")
+                rollouts_metrics.append(rollout_metrics)
+        print(f"[INFO] Ran {len(rollout_dispatch_methods)} rollouts of {num_of_epochs} epochs from "
+              f"T = {round(self.system_time_ms / 1000)}s in {num_of_workers} processes. ({timer_end(t)})")
+        return rollouts_metrics
+
+    def run_rollout_and_send_metrics(self,
+                                     dispatcher: DispatcherMethod,
+                                     rebalancer: RebalancerMethod,
+                                     num_of_epochs: int,
+                                     sending_connection):
+        # (The forked process does not record the epochs into the file of its parent.)
+        epoch_instrumentation.detach()
+        sending_connection.send(self.run_rollout(dispatcher, rebalancer, num_of_epochs))
+        sending_connection.close()
+
+    def check_rollout_start_time(self):
+        # The dispatch methods only apply (see run_cycle()) and the vehicles' travel is only recorded (see
+        # advance_vehicles()) during the main study, so a rollout from outside it would compare the default methods
+        # and no travel whatever the options are.
+        if not self.main_sim_start_time_ms < self.system_time_ms < self.main_sim_end_time_ms:
+            raise ValueError(f"A rollout can only start within the main study "
+                             f"(T = {round(self.main_sim_start_time_ms / 1000)}s, "
+                             f"{round(self.main_sim_end_time_ms / 1000)}s), "
+                             f"not at T = {round(self.system_time_ms / 1000)}s!")
+
+    def run_rollout(self, dispatcher: DispatcherMethod, rebalancer: RebalancerMethod, num_of_epochs: int) -> dict:
+        # Run the next num_of_epochs epochs (at most until the end of the main study) with the given dispatch methods,
+        # and return the summary metrics of them. This changes the platform, so it is normally run in a fork (see
+        # run_rollouts()).
+        self.check_rollout_start_time()
+        self.dispatcher = dispatcher
+        self.rebalancer = rebalancer
+        start_time_ms = self.system_time_ms
+        num_of_orders_at_start = len(self.orders)
+        active_order_ids_at_start = \
+            self.orders.get_order_ids_with_status(OrderStatus.PENDING, OrderStatus.PICKING, OrderStatus.ONBOARD)
+        statuses_at_start = [self.orders[order_id].status for order_id in active_order_ids_at_start]
+        dist_traveled_mm_at_start = float(self.fleet_state.dist_traveled_mm.sum())
+        empty_dist_traveled_mm_at_start = float(self.fleet_state.empty_dist_traveled_mm.sum())
+        end_time_ms = min(start_time_ms + num_of_epochs * self.cycle_ms, self.main_sim_end_time_ms)
+        for epoch_start_time_ms in range(start_time_ms, end_time_ms, self.cycle_ms):
+            self.run_cycle(epoch_start_time_ms)
+
+        # The orders that were active at the start or have been received since, and their statuses at the start.
+        order_ids = active_order_ids_at_start + list(range(num_of_orders_at_start, len(self.orders)))
+        statuses_at_start += [OrderStatus.PENDING] * (len(self.orders) - num_of_orders_at_start)
+        num_of_picked_up_orders = num_of_dropped_off_orders = num_of_walkaway_orders = 0
+        total_wait_time_ms = total_delay_time_ms = 0
+        for order_id, status_at_start in zip(order_ids, statuses_at_start):
+            order = self.orders[order_id]
+            if order.status == OrderStatus.WALKAWAY:
+                num_of_walkaway_orders += 1
+            if status_at_start in (OrderStatus.PENDING, OrderStatus.PICKING) \
+                    and order.status in (OrderStatus.ONBOARD, OrderStatus.COMPLETE):
+                num_of_picked_up_orders += 1
+                total_wait_time_ms += order.pickup_time_ms - order.request_time_ms
+            if order.status == OrderStatus.COMPLETE:
+                num_of_dropped_off_orders += 1
+                total_delay_time_ms += order.dropoff_time_ms - (order.request_time_ms + order.shortest_travel_time_ms)
+
+        dist_traveled_mm = float(self.fleet_state.dist_traveled_mm.sum()) - dist_traveled_mm_at_start
+        empty_dist_traveled_mm = float(self.fleet_state.empty_dist_traveled_mm.sum()) - empty_dist_traveled_mm_at_start
+        return {"dispatcher": dispatcher.name,
+                "rebalancer": rebalancer.name,
+                "start_time_ms": start_time_ms,
+                "end_time_ms": self.system_time_ms,
+                "num_of_received_orders": len(self.orders) - num_of_orders_at_start,
+                "num_of_picked_up_orders": num_of_picked_up_orders,
+                "num_of_dropped_off_orders": num_of_dropped_off_orders,
+                "num_of_walkaway_orders": num_of_walkaway_orders,
+                "avg_wait_s": total_wait_time_ms / 1000.0 / max(num_of_picked_up_orders, 1),
+                "avg_delay_s": total_delay_time_ms / 1000.0 / max(num_of_dropped_off_orders, 1),
+                "dist_traveled_km": dist_traveled_mm / 1000000.0,
+                "empty_dist_traveled_km": empty_dist_traveled_mm / 1000000.0}
+
     def run_cycle(self, epoch_start_time_ms: int):
         t = timer_start()
         assert (self.system_time_ms == epoch_start_time_ms)
+        epoch_instrumentation.start_epoch(epoch_start_time_ms)
+        if self.slow_epoch_profiler is not None:
+            self.slow_epoch_profiler.start_epoch()
         if self.system_time_ms == self.main_sim_start_time_ms:
             self.main_sim_start_time_stamp = get_time_stamp_datetime()
 
@@ -79,17 +263,30 @@ class Platform(object):
 
         # 1. Update the vehicles' positions and the orders' statuses. (system_time_ms_ is updated at this step.)
         #    Advance the vehicles by the whole cycle.
+        phase_start_ns = epoch_instrumentation.start_phase()
         self.advance_vehicles(self.cycle_ms)
+        epoch_instrumentation.end_phase("advance_vehicles", phase_start_ns)
         #    Reject the long waited orders.
-        for order in self.orders:
-            if not order.status == OrderStatus.PENDING:
-                continue
-            if order.request_time_ms + 150 * 1000 <= self.system_time_ms \
-                    or order.max_pickup_time_ms <= self.system_time_ms:
-                order.status = OrderStatus.WALKAWAY
+        #    (The expired orders that are no longer pending have been assigned, so they are skipped.)
+        phase_start_ns = epoch_instrumentation.start_phase()
+        for order_id in self.order_expiry_queue.pop_due_events(self.system_time_ms):
+            if self.orders[order_id].status == OrderStatus.PENDING:
+                self.orders.set_order_status(order_id, OrderStatus.WALKAWAY)
+        epoch_instrumentation.end_phase("walkaway", phase_start_ns)
 
         # 2. Generate orders.
+        phase_start_ns = epoch_instrumentation.start_phase()
         new_received_order_ids = self.generator_orders()
+        epoch_instrumentation.end_phase("generate_orders", phase_start_ns)
+        epoch_instrumentation.add_count("num_of_new_orders", len(new_received_order_ids))
+        if self.slow_epoch_profiler is not None:
+            dispatch_input_sizes = {
+                "num_of_new_orders": len(new_received_order_ids),
+                "num_of_pending_orders": self.orders.get_num_of_orders_with_status(OrderStatus.PENDING),
+                "num_of_picking_orders": self.orders.get_num_of_orders_with_status(OrderStatus.PICKING),
+                "num_of_onboard_orders": self.orders.get_num_of_orders_with_status(OrderStatus.ONBOARD),
+                "num_of_idle_vehicles": int(np.count_nonzero(self.fleet_state.statuses == VehicleStatus.IDLE.value)),
+                "num_of_vehicles": len(self.vehicles)}
 
         # 3. Assign pending orders to vehicles.
         for vehicle in self.vehicles:
@@ -97,34 +294,32 @@ class Platform(object):
         if self.main_sim_start_time_ms < self.system_time_ms <= self.main_sim_end_time_ms:
             if self.dispatcher == DispatcherMethod.SBA:
                 assign_orders_through_single_request_batch_assign(
-                    new_received_order_ids, self.orders, self.vehicles, self.system_time_ms, self.router_func)
+                    new_received_order_ids, self.orders, self.vehicles, self.vehicle_index, self.system_time_ms,
+                    self.router_func)
             elif self.dispatcher == DispatcherMethod.OSP:
                 assign_orders_through_optimal_schedule_pool_assign(
-                    new_received_order_ids, self.orders, self.vehicles, self.system_time_ms, self.router_func)
+                    new_received_order_ids, self.orders, self.vehicles, self.vehicle_index, self.system_time_ms,
+                    self.router_func)
         else:
             assign_orders_through_single_request_batch_assign(
-                new_received_order_ids, self.orders, self.vehicles, self.system_time_ms, self.router_func)
+                new_received_order_ids, self.orders, self.vehicles, self.vehicle_index, self.system_time_ms,
+                self.router_func)
 
         # 4. Reposition idle vehicles to high demand areas.
         if self.rebalancer == RebalancerMethod.NPO:
-            reposition_idle_vehicles_to_nearest_pending_orders(self.orders, self.vehicles, self.router_func)
+            phase_start_ns = epoch_instrumentation.start_phase()
+            reposition_idle_vehicles_to_nearest_pending_orders(self.orders, self.vehicles, self.vehicle_index,
+                                                               self.router_func)
+            epoch_instrumentation.end_phase("rebalance", phase_start_ns)
 
         # 5. Check the statuses of orders, to make sure that no one is assigned to multiple vehicles.
         if DEBUG_PRINT:
             num_of_total_orders = len(self.orders)
-            num_of_completed_orders = num_of_onboard_orders = num_of_picking_orders \
-                = num_of_pending_orders = num_of_walkaway_orders = 0
-            for order in self.orders:
-                if order.status == OrderStatus.COMPLETE:
-                    num_of_completed_orders += 1
-                elif order.status == OrderStatus.ONBOARD:
-                    num_of_onboard_orders += 1
-                elif order.status == OrderStatus.PICKING:
-                    num_of_picking_orders += 1
-                elif order.status == OrderStatus.PENDING:
-                    num_of_pending_orders += 1
-                elif order.status == OrderStatus.WALKAWAY:
-                    num_of_walkaway_orders += 1
+            num_of_completed_orders = self.orders.get_num_of_orders_with_status(OrderStatus.COMPLETE)
+            num_of_onboard_orders = self.orders.get_num_of_orders_with_status(OrderStatus.ONBOARD)
+            num_of_picking_orders = self.orders.get_num_of_orders_with_status(OrderStatus.PICKING)
+            num_of_pending_orders = self.orders.get_num_of_orders_with_status(OrderStatus.PENDING)
+            num_of_walkaway_orders = self.orders.get_num_of_orders_with_status(OrderStatus.WALKAWAY)
             assert (num_of_total_orders == num_of_completed_orders + num_of_onboard_orders + num_of_picking_orders
                    + num_of_pending_orders + num_of_walkaway_orders)
             num_of_onboard_orders_from_vehicle_schedule = num_of_picking_orders_from_vehicle_schedule = \
@@ -151,6 +346,11 @@ class Platform(object):
 
         if self.system_time_ms == self.main_sim_end_time_ms:
             self.main_sim_end_time_stamp = get_time_stamp_datetime()
+        self.metrics.add_epoch_to_time_series(epoch_start_time_ms, self.orders, self.fleet_state)
+        epoch_instrumentation.end_epoch()
+        if self.slow_epoch_profiler is not None:
+            self.slow_epoch_profiler.end_epoch(round(epoch_start_time_ms / self.cycle_ms), epoch_start_time_ms,
+                                               dispatch_input_sizes)
 
     def advance_vehicles(self, time_ms: int):
         t = timer_start()
@@ -160,16 +360,36 @@ class Platform(object):
         num_of_picked_orders = 0
         num_of_dropped_orders = 0
 
-        # Do it for each of the vehicles independently.
-        for vehicle in self.vehicles:
+        # The idle vehicles, and the other vehicles that do not reach their first waypoints within the time, are
+        # advanced in bulk. Each of the vehicles that reach a waypoint is advanced independently along its schedule,
+        # since it picks up or drops off orders on the way.
+        update_vehicle_statistics = self.main_sim_start_time_ms < self.system_time_ms <= self.main_sim_end_time_ms
+        vehicles_are_idle = self.fleet_state.statuses == VehicleStatus.IDLE.value
+        advance_idle_vehicles(self.fleet_state, np.flatnonzero(vehicles_are_idle), time_ms, update_vehicle_statistics)
+        vehicles_reaching_waypoints = []
+        vehicles_within_first_legs = []
+        for vehicle_id in np.flatnonzero(~vehicles_are_idle).tolist():
+            vehicle = self.vehicles[vehicle_id]
+            if time_ms > 0:
+                # The vehicle begins (or continues) the leg to its first waypoint, so the leg needs its full route.
+                build_full_route_of_leg(vehicle, 0, self.router_func)
+                if vehicle.schedule[0].route.duration_ms > time_ms:
+                    vehicles_within_first_legs.append(vehicle)
+                    continue
+            vehicles_reaching_waypoints.append(vehicle)
+        advance_vehicles_within_first_legs(vehicles_within_first_legs, time_ms, self.router_func,
+                                           update_vehicle_statistics)
+        for vehicle in vehicles_reaching_waypoints:
             new_picked_order_ids, new_dropped_order_ids = \
                 upd_vehicle_pos(vehicle,
                                 self.orders,
                                 self.system_time_ms,
                                 time_ms,
-                                self.main_sim_start_time_ms < self.system_time_ms <= self.main_sim_end_time_ms)
+                                self.router_func,
+                                update_vehicle_statistics)
             num_of_picked_orders += len(new_picked_order_ids)
             num_of_dropped_orders += len(new_dropped_order_ids)
+        self.vehicle_index.upd_vehicles()
 
         # Increment the system time.
         self.system_time_ms += time_ms
@@ -197,24 +417,20 @@ class Platform(object):
 
         new_received_order_ids = []
         for request in new_requests:
-            order = Order()
-            order.id = len(self.orders)
-            order.origin = self.router_func.get_node_pos(request.origin_node_id)
-            order.destination = self.router_func.get_node_pos(request.destination_node_id)
-            order.request_time_ms = request.request_time_ms
-            order.request_time_date = request.request_time_date
-            order.shortest_travel_time_ms = \
-                self.router_func.get_route(order.origin, order.destination, RoutingType.TIME_ONLY).duration_ms
-            order.max_pickup_time_ms = \
-                order.request_time_ms \
-                + min(max_pickup_wait_time_ms, order.shortest_travel_time_ms * (2 - MAX_ONBOARD_DETOUR))
-            order.max_dropoff_time_ms = \
-                order.request_time_ms + order.shortest_travel_time_ms \
-                + min(max_pickup_wait_time_ms * 2, order.max_pickup_time_ms - order.request_time_ms
-                      + order.shortest_travel_time_ms * (MAX_ONBOARD_DETOUR - 1))
-            new_received_order_ids.append(len(self.orders))
-            assert (order.status == OrderStatus.PENDING)
-            self.orders.append(order)
+            shortest_travel_time_ms = \
+                self.router_func.get_duration_ms(request.origin_node_id, request.destination_node_id)
+            max_pickup_time_ms = \
+                request.request_time_ms \
+                + min(max_pickup_wait_time_ms, shortest_travel_time_ms * (2 - MAX_ONBOARD_DETOUR))
+            max_dropoff_time_ms = \
+                request.request_time_ms + shortest_travel_time_ms \
+                + min(max_pickup_wait_time_ms * 2, max_pickup_time_ms - request.request_time_ms
+                      + shortest_travel_time_ms * (MAX_ONBOARD_DETOUR - 1))
+            order_id = self.orders.add_order(request.origin_node_id, request.destination_node_id,
+                                             request.request_time_ms, shortest_travel_time_ms, max_pickup_time_ms,
+                                             max_dropoff_time_ms)
+            new_received_order_ids.append(order_id)
+            self.order_expiry_queue.push(min(request.request_time_ms + 150 * 1000, max_pickup_time_ms), order_id)
 
         if DEBUG_PRINT:
             print(f"            +Orders new received: {len(new_requests)} ({timer_end(t)})")
@@ -243,12 +459,15 @@ class Platform(object):
         main_sim_runtime_formatted = str(timedelta(seconds=int(main_sim_runtime_s)))
 
         # Get some system configurations
-        sim_start_time_date = SIMULATION_START_TIME
-        sim_end_time_date = str(parse(SIMULATION_START_TIME) + timedelta(milliseconds=self.system_shutdown_time_ms))
-        main_sim_start_date = str(parse(SIMULATION_START_TIME) + timedelta(milliseconds=self.main_sim_start_time_ms))
-        main_sim_end_date = str(parse(SIMULATION_START_TIME) + timedelta(milliseconds=self.main_sim_end_time_ms))
+        config = self.config
+        sim_start_time_date = config.simulation_start_time
+        sim_end_time_date = \
+            str(parse(config.simulation_start_time) + timedelta(milliseconds=self.system_shutdown_time_ms))
+        main_sim_start_date = \
+            str(parse(config.simulation_start_time) + timedelta(milliseconds=self.main_sim_start_time_ms))
+        main_sim_end_date = str(parse(config.simulation_start_time) + timedelta(milliseconds=self.main_sim_end_time_ms))
         num_of_epochs = int(self.system_shutdown_time_ms / self.cycle_ms)
-        num_of_main_epochs = int(SIMULATION_DURATION_MIN * 60 / CYCLE_S)
+        num_of_main_epochs = int(config.simulation_duration_min * 60 / config.cycle_s)
 
         # Simulation Runtime.
         print("# Simulation Runtime")
@@ -256,56 +475,36 @@ class Platform(object):
               f"Time: {total_sim_runtime_formatted}.")
         print(f"  - Main Simulation: init_time = {total_init_time_s:.2f} s, runtime = {main_sim_runtime_formatted}, "
               f"avg_time = {main_sim_runtime_s / num_of_main_epochs:.2f} s.")
+        print(f"  - Route Cache: {self.router_func.route_cache.get_stats()}.")
 
         # Report the platform configurations.
         print("# System Configurations")
         print(f"  - From {sim_start_time_date[11:]} to {sim_end_time_date[11:]}. "
               f"(main simulation between {main_sim_start_date[11:]} and {main_sim_end_date[11:]}).")
-        print(f"  - Fleet Config: size = {FLEET_SIZE}, capacity = {VEH_CAPACITY}. "
-              f"({int(WARMUP_DURATION_MIN * 60 / CYCLE_S)} + {num_of_main_epochs} + "
-              f"{int(WINDDOWN_DURATION_MIN * 60 / CYCLE_S)} = {num_of_epochs} epochs).")
-        print(f"  - Order Config: density = {REQUEST_DENSITY} ({DATA_DATE}), "
-              f"max_wait = {MAX_PICKUP_WAIT_TIME_MIN * 60} s. (Δt = {CYCLE_S} s).")
-        print(f"  - Dispatch Config: dispatcher = {DISPATCHER}, rebalancer = {REBALANCER}.")
+        print(f"  - Fleet Config: size = {config.fleet_size}, capacity = {config.veh_capacity}. "
+              f"({int(config.warmup_duration_min * 60 / config.cycle_s)} + {num_of_main_epochs} + "
+              f"{int(config.winddown_duration_min * 60 / config.cycle_s)} = {num_of_epochs} epochs).")
+        print(f"  - Order Config: density = {config.request_density} ({config.data_date}, {config.demand_generator}), "
+              f"max_wait = {MAX_PICKUP_WAIT_TIME_MIN * 60} s. (Δt = {config.cycle_s} s).")
+        print(f"  - Dispatch Config: dispatcher = {config.dispatcher}, rebalancer = {config.rebalancer}.")
 
         if len(self.orders) == 0:
             print(dividing_line)
             return
 
         # Report order status.
-        order_count = 0
-        walkaway_order_count = 0
-        complete_order_count = 0
-        onboard_order_count = 0
-        picking_order_count = 0
-        pending_order_count = 0
-        total_wait_time_ms = 0
-        total_delay_time_ms = 0
-        total_order_time_ms = 0
-
-        for order in self.orders:
-            if order.request_time_ms <= self.main_sim_start_time_ms:
-                continue
-            if order.request_time_ms > self.main_sim_end_time_ms:
-                break
-            order_count += 1
-            if order.status == OrderStatus.WALKAWAY:
-                walkaway_order_count += 1
-            elif order.status == OrderStatus.COMPLETE:
-                complete_order_count += 1
-                total_wait_time_ms += order.pickup_time_ms - order.request_time_ms
-                total_delay_time_ms += order.dropoff_time_ms - (order.request_time_ms + order.shortest_travel_time_ms)
-                total_order_time_ms += order.shortest_travel_time_ms
-            elif order.status == OrderStatus.ONBOARD:
-                onboard_order_count += 1
-            elif order.status == OrderStatus.PICKING:
-                picking_order_count += 1
-            elif order.status == OrderStatus.PENDING:
-                pending_order_count += 1
-
-        service_order_count = complete_order_count + onboard_order_count
-        assert (service_order_count + picking_order_count + pending_order_count == order_count - walkaway_order_count)
-        print(f"# Orders ({order_count - walkaway_order_count}/{order_count})")
+        # (Before the main study, e.g. when the simulation is resumed from a warm-up checkpoint, there is none.)
+        metrics = self.compute_report_metrics()
+        order_count = metrics["num_of_orders"]
+        if order_count == 0:
+            print(dividing_line)
+            return
+        complete_order_count = metrics["num_of_complete_orders"]
+        onboard_order_count = metrics["num_of_onboard_orders"]
+        picking_order_count = metrics["num_of_picking_orders"]
+        pending_order_count = metrics["num_of_pending_orders"]
+        service_order_count = metrics["num_of_service_orders"]
+        print(f"# Orders ({order_count - metrics['num_of_walkaway_orders']}/{order_count})")
         print(f"  - complete = {complete_order_count} ({100.0 * complete_order_count / order_count:.2f}%), "
               f"onboard = {onboard_order_count} ({100.0 * onboard_order_count / order_count:.2f}%), "
               f"total_service = {service_order_count} ({100.0 * service_order_count / order_count:.2f}%).")
@@ -313,43 +512,27 @@ class Platform(object):
             print(f"  - picking = {picking_order_count} ({100.0 * picking_order_count / order_count:.2f}%), "
                   f"pending = {pending_order_count} ({100.0 * pending_order_count / order_count:.2f}%).")
         if complete_order_count > 0:
-            print(f"  - avg_shortest_travel = {total_order_time_ms / 1000.0 / complete_order_count:.2f} s, "
-                  f"avg_wait = {total_wait_time_ms / 1000.0 / complete_order_count:.2f} s, "
-                  f"avg_delay = {total_delay_time_ms / 1000.0 / complete_order_count:.2f} s.")
+            print(f"  - avg_shortest_travel = {metrics['avg_shortest_travel_s']:.2f} s, "
+                  f"avg_wait = {metrics['avg_wait_s']:.2f} s, "
+                  f"avg_delay = {metrics['avg_delay_s']:.2f} s.")
+            print(f"  - wait: p50 = {metrics['p50_wait_s']:.2f} s, p95 = {metrics['p95_wait_s']:.2f} s; "
+                  f"delay: p50 = {metrics['p50_delay_s']:.2f} s, p95 = {metrics['p95_delay_s']:.2f} s.")
         else:
             print("  [PLEASE USE LONGER SIMULATION DURATION TO BE ABLE TO COMPLETE ORDERS!]")
 
         # Report vehicle status.
-        total_dist_traveled_mm = 0
-        total_loaded_dist_traveled_mm = 0
-        total_empty_dist_traveled_mm = 0
-        total_rebl_dist_traveled_mm = 0
-        total_time_traveled_ms = 0
-        total_loaded_time_traveled_ms = 0
-        total_empty_time_traveled_ms = 0
-        total_rebl_time_traveled_ms = 0
-
-        for vehicle in self.vehicles:
-            total_dist_traveled_mm += vehicle.dist_traveled_mm
-            total_loaded_dist_traveled_mm += vehicle.loaded_dist_traveled_mm
-            total_empty_dist_traveled_mm += vehicle.empty_dist_traveled_mm
-            total_rebl_dist_traveled_mm += vehicle.rebl_dist_traveled_mm
-            total_time_traveled_ms += vehicle.time_traveled_ms
-            total_loaded_time_traveled_ms += vehicle.loaded_time_traveled_ms
-            total_empty_time_traveled_ms += vehicle.empty_time_traveled_ms
-            total_rebl_time_traveled_ms += vehicle.rebl_time_traveled_ms
-
-        avg_dist_traveled_km = total_dist_traveled_mm / 1000000.0 / len(self.vehicles)
-        avg_empty_dist_traveled_km = total_empty_dist_traveled_mm / 1000000.0 / len(self.vehicles)
-        avg_rebl_dist_traveled_km = total_rebl_dist_traveled_mm / 1000000.0 / len(self.vehicles)
-        avg_time_traveled_s = total_time_traveled_ms / 1000.0 / len(self.vehicles)
-        avg_empty_time_traveled_s = total_empty_time_traveled_ms / 1000.0 / len(self.vehicles)
-        avg_rebl_time_traveled_s = total_rebl_time_traveled_ms / 1000.0 / len(self.vehicles)
+        avg_dist_traveled_km = metrics["avg_dist_traveled_km"]
+        avg_empty_dist_traveled_km = metrics["avg_empty_dist_traveled_km"]
+        avg_rebl_dist_traveled_km = metrics["avg_rebl_dist_traveled_km"]
+        avg_time_traveled_s = metrics["avg_time_traveled_s"]
+        avg_empty_time_traveled_s = metrics["avg_empty_time_traveled_s"]
+        avg_rebl_time_traveled_s = metrics["avg_rebl_time_traveled_s"]
         print(f"# Vehicles ({len(self.vehicles)})")
-        print(f"  - Travel Distance: total_dist = {total_dist_traveled_mm / 1000000.0:.2f} km, "
+        print(f"  - Travel Distance: total_dist = {metrics['total_dist_traveled_km']:.2f} km, "
               f"avg_dist = {avg_dist_traveled_km:.2f} km.")
         print(f"  - Travel Duration: avg_time = {avg_time_traveled_s:.2f} s "
-              f"({100.0 * avg_time_traveled_s / 60 / SIMULATION_DURATION_MIN:.2f}% of the main simulation time).")
+              f"({100.0 * avg_time_traveled_s / 60 / config.simulation_duration_min:.2f}% of the main simulation "
+              f"time).")
         print(f"  - Empty Travel: avg_time = {avg_empty_time_traveled_s:.2f} s "
               f"({100.0 * avg_empty_time_traveled_s / avg_time_traveled_s:.2f}%), "
               f"avg_dist = {avg_empty_dist_traveled_km:.2f} km "
@@ -358,8 +541,12 @@ class Platform(object):
               f"({100.0 * avg_rebl_time_traveled_s / avg_time_traveled_s:.2f}%), "
               f"avg_dist = {avg_rebl_dist_traveled_km:.2f} km "
               f"({100.0 * avg_rebl_dist_traveled_km / avg_dist_traveled_km:.2f}%).")
-        print(f"  - Travel Load: average_load_dist = {total_loaded_dist_traveled_mm / total_dist_traveled_mm:.2f}, "
-              f"average_load_time = {total_loaded_time_traveled_ms / total_time_traveled_ms:.2f}.")
+        print(f"  - Travel Load: average_load_dist = {metrics['average_load_dist']:.2f}, "
+              f"average_load_time = {metrics['average_load_time']:.2f}.")
 
         print(dividing_line)
 
+    def compute_report_metrics(self) -> dict:
+        # The metrics of the orders received during the main study and of the vehicles' travel, as printed in the
+        # report. They are accumulated during the run (see metrics.py).
+        return self.metrics.compute_report_metrics()
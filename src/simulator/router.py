@@ -1,5 +1,41 @@
 
+import numpy as np
 from src.utility.utility_functions import *
+from collections import OrderedDict
+from src.utility.binary_tables import *
+
+
+class RouteCache(object):
+    # A bounded LRU cache of compact full routes, keyed by (origin node id, destination node id).
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.routes = OrderedDict()
+        self.num_of_hits = 0
+        self.num_of_misses = 0
+        self.num_of_evictions = 0
+
+    def get(self, onid: int, dnid: int):
+        compact_route = self.routes.get((onid, dnid))
+        if compact_route is None:
+            self.num_of_misses += 1
+            return None
+        self.routes.move_to_end((onid, dnid))
+        self.num_of_hits += 1
+        return compact_route
+
+    def put(self, onid: int, dnid: int, compact_route: CompactRoute):
+        if self.capacity <= 0:
+            return
+        self.routes[(onid, dnid)] = compact_route
+        if len(self.routes) > self.capacity:
+            self.routes.popitem(last=False)
+            self.num_of_evictions += 1
+
+    def get_stats(self) -> str:
+        num_of_queries = self.num_of_hits + self.num_of_misses
+        hit_rate = 100.0 * self.num_of_hits / num_of_queries if num_of_queries > 0 else 0.0
+        return f"size = {len(self.routes)}/{self.capacity}, hits = {self.num_of_hits} ({hit_rate:.2f}%), " \
+               f"misses = {self.num_of_misses}, evictions = {self.num_of_evictions}"
 
 
 class Router(object):
@@ -7,18 +43,61 @@ class Router(object):
                  _path_to_vehicle_stations: str,
                  _path_to_shortest_path_table: str,
                  _path_to_mean_travel_time_table: str,
-                 _path_to_travel_distance_table: str):
+                 _path_to_travel_distance_table: str,
+                 _reachability_radius_ms: int,
+                 _route_cache_capacity: int = ROUTE_CACHE_CAPACITY,
+                 _use_compact_travel_tables: bool = USE_COMPACT_TRAVEL_TABLES):
         t = timer_start()
         with open(_path_to_network_nodes, "rb") as f:
-            self.network_nodes = pickle.load(f)
+            network_nodes = pickle.load(f)
+        # The network nodes are held as contiguous arrays. Each node has one shared (immutable) Pos, which is handed
+        # out by get_node_pos without copying.
+        self.node_ids = np.array([node.node_id for node in network_nodes], dtype=np.int32)
+        self.node_lons = np.array([node.lon for node in network_nodes], dtype=np.float64)
+        self.node_lats = np.array([node.lat for node in network_nodes], dtype=np.float64)
+        assert (np.array_equal(self.node_ids, np.arange(1, len(network_nodes) + 1)))
+        self.node_poses = [Pos(int(node_id), float(lon), float(lat))
+                           for node_id, lon, lat in zip(self.node_ids, self.node_lons, self.node_lats)]
         with open(_path_to_vehicle_stations, "rb") as f:
             self.vehicle_stations = pickle.load(f)
-        with open(_path_to_shortest_path_table, "rb") as f:
-            self.shortest_path_table = pickle.load(f)
-        with open(_path_to_mean_travel_time_table, "rb") as f:
-            self.mean_travel_time_table = pickle.load(f)
-        with open(_path_to_travel_distance_table, "rb") as f:
-            self.travel_distance_table = pickle.load(f)
+        # The travel tables are memory-mapped if their binary files exist, otherwise they are unpickled.
+        self.shortest_path_table, _ = load_table(_path_to_shortest_path_table, "node_id")
+        self.mean_travel_time_table, time_unit = load_table(_path_to_mean_travel_time_table, "s")
+        self.travel_distance_table, distance_unit = load_table(_path_to_travel_distance_table, "m")
+        # Optionally quantize the travel tables (in seconds and meters) to compact integer tables (in ms and mm).
+        if _use_compact_travel_tables and time_unit == "s" and distance_unit == "m":
+            self.mean_travel_time_table, self.travel_distance_table, self.shortest_path_table, report = \
+                compact_travel_tables(self.mean_travel_time_table, self.travel_distance_table,
+                                      self.shortest_path_table)
+            print_compact_travel_tables_report(report)
+            assert (report["within_tolerance"] and "Compact travel tables are not accurate enough!")
+            time_unit, distance_unit = "ms", "mm"
+        assert (time_unit in ("s", "ms") and distance_unit in ("m", "mm"))
+        self.time_table_scale_to_ms = 1000 if time_unit == "s" else 1
+        self.distance_table_scale_to_mm = 1000 if distance_unit == "m" else 1
+        # If the tables have been renumbered along a space-filling curve (see node_reordering.py), external node ids
+        # are translated to internal table rows. Otherwise, the row of a node is simply node_id - 1.
+        # (The path table and the reachability indices store internal node ids, i.e. row + 1.)
+        node_order = load_table_node_order(_path_to_mean_travel_time_table)
+        for path_to_table in (_path_to_shortest_path_table, _path_to_travel_distance_table):
+            assert (np.array_equal(load_table_node_order(path_to_table), node_order)
+                    and "The travel tables are not in the same node order!")
+        if node_order is None:
+            node_order = np.arange(1, len(self.node_ids) + 1)
+        self.node_of_row = np.asarray(node_order, dtype=np.int64)
+        self.row_of_node = np.full(len(self.node_ids) + 1, -1, dtype=np.int64)
+        self.row_of_node[self.node_of_row] = np.arange(len(self.node_of_row))
+        self.row_of_node_list = self.row_of_node.tolist()
+        self.route_cache = RouteCache(_route_cache_capacity)
+        # The reachability indices list, for each node, the nodes that can reach it (to) or that it can reach (from)
+        # within the given radius, e.g. the max pickup wait time.
+        self.reachability_radius_ms = _reachability_radius_ms
+        self.reachability_index_to = \
+            load_or_build_reachability_index(_path_to_mean_travel_time_table, self.mean_travel_time_table,
+                                             self.time_table_scale_to_ms, self.reachability_radius_ms, "to")
+        self.reachability_index_from = \
+            load_or_build_reachability_index(_path_to_mean_travel_time_table, self.mean_travel_time_table,
+                                             self.time_table_scale_to_ms, self.reachability_radius_ms, "from")
         print(f"[INFO] Router is ready. ({timer_end(t)})")
 
     def get_route(self, origin: Pos, destination: Pos, routing_type: RoutingType) -> Route:
@@ -28,49 +107,111 @@ class Router(object):
         dnid = destination.node_id
 
         if routing_type == RoutingType.TIME_ONLY:
-            route.distance_mm = self.travel_distance_table[onid - 1][dnid - 1] * 1000
-            route.duration_ms = self.mean_travel_time_table[onid - 1][dnid - 1] * 1000
+            route.distance_mm = self.get_distance_mm(onid, dnid)
+            route.duration_ms = self.get_duration_ms(onid, dnid)
 
         if routing_type == RoutingType.FULL_ROUTE:
-            # 1. Build the simple node path from the shortest path table.
-            path = [dnid]
-            pre_node_id = self.shortest_path_table[onid - 1][dnid - 1]
-            while pre_node_id > 0:
-                path.append(pre_node_id)
-                pre_node_id = self.shortest_path_table[onid - 1, pre_node_id - 1]
-            path.reverse()
-
-            # 2. Build the detailed route from the path.
-            for i in range(len(path) - 1):
-                step = Step()
-                u = path[i]
-                v = path[i + 1]
-                step.distance_mm = self.travel_distance_table[u - 1][v - 1] * 1000
-                step.duration_ms = self.mean_travel_time_table[u - 1][v - 1] * 1000
-                step.poses.append(self.get_node_pos(u))
-                step.poses.append(self.get_node_pos(v))
-                route.distance_mm += step.distance_mm
-                route.duration_ms += step.duration_ms
-                route.steps.append(step)
-
-            # 3. The last step of a route is always consisting of 2 identical points as a flag of the end of the leg.
-            flag_step = Step()
-            flag_step.distance_mm = 0
-            flag_step.duration_ms = 0
-            flag_step.poses.append(self.get_node_pos(dnid))
-            flag_step.poses.append(self.get_node_pos(dnid))
-            route.steps.append(flag_step)
-
-            # Check the accuracy of routing.
-            deviation_due_to_data_structure = 5
-            assert (abs(route.duration_ms - self.mean_travel_time_table[onid - 1][dnid - 1] * 1000)
-                    <= deviation_due_to_data_structure)
-            assert (abs(route.distance_mm - self.travel_distance_table[onid - 1][dnid - 1] * 1000)
-                    <= deviation_due_to_data_structure)
+            # The detailed route is a cursor on the (cached) compact route, its steps are only built on request.
+            # (The last step of a route is always consisting of 2 identical points as a flag of the end of the leg.)
+            route.compact_route = self.get_compact_route(onid, dnid)
+            route.node_poses = self.node_poses
+            route.distance_mm = float(route.compact_route.cumulative_distance_mm[-1])
+            route.duration_ms = float(route.compact_route.cumulative_duration_ms[-1])
 
         assert (route.duration_ms >= 0)
         return route
 
+    def get_compact_route(self, onid: int, dnid: int) -> CompactRoute:
+        compact_route = self.route_cache.get(onid, dnid)
+        if compact_route is not None:
+            return compact_route
+
+        # 1. Build the simple node path (in table rows) from the shortest path table.
+        origin_row = self.row_of_node_list[onid]
+        path = [self.row_of_node_list[dnid]]
+        pre_row = int(self.shortest_path_table[origin_row, path[0]]) - 1
+        while pre_row >= 0:
+            path.append(pre_row)
+            pre_row = int(self.shortest_path_table[origin_row, pre_row]) - 1
+        path.reverse()
+
+        # 2. Gather the duration and distance of each step of the path.
+        rows = np.array(path, dtype=np.int64)
+        node_ids = self.node_of_row[rows].astype(np.int32)
+        step_durations_ms = self.mean_travel_time_table[rows[:-1], rows[1:]] * self.time_table_scale_to_ms
+        step_distances_mm = self.travel_distance_table[rows[:-1], rows[1:]] * self.distance_table_scale_to_mm
+        cumulative_duration_ms = np.concatenate(([0.0], np.cumsum(step_durations_ms, dtype=np.float64)))
+        cumulative_distance_mm = np.concatenate(([0.0], np.cumsum(step_distances_mm, dtype=np.float64)))
+
+        # Check the accuracy of routing. (With compact tables, the rounding errors of the steps add up, see
+        # get_max_route_deviation(). compact_travel_tables() has checked that all routes are within it.)
+        assert (abs(cumulative_duration_ms[-1] - self.get_duration_ms(onid, dnid))
+                <= get_max_route_deviation(len(path) - 1, compact=self.time_table_scale_to_ms == 1))
+        assert (abs(cumulative_distance_mm[-1] - self.get_distance_mm(onid, dnid))
+                <= get_max_route_deviation(len(path) - 1, compact=self.distance_table_scale_to_mm == 1))
+
+        # 3. Spread the (tiny) difference between the sum of the steps and the rounded origin-destination entry over
+        #    the steps, so that a leg has the same duration (distance) as a TIME_ONLY route and as a FULL_ROUTE route,
+        #    i.e. whether or not its full route has been built.
+        for cumulative_array, total in ((cumulative_duration_ms, self.get_duration_ms(onid, dnid)),
+                                        (cumulative_distance_mm, self.get_distance_mm(onid, dnid))):
+            if cumulative_array[-1] > 0:
+                cumulative_array *= total / cumulative_array[-1]
+                np.minimum(cumulative_array, total, out=cumulative_array)
+                cumulative_array[-1] = total
+
+        # The compact route is shared by all vehicles, so it is made read-only.
+        for array in (node_ids, cumulative_duration_ms, cumulative_distance_mm):
+            array.flags.writeable = False
+        compact_route = CompactRoute(node_ids, cumulative_duration_ms, cumulative_distance_mm)
+        self.route_cache.put(onid, dnid, compact_route)
+        return compact_route
+
+    def get_duration_ms(self, onid: int, dnid: int) -> int:
+        # Scalar fast path of TIME_ONLY routing, which does not build a Route.
+        rows = self.row_of_node_list
+        return int(round(self.mean_travel_time_table[rows[onid], rows[dnid]] * self.time_table_scale_to_ms))
+
+    def get_distance_mm(self, onid: int, dnid: int) -> int:
+        rows = self.row_of_node_list
+        return int(round(self.travel_distance_table[rows[onid], rows[dnid]] * self.distance_table_scale_to_mm))
+
+    def get_durations_ms(self, onids: np.ndarray, dnids: np.ndarray) -> np.ndarray:
+        # Batch TIME_ONLY routing. onids and dnids are broadcast against each other, e.g. onids[:, None] and
+        # dnids[None, :] give the duration matrix between two node lists.
+        origin_rows = self.row_of_node[onids]
+        destination_rows = self.row_of_node[dnids]
+        durations_ms = self.mean_travel_time_table[origin_rows, destination_rows] * self.time_table_scale_to_ms
+        return np.rint(durations_ms).astype(np.int64)
+
+    def get_durations_and_distances(self, onids: np.ndarray, dnids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        origin_rows = self.row_of_node[onids]
+        destination_rows = self.row_of_node[dnids]
+        durations_ms = self.mean_travel_time_table[origin_rows, destination_rows] * self.time_table_scale_to_ms
+        distances_mm = self.travel_distance_table[origin_rows, destination_rows] * self.distance_table_scale_to_mm
+        return np.rint(durations_ms).astype(np.int64), np.rint(distances_mm).astype(np.int64)
+
+    def get_nodes_within_duration_to(self, dnid: int, max_duration_ms: int) -> tuple[np.ndarray, np.ndarray]:
+        # Return the nodes that can reach node dnid within max_duration_ms, and their durations, sorted by duration.
+        return self._query_reachability_index(self.reachability_index_to, dnid, max_duration_ms)
+
+    def get_nodes_within_duration_from(self, onid: int, max_duration_ms: int) -> tuple[np.ndarray, np.ndarray]:
+        # Return the nodes that node onid can reach within max_duration_ms, and their durations, sorted by duration.
+        return self._query_reachability_index(self.reachability_index_from, onid, max_duration_ms)
+
+    def _query_reachability_index(self, reachability_index: tuple[np.ndarray, np.ndarray, np.ndarray],
+                                  node_id: int, max_duration_ms: int) -> tuple[np.ndarray, np.ndarray]:
+        assert (max_duration_ms <= self.reachability_radius_ms)
+        indptr, internal_node_ids, durations_ms = reachability_index
+        row = self.row_of_node_list[node_id]
+        start = indptr[row]
+        end = indptr[row + 1]
+        end = start + np.searchsorted(durations_ms[start:end], max_duration_ms, side="right")
+        return self.node_of_row[internal_node_ids[start:end] - 1], durations_ms[start:end]
+
+    def get_num_of_nodes(self) -> int:
+        return len(self.node_ids)
+
     def get_vehicle_station_id(self, station_index: int) -> int:
         return self.vehicle_stations[station_index].node_id
 
@@ -78,4 +219,4 @@ class Router(object):
         return len(self.vehicle_stations)
 
     def get_node_pos(self, node_id: int) -> Pos:
-        return copy.deepcopy(self.network_nodes[node_id - 1])
+        return self.node_poses[node_id - 1]
@@ -0,0 +1,114 @@
+import sys
+import json
+import queue
+import statistics
+import threading
+from collections import Counter, deque
+from src.utility.utility_functions import *
+
+##################################################################################
+# Slow Epoch Profiler
+##################################################################################
+# A few epochs take many times longer than the others (e.g. when the trip enumeration of OSP explodes for some
+# vehicles). The profiler keeps the runtimes of the recent epochs as a baseline, and a sampler thread that sleeps
+# until the running epoch exceeds SLOW_EPOCH_FACTOR times the median of the baseline. From then on until the end of the
+# epoch, the thread samples the stack of the simulation thread, and the slow epoch's samples are dumped (as collapsed
+# stacks, which flame graph tools read) together with the epoch's dispatch input sizes. So the normal epochs cost only
+# the hand-over of the epoch to the sleeping thread.
+
+
+class EpochSampling(object):
+    def __init__(self, thread_id: int, threshold_s: float):
+        self.thread_id = thread_id
+        self.threshold_s = threshold_s
+        self.ended = threading.Event()
+        self.done = threading.Event()
+        self.stack_counts = Counter()
+
+
+class SlowEpochProfiler(object):
+    def __init__(self,
+                 _output_dir: str,
+                 _slowdown_factor: float = SLOW_EPOCH_FACTOR,
+                 _num_of_baseline_epochs: int = 20,
+                 _min_num_of_baseline_epochs: int = 5,
+                 _sampling_interval_ms: float = 5):
+        self.output_dir = _output_dir
+        self.slowdown_factor = _slowdown_factor
+        self.recent_epoch_runtimes_ms = deque(maxlen=_num_of_baseline_epochs)
+        self.min_num_of_baseline_epochs = _min_num_of_baseline_epochs
+        self.sampling_interval_s = _sampling_interval_ms / 1000
+        self.sampling_queue = queue.Queue()
+        self.sampler_thread = None
+        self.epoch_sampling = None
+        self.epoch_start_time = 0.0
+        self.threshold_ms = None
+        self.num_of_dumped_profiles = 0
+
+    def start_epoch(self):
+        # The sampler thread is (re)started here, as threads do not survive a fork of the process (see run_rollouts()).
+        if self.sampler_thread is None or not self.sampler_thread.is_alive():
+            self.sampling_queue = queue.Queue()
+            self.sampler_thread = threading.Thread(target=self.run_sampler, daemon=True)
+            self.sampler_thread.start()
+        self.threshold_ms = None
+        if len(self.recent_epoch_runtimes_ms) >= self.min_num_of_baseline_epochs:
+            self.threshold_ms = statistics.median(self.recent_epoch_runtimes_ms) * self.slowdown_factor
+            self.epoch_sampling = EpochSampling(threading.get_ident(), self.threshold_ms / 1000)
+            self.sampling_queue.put(self.epoch_sampling)
+        self.epoch_start_time = time.perf_counter()
+
+    def end_epoch(self, epoch_idx: int, epoch_start_time_ms: int, dispatch_input_sizes: dict):
+        runtime_ms = (time.perf_counter() - self.epoch_start_time) * 1000
+        if self.threshold_ms is not None:
+            self.epoch_sampling.ended.set()
+            self.epoch_sampling.done.wait()
+            if runtime_ms > self.threshold_ms:
+                self.dump_profile(epoch_idx, epoch_start_time_ms, runtime_ms, dispatch_input_sizes)
+            self.epoch_sampling = None
+        self.recent_epoch_runtimes_ms.append(runtime_ms)
+
+    def run_sampler(self):
+        while True:
+            epoch_sampling = self.sampling_queue.get()
+            # Sleep until the epoch ends or becomes slow, then sample its stack until it ends.
+            if not epoch_sampling.ended.wait(epoch_sampling.threshold_s):
+                while not epoch_sampling.ended.is_set():
+                    frame = sys._current_frames().get(epoch_sampling.thread_id)
+                    if frame is not None:
+                        epoch_sampling.stack_counts[collapse_stack(frame)] += 1
+                    del frame
+                    epoch_sampling.ended.wait(self.sampling_interval_s)
+            epoch_sampling.done.set()
+
+    def dump_profile(self, epoch_idx: int, epoch_start_time_ms: int, runtime_ms: float, dispatch_input_sizes: dict):
+        os.makedirs(self.output_dir, exist_ok=True)
+        path_to_profile = os.path.join(self.output_dir, f"slow-epoch-{epoch_idx}")
+        with open(f"{path_to_profile}.folded", "w") as f:
+            for stack, count in self.epoch_sampling.stack_counts.most_common():
+                f.write(f"{stack} {count}\n")
+        summary = {"epoch_idx": epoch_idx,
+                   "epoch_start_time_ms": epoch_start_time_ms,
+                   "runtime_ms": runtime_ms,
+                   "baseline_median_ms": self.threshold_ms / self.slowdown_factor,
+                   "threshold_ms": self.threshold_ms,
+                   "num_of_samples": sum(self.epoch_sampling.stack_counts.values()),
+                   "sampling_interval_ms": self.sampling_interval_s * 1000,
+                   "dispatch_input_sizes": dispatch_input_sizes,
+                   "top_stacks": [{"stack": stack, "count": count}
+                                  for stack, count in self.epoch_sampling.stack_counts.most_common(10)]}
+        with open(f"{path_to_profile}.json", "w") as f:
+            json.dump(summary, f, indent=2)
+        self.num_of_dumped_profiles += 1
+        print(f"[INFO] Epoch {epoch_idx} took {runtime_ms:.0f} ms (> {self.threshold_ms:.0f} ms), "
+              f"its profile is saved to \"{path_to_profile}.folded\".")
+
+
+def collapse_stack(frame) -> str:
+    # e.g. "platform.py:run_cycle;dispatcher_osp.py:compute_feasible_vehicle_trip_pairs;..." (the root first).
+    functions = []
+    while frame is not None:
+        functions.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+        frame = frame.f_back
+    functions.reverse()
+    return ";".join(functions)
@@ -0,0 +1,72 @@
+import csv
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from src.simulator.platform import *
+
+##################################################################################
+# Parameter Sweep
+##################################################################################
+# A sweep runs one simulation per configuration of a grid, across a process pool (see map_with_inherited_router()).
+# The results (each configuration and the metrics of its report) are saved as one csv table.
+
+# The router of the running map_with_inherited_router(), which its worker processes inherit when they are forked.
+inherited_router_func = None
+
+
+def call_with_inherited_router(func, args: tuple):
+    return func(inherited_router_func, *args)
+
+
+def map_with_inherited_router(router_func: Router, func, args_list: list[tuple], num_of_workers: int = None) -> list:
+    # Return [func(router_func, *args) for args in args_list], computed across a process pool. The Router is built
+    # once and the workers are forked from the process that built it, so that all of them share its tables instead of
+    # reloading them: the memory-mapped binary tables through the page cache, and the unpickled tables copy-on-write
+    # (they are read-only). (func is passed to the workers by name, so it has to be a module-level function.)
+    global inherited_router_func
+    num_of_workers = num_of_workers if num_of_workers is not None else min(len(args_list), os.cpu_count())
+    inherited_router_func = router_func
+    try:
+        with ProcessPoolExecutor(max_workers=num_of_workers, mp_context=multiprocessing.get_context("fork")) \
+                as executor:
+            return list(executor.map(call_with_inherited_router, itertools.repeat(func), args_list))
+    finally:
+        inherited_router_func = None
+
+
+def expand_config_grid(config_grid: dict) -> list[SimulationConfig]:
+    # e.g. {"fleet_size": [1000, 2000], "dispatcher": ["SBA", "OSP"]} gives the 4 configurations of all combinations.
+    names = list(config_grid.keys())
+    return [SimulationConfig(**dict(zip(names, values))) for values in itertools.product(*config_grid.values())]
+
+
+def run_simulation_of_config(router_func: Router, config: SimulationConfig) -> dict:
+    t = timer_start()
+    platform = Platform(router_func, create_demand_generator(config), config)
+    platform.run_epochs(show_progress_bar=False, save_checkpoints=False)
+    result = config.to_dict()
+    result.update(platform.compute_report_metrics())
+    result["runtime_s"] = get_runtime_ms_from_t_to_now(t) / 1000.0
+    return result
+
+
+def run_parameter_sweep(router_func: Router,
+                        configs: list[SimulationConfig],
+                        path_to_results: str,
+                        num_of_workers: int = None) -> list[dict]:
+    t = timer_start()
+    num_of_workers = num_of_workers if num_of_workers is not None else min(len(configs), os.cpu_count())
+    results = map_with_inherited_router(router_func, run_simulation_of_config, [(config,) for config in configs],
+                                        num_of_workers)
+    save_sweep_results(results, path_to_results)
+    print(f"[INFO] Ran the sweep of {len(configs)} configurations in {num_of_workers} processes, "
+          f"results saved to \"{path_to_results}\". ({timer_end(t)})")
+    return results
+
+
+def save_sweep_results(results: list[dict], path_to_results: str):
+    os.makedirs(os.path.dirname(os.path.abspath(path_to_results)), exist_ok=True)
+    with open(path_to_results, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(results[0].keys()))
+        writer.writeheader()
+        writer.writerows(results)
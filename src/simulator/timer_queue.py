@@ -0,0 +1,29 @@
+import heapq
+
+
+class TimerQueue(object):
+    # A min-heap of timed events, e.g. the order ids keyed on their expiry times, or the vehicle ids keyed on their
+    # arrival times at the next waypoints. Each event is popped once, when the system time reaches its time.
+    # Events are never removed from the middle of the heap: if an event might be outdated when it is popped (e.g. the
+    # order has been picked up before it expires), the owner checks it then and simply drops it.
+    def __init__(self):
+        self.heap = []
+        self.num_of_pushed_events = 0   # Used as the tie-breaker, so that the events at the same time pop in order.
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+    def push(self, time_ms: int, event):
+        heapq.heappush(self.heap, (time_ms, self.num_of_pushed_events, event))
+        self.num_of_pushed_events += 1
+
+    def get_next_event_time_ms(self) -> int:
+        # Return the time of the earliest event, or None if the queue is empty.
+        return self.heap[0][0] if self.heap else None
+
+    def pop_due_events(self, system_time_ms: int) -> list:
+        # Pop all events due at or before system_time_ms, in time order.
+        due_events = []
+        while self.heap and self.heap[0][0] <= system_time_ms:
+            due_events.append(heapq.heappop(self.heap)[2])
+        return due_events
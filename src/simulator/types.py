@@ -1,5 +1,9 @@
 
 import copy
+import shutil
+import tempfile
+import weakref
+import numpy as np
 from enum import Enum
 from src.simulator.config import *
 
@@ -8,10 +12,33 @@ from src.simulator.config import *
 # Geo Types
 ##################################################################################
 class Pos(object):
-    def __init__(self):
-        self.node_id = 1  # Note: the node id starts from 1, for the provided manhattan data.
-        self.lon = 0.0
-        self.lat = 0.0
+    # Poses are immutable, so that the router can hand out the same Pos of a node to everyone without copying it.
+    __slots__ = ("node_id", "lon", "lat")
+
+    def __init__(self, node_id: int = 1, lon: float = 0.0, lat: float = 0.0):
+        # Note: the node id starts from 1, for the provided manhattan data.
+        object.__setattr__(self, "node_id", node_id)
+        object.__setattr__(self, "lon", lon)
+        object.__setattr__(self, "lat", lat)
+
+    def __setattr__(self, key, value):
+        raise AttributeError("Pos is immutable!")
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return Pos, (self.node_id, self.lon, self.lat)
+
+    def __setstate__(self, state):
+        # Restore the poses pickled before Pos used __slots__, whose state is the instance's __dict__.
+        if isinstance(state, tuple):
+            state = state[1]
+        for key, value in state.items():
+            object.__setattr__(self, key, value)
 
 
 class Step(object):
@@ -21,11 +48,99 @@ class Step(object):
         self.poses = []
 
 
+class CompactRoute(object):
+    # A read-only route shared by all vehicles: the node path and the cumulative duration and distance at each node.
+    def __init__(self, node_ids, cumulative_duration_ms, cumulative_distance_mm):
+        self.node_ids = node_ids                                # np.int32 array, [onid, ..., dnid]
+        self.cumulative_duration_ms = cumulative_duration_ms    # np.float64 array, starting with 0
+        self.cumulative_distance_mm = cumulative_distance_mm    # np.float64 array, starting with 0
+
+
 class Route(object):
-    def __init__(self):
+    # A TIME_ONLY route only has its duration and distance. A FULL_ROUTE route is a cursor on a shared CompactRoute:
+    # the remaining route starts at the node compact_route.node_ids[start_idx], optionally preceded by a head step,
+    # i.e. the unfinished part of the road link into that node, from head_pos (which has that node's id) on.
+    # The vehicles move along a route by advancing the cursor (see truncate_route_by_time()), so the shared arrays are
+    # never changed or copied. The route as a list of Steps (the last step being the flag step of 2 identical points
+    # at the destination) is only built on request.
+    def __init__(self, compact_route: CompactRoute = None, node_poses: list[Pos] = None):
         self.distance_mm = 0
         self.duration_ms = 0
-        self.steps = []
+        self.compact_route = compact_route
+        self.node_poses = node_poses    # The router's poses of the nodes, node_poses[node_id - 1].
+        self.start_idx = 0
+        self.head_duration_ms = 0   # 0 if there is no head step.
+        self.head_distance_mm = 0
+        self.head_pos = None
+
+    def __deepcopy__(self, memo):
+        # The compact route and the poses are read-only, so they are shared by the copies.
+        route = Route(self.compact_route, self.node_poses)
+        route.distance_mm = self.distance_mm
+        route.duration_ms = self.duration_ms
+        route.start_idx = self.start_idx
+        route.head_duration_ms = self.head_duration_ms
+        route.head_distance_mm = self.head_distance_mm
+        route.head_pos = self.head_pos
+        return route
+
+    def has_steps(self) -> bool:
+        return self.compact_route is not None
+
+    def get_node_pos_at(self, idx: int) -> Pos:
+        return self.node_poses[self.compact_route.node_ids[idx] - 1]
+
+    def get_start_pos(self) -> Pos:
+        # The pos where the route starts, i.e. the first pose of the first step.
+        return self.head_pos if self.head_duration_ms > 0 else self.get_node_pos_at(self.start_idx)
+
+    def get_head_step(self) -> Step:
+        step = Step()
+        step.duration_ms = self.head_duration_ms
+        step.distance_mm = self.head_distance_mm
+        step.poses.append(self.head_pos)
+        step.poses.append(self.get_node_pos_at(self.start_idx))
+        return step
+
+    def get_first_step(self) -> Step:
+        if self.head_duration_ms > 0:
+            return self.get_head_step()
+        return self.get_step_from(self.start_idx)
+
+    def get_step_from(self, idx: int) -> Step:
+        # The step from node idx to node idx + 1 of the compact route, or the flag step if idx is the destination.
+        step = Step()
+        node_ids = self.compact_route.node_ids
+        if idx + 1 < len(node_ids):
+            step.duration_ms = float(self.compact_route.cumulative_duration_ms[idx + 1]
+                                     - self.compact_route.cumulative_duration_ms[idx])
+            step.distance_mm = float(self.compact_route.cumulative_distance_mm[idx + 1]
+                                     - self.compact_route.cumulative_distance_mm[idx])
+            step.poses.append(self.get_node_pos_at(idx))
+            step.poses.append(self.get_node_pos_at(idx + 1))
+        else:
+            step.poses.append(self.get_node_pos_at(idx))
+            step.poses.append(self.get_node_pos_at(idx))
+        return step
+
+    @property
+    def steps(self) -> list[Step]:
+        # The remaining route as a list of (new) Steps. (Changing them does not change the route.)
+        if self.compact_route is None:
+            return []
+        steps = [self.get_head_step()] if self.head_duration_ms > 0 else []
+        steps.extend(self.get_step_from(idx) for idx in range(self.start_idx, len(self.compact_route.node_ids)))
+        return steps
+
+    def prepend_head_step(self, step: Step):
+        # Add the unfinished step on the road link into the route's first node, e.g. the vehicle's step_to_pos.
+        assert (self.head_duration_ms == 0 and step.duration_ms > 0)
+        assert (step.poses[0].node_id == step.poses[1].node_id == self.compact_route.node_ids[self.start_idx])
+        self.head_duration_ms = step.duration_ms
+        self.head_distance_mm = step.distance_mm
+        self.head_pos = step.poses[0]
+        self.duration_ms += step.duration_ms
+        self.distance_mm += step.distance_mm
 
 
 class RoutingType(Enum):
@@ -37,11 +152,25 @@ class RoutingType(Enum):
 # Order Types
 ##################################################################################
 class Request(object):
-    def __init__(self):
-        self.origin_node_id = 1
-        self.destination_node_id = 2
-        self.request_time_ms = 0
-        self.request_time_date = "0000-00-00 00:00:00"
+    # Requests are lightweight records, which the demand generator builds fresh from its columnar demand store.
+    __slots__ = ("origin_node_id", "destination_node_id", "request_time_ms", "request_time_date")
+
+    def __init__(self,
+                 origin_node_id: int = 1,
+                 destination_node_id: int = 2,
+                 request_time_ms: int = 0,
+                 request_time_date: str = "0000-00-00 00:00:00"):
+        self.origin_node_id = origin_node_id
+        self.destination_node_id = destination_node_id
+        self.request_time_ms = request_time_ms
+        self.request_time_date = request_time_date
+
+    def __setstate__(self, state):
+        # Restore the requests pickled before Request used __slots__, whose state is the instance's __dict__.
+        if isinstance(state, tuple):
+            state = state[1]
+        for key, value in state.items():
+            setattr(self, key, value)
 
 
 class OrderStatus(Enum):
@@ -66,19 +195,252 @@ def order_status_to_string(status: OrderStatus) -> str:
     assert (False & "Bad OrderStatus type!")
 
 
+# The columns of the order table, each with its dtype. Orders are rows of the table (the order id is the row number),
+# so that an order costs a few bytes instead of a Python object, and the columns can be scanned by array operations.
+ORDER_COLUMNS = (("origin_node_id", np.int32),
+                 ("destination_node_id", np.int32),
+                 ("status", np.int8),
+                 ("request_time_ms", np.int64),
+                 ("shortest_travel_time_ms", np.int64),
+                 ("max_pickup_time_ms", np.float64),    # (The deadlines and the pickup and dropoff times are in
+                 ("max_dropoff_time_ms", np.float64),   # fractions of ms, as the vehicles' travel times are.)
+                 ("pickup_time_ms", np.float64),
+                 ("dropoff_time_ms", np.float64))
+ORDER_COLUMN_INDICES = {name: column_idx for column_idx, (name, _) in enumerate(ORDER_COLUMNS)}
+ORDER_DTYPE = np.dtype(list(ORDER_COLUMNS))
+ORDER_STATUSES_BY_VALUE = (None, OrderStatus.PENDING, OrderStatus.PICKING, OrderStatus.ONBOARD, OrderStatus.COMPLETE,
+                           OrderStatus.WALKAWAY)
+ACTIVE_ORDER_STATUSES = (OrderStatus.PENDING, OrderStatus.PICKING, OrderStatus.ONBOARD)
+
+
+def order_table_column_view(column_name: str, value_type, read_only: bool = False) -> property:
+    # A property of Order reading and writing the order's element of an OrderStore column. Only the live orders can be
+    # written, the compacted ones are finished.
+    column_idx = ORDER_COLUMN_INDICES[column_name]
+
+    def get_value(order):
+        order_store = order.order_store
+        row = order.id - order_store.live_start_id
+        if row >= 0:
+            return value_type(order_store.live_columns[column_idx][row])
+        return value_type(order_store.get_compacted_row(order.id)[column_name])
+
+    def set_value(order, value):
+        order_store = order.order_store
+        row = order.id - order_store.live_start_id
+        assert (row >= 0 and "Cannot change a compacted order!")
+        order_store.live_columns[column_idx][row] = value
+
+    return property(get_value, None if read_only else set_value)
+
+
 class Order(object):
-    def __init__(self):
-        self.id = 0  # Note: the order id starts from 0, equaling to its idx.
-        self.origin = Pos()
-        self.destination = Pos()
-        self.status = OrderStatus.PENDING
-        self.request_time_ms = 0
-        self.request_time_date = "0000-00-00 00:00:00"
-        self.shortest_travel_time_ms = 0
-        self.max_pickup_time_ms = 0
-        self.max_dropoff_time_ms = 0
-        self.pickup_time_ms = 0
-        self.dropoff_time_ms = 0
+    # A view of one row of an OrderStore, which is created on access (e.g. orders[order_id]) and holds no data itself.
+    # Note: the order id starts from 0, equaling to its row in the store.
+    __slots__ = ("order_store", "id")
+
+    def __init__(self, _order_store, _order_id: int):
+        self.order_store = _order_store
+        self.id = _order_id
+
+    origin_node_id = order_table_column_view("origin_node_id", int)
+    destination_node_id = order_table_column_view("destination_node_id", int)
+    request_time_ms = order_table_column_view("request_time_ms", int)
+    shortest_travel_time_ms = order_table_column_view("shortest_travel_time_ms", int)
+    max_pickup_time_ms = order_table_column_view("max_pickup_time_ms", float)
+    max_dropoff_time_ms = order_table_column_view("max_dropoff_time_ms", float)
+    pickup_time_ms = order_table_column_view("pickup_time_ms", float)
+    dropoff_time_ms = order_table_column_view("dropoff_time_ms", float)
+    # (The status is changed through OrderStore.set_order_status().)
+    status = order_table_column_view("status", ORDER_STATUSES_BY_VALUE.__getitem__, read_only=True)
+
+    @property
+    def origin(self) -> Pos:
+        return self.order_store.node_poses[self.origin_node_id - 1]
+
+    @property
+    def destination(self) -> Pos:
+        return self.order_store.node_poses[self.destination_node_id - 1]
+
+
+class OrderChunk(object):
+    # A run of compacted (finished) orders with consecutive ids, as one record array. A chunk spilled to disk is an
+    # .npy file which is memory-mapped read-only, so that its pages are only loaded (and cached by the OS) when read.
+    def __init__(self, _start_id: int, _rows: np.ndarray):
+        self.start_id = _start_id
+        self.rows = _rows
+        self.path = None
+
+    def spill(self, path: str):
+        np.save(path, self.rows)
+        self.path = path
+        self.rows = np.load(path, mmap_mode="r")
+
+    def __getstate__(self):
+        # A spilled chunk is pickled as its path only (e.g. in a checkpoint), its file stays where it is.
+        state = self.__dict__.copy()
+        if self.path is not None:
+            state["rows"] = None
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        if self.path is not None:
+            self.rows = np.load(self.path, mmap_mode="r")
+
+
+def remove_order_chunks_dir(path_to_dir: str, owner_pid: int):
+    # (A forked process, e.g. a rollout, does not remove the directory of the store that it has inherited.)
+    if os.getpid() == owner_pid:
+        shutil.rmtree(path_to_dir, ignore_errors=True)
+
+
+class OrderStore(object):
+    # The table of all orders (indexed by order id), kept as columns (see ORDER_COLUMNS). Only the "live" orders, from
+    # the oldest unfinished one on, are in the growable live columns. When they are full, the finished (complete or
+    # walkaway) orders before the oldest unfinished one are compacted, in chunks of ORDER_CHUNK_SIZE orders, into
+    # read-only OrderChunks (optionally spilled to disk, see SPILL_FINISHED_ORDERS_TO_DISK). So the memory of the live
+    # columns is bounded by the orders active at a time, and not by the length of the simulation.
+    # The hot loops of the dispatchers read the active (i.e. live) orders from the live columns (see
+    # get_live_column_array() and get_live_values()), which is several times faster than through the Order views.
+    # Note: all status transitions should go through set_order_status(), to keep the status counts up to date.
+    def __init__(self,
+                 _node_poses: list[Pos],
+                 _chunk_size: int = ORDER_CHUNK_SIZE,
+                 _spill_finished_orders: bool = SPILL_FINISHED_ORDERS_TO_DISK,
+                 _path_to_spill_dir: str = PATH_TO_ORDER_CHUNKS):
+        self.node_poses = _node_poses   # The router's poses of the nodes, which the orders' origins are looked up in.
+        self.chunk_size = _chunk_size
+        self.spill_finished_orders = _spill_finished_orders
+        self.path_to_spill_dir = _path_to_spill_dir
+        self.spill_dir = None   # The directory of this store's spilled chunks, created at the first spill.
+        self.spill_dir_finalizer = None     # Removes the directory when this store is discarded.
+        self.num_of_orders = 0
+        self.live_start_id = 0
+        self.live_columns = [np.zeros(_chunk_size * 2, dtype=dtype) for _, dtype in ORDER_COLUMNS]
+        self.chunks = []    # chunks[i] has the orders of ids [i * chunk_size, (i + 1) * chunk_size).
+        self.num_of_orders_by_status = {status: 0 for status in OrderStatus}
+        self.metrics = None     # The MetricsAccumulator that the orders and their status transitions are reported to.
+
+    def __getstate__(self):
+        # A checkpoint refers to the spilled chunks by their paths (see OrderChunk), so once this store is pickled, its
+        # directory is kept after it is discarded. (Neither does the unpickled store remove it.)
+        if self.spill_dir_finalizer is not None:
+            self.spill_dir_finalizer.detach()
+        state = self.__dict__.copy()
+        state["spill_dir_finalizer"] = None
+        return state
+
+    def __len__(self) -> int:
+        return self.num_of_orders
+
+    def __getitem__(self, order_id: int) -> Order:
+        assert (0 <= order_id < self.num_of_orders)
+        return Order(self, order_id)
+
+    def __iter__(self):
+        return (Order(self, order_id) for order_id in range(self.num_of_orders))
+
+    def add_order(self,
+                  origin_node_id: int,
+                  destination_node_id: int,
+                  request_time_ms: int,
+                  shortest_travel_time_ms: int,
+                  max_pickup_time_ms: int,
+                  max_dropoff_time_ms: int) -> int:
+        # Add a pending order and return its id.
+        row = self.num_of_orders - self.live_start_id
+        if row == len(self.live_columns[0]):
+            # When the live columns are full, compact them, and double them if that frees less than half of them
+            # (so that the compaction, which scans the live orders, is run once per many added orders).
+            self.compact_finished_orders()
+            row = self.num_of_orders - self.live_start_id
+            if row * 2 > len(self.live_columns[0]):
+                self.live_columns = [np.concatenate([column, np.zeros_like(column)]) for column in self.live_columns]
+        values = (origin_node_id, destination_node_id, OrderStatus.PENDING.value, request_time_ms,
+                  shortest_travel_time_ms, max_pickup_time_ms, max_dropoff_time_ms, 0, 0)
+        for column, value in zip(self.live_columns, values):
+            column[row] = value
+        order_id = self.num_of_orders
+        self.num_of_orders += 1
+        self.num_of_orders_by_status[OrderStatus.PENDING] += 1
+        if self.metrics is not None:
+            self.metrics.add_order(Order(self, order_id))
+        return order_id
+
+    def set_order_status(self, order_id: int, status: OrderStatus):
+        row = order_id - self.live_start_id
+        assert (row >= 0 and "Cannot change a compacted order!")
+        statuses = self.live_columns[ORDER_COLUMN_INDICES["status"]]
+        previous_status = ORDER_STATUSES_BY_VALUE[statuses[row]]
+        statuses[row] = status.value
+        self.num_of_orders_by_status[previous_status] -= 1
+        self.num_of_orders_by_status[status] += 1
+        if self.metrics is not None:
+            self.metrics.upd_order_status(Order(self, order_id), previous_status)
+
+    def get_order_ids_with_status(self, *statuses: OrderStatus) -> list[int]:
+        # Return the ids of the orders in any of the given statuses, sorted by id. Only the active statuses can be
+        # asked for, as the finished orders might have been compacted.
+        assert (all(status in ACTIVE_ORDER_STATUSES for status in statuses))
+        live_statuses = self.get_live_column("status")
+        is_in_statuses = np.isin(live_statuses, [status.value for status in statuses])
+        return (np.flatnonzero(is_in_statuses) + self.live_start_id).tolist()
+
+    def get_num_of_orders_with_status(self, status: OrderStatus) -> int:
+        return self.num_of_orders_by_status[status]
+
+    def get_live_column(self, column_name: str) -> np.ndarray:
+        # The column of the live orders, ids [live_start_id, num_of_orders). (A view, which is not to be written.)
+        return self.live_columns[ORDER_COLUMN_INDICES[column_name]][:self.num_of_orders - self.live_start_id]
+
+    def get_live_column_array(self, column_name: str) -> np.ndarray:
+        # The whole array of the live column, in which the live order order_id is at row order_id - live_start_id.
+        # (It is not sliced to the live orders, so that getting it is cheap. It is only valid until the next
+        # add_order(), which might compact or grow the live columns.)
+        return self.live_columns[ORDER_COLUMN_INDICES[column_name]]
+
+    def get_live_values(self, column_name: str, order_ids: list[int]) -> np.ndarray:
+        # The values of the given live orders in the column, read at once.
+        rows = np.asarray(order_ids, dtype=np.int64) - self.live_start_id
+        assert ((len(rows) == 0 or rows.min() >= 0) and "Compacted orders are not in the live columns!")
+        return self.live_columns[ORDER_COLUMN_INDICES[column_name]][rows]
+
+    def get_compacted_row(self, order_id: int) -> np.void:
+        chunk = self.chunks[order_id // self.chunk_size]
+        return chunk.rows[order_id - chunk.start_id]
+
+    def compact_finished_orders(self):
+        # Move the finished orders before the oldest unfinished one to chunks, as many whole chunks as there are.
+        live_statuses = self.get_live_column("status")
+        is_unfinished = (live_statuses != OrderStatus.COMPLETE.value) & (live_statuses != OrderStatus.WALKAWAY.value)
+        num_of_finished_rows = int(np.argmax(is_unfinished)) if is_unfinished.any() else len(live_statuses)
+        num_of_rows_to_compact = num_of_finished_rows - num_of_finished_rows % self.chunk_size
+        if num_of_rows_to_compact == 0:
+            return
+        for chunk_start_row in range(0, num_of_rows_to_compact, self.chunk_size):
+            rows = np.empty(self.chunk_size, dtype=ORDER_DTYPE)
+            for (name, _), column in zip(ORDER_COLUMNS, self.live_columns):
+                rows[name] = column[chunk_start_row:chunk_start_row + self.chunk_size]
+            chunk = OrderChunk(self.live_start_id + chunk_start_row, rows)
+            if self.spill_finished_orders:
+                if self.spill_dir is None:
+                    os.makedirs(self.path_to_spill_dir, exist_ok=True)
+                    self.spill_dir = tempfile.mkdtemp(prefix="orders-", dir=self.path_to_spill_dir)
+                    self.spill_dir_finalizer = \
+                        weakref.finalize(self, remove_order_chunks_dir, self.spill_dir, os.getpid())
+                # (The file name is unique, as the processes forked from this one, e.g. the rollouts, inherit the
+                #  directory and spill their own chunks of the same ids to it.)
+                file_descriptor, path_to_chunk = tempfile.mkstemp(prefix=f"chunk-{len(self.chunks)}-", suffix=".npy",
+                                                                  dir=self.spill_dir)
+                os.close(file_descriptor)
+                chunk.spill(path_to_chunk)
+            self.chunks.append(chunk)
+        # Shift the remaining live orders to the start of the live columns.
+        num_of_live_rows = len(live_statuses)
+        for column in self.live_columns:
+            column[:num_of_live_rows - num_of_rows_to_compact] = column[num_of_rows_to_compact:num_of_live_rows]
+        self.live_start_id += num_of_rows_to_compact
 
 
 ##################################################################################
@@ -114,26 +476,114 @@ def vehicle_status_to_string(status: VehicleStatus) -> str:
     assert (False & "Bad VehicleStatus type!")
 
 
+VEHICLE_STATUSES_BY_VALUE = (None, VehicleStatus.IDLE, VehicleStatus.WORKING, VehicleStatus.REBALANCING)
+
+
+class FleetState(object):
+    # The state of the whole fleet as arrays (struct of arrays), indexed by the vehicles' fleet_state_idx. Each
+    # Vehicle is a view of one row, so that the whole fleet can also be read and advanced by array operations.
+    def __init__(self, num_of_vehicles: int):
+        self.statuses = np.full(num_of_vehicles, VehicleStatus.IDLE.value, dtype=np.int8)
+        self.poses = [Pos() for _ in range(num_of_vehicles)]
+        self.node_ids = np.ones(num_of_vehicles, dtype=np.int64)
+        self.loads = np.zeros(num_of_vehicles, dtype=np.int64)
+        # The unfinished step (on a road link) to the vehicle's pos: its remaining duration and distance, and the
+        # coordinates where the vehicle actually is (from) and of its pos (to). Duration 0 means there is no step.
+        self.step_to_pos_durations_ms = np.zeros(num_of_vehicles, dtype=np.float64)
+        self.step_to_pos_distances_mm = np.zeros(num_of_vehicles, dtype=np.float64)
+        self.step_to_pos_from_lons = np.zeros(num_of_vehicles, dtype=np.float64)
+        self.step_to_pos_from_lats = np.zeros(num_of_vehicles, dtype=np.float64)
+        self.step_to_pos_to_lons = np.zeros(num_of_vehicles, dtype=np.float64)
+        self.step_to_pos_to_lats = np.zeros(num_of_vehicles, dtype=np.float64)
+        # The travel statistics.
+        self.dist_traveled_mm = np.zeros(num_of_vehicles, dtype=np.float64)
+        self.loaded_dist_traveled_mm = np.zeros(num_of_vehicles, dtype=np.float64)
+        self.empty_dist_traveled_mm = np.zeros(num_of_vehicles, dtype=np.float64)
+        self.rebl_dist_traveled_mm = np.zeros(num_of_vehicles, dtype=np.float64)
+        self.time_traveled_ms = np.zeros(num_of_vehicles, dtype=np.float64)
+        self.loaded_time_traveled_ms = np.zeros(num_of_vehicles, dtype=np.float64)
+        self.empty_time_traveled_ms = np.zeros(num_of_vehicles, dtype=np.float64)
+        self.rebl_time_traveled_ms = np.zeros(num_of_vehicles, dtype=np.float64)
+        self.metrics = None     # The MetricsAccumulator that the travel is also reported to (as fleet totals).
+
+
+def fleet_state_array_view(array_name: str, value_type: type) -> property:
+    # A property of Vehicle reading and writing the vehicle's element of a FleetState array.
+    def get_value(vehicle):
+        return value_type(getattr(vehicle.fleet_state, array_name)[vehicle.fleet_state_idx])
+
+    def set_value(vehicle, value):
+        getattr(vehicle.fleet_state, array_name)[vehicle.fleet_state_idx] = value
+
+    return property(get_value, set_value)
+
+
 class Vehicle(object):
-    def __init__(self):
+    def __init__(self, _fleet_state: FleetState = None, _fleet_state_idx: int = 0):
         self.id = 0  # Note: the vehicle id starts from 0, equaling to its idx.
-        self.pos = Pos()
-        self.status = VehicleStatus.IDLE
+        self.fleet_state = _fleet_state if _fleet_state is not None else FleetState(1)
+        self.fleet_state_idx = _fleet_state_idx
         self.schedule_has_been_updated_at_current_epoch = False  # False at the start of each epoch,
         # true if vehicle's schedule is rebuilt. Only used in func upd_schedule_for_vehicles_having_orders_removed().
-        self.step_to_pos = Step()
         self.capacity = 1
-        self.load = 0
         self.schedule = []
         self.onboard_order_ids = []
-        self.dist_traveled_mm = 0
-        self.loaded_dist_traveled_mm = 0
-        self.empty_dist_traveled_mm = 0
-        self.rebl_dist_traveled_mm = 0
-        self.time_traveled_ms = 0
-        self.loaded_time_traveled_ms = 0
-        self.empty_time_traveled_ms = 0
-        self.rebl_time_traveled_ms = 0
+
+    load = fleet_state_array_view("loads", int)
+    step_to_pos_duration_ms = fleet_state_array_view("step_to_pos_durations_ms", float)
+    step_to_pos_distance_mm = fleet_state_array_view("step_to_pos_distances_mm", float)
+    dist_traveled_mm = fleet_state_array_view("dist_traveled_mm", float)
+    loaded_dist_traveled_mm = fleet_state_array_view("loaded_dist_traveled_mm", float)
+    empty_dist_traveled_mm = fleet_state_array_view("empty_dist_traveled_mm", float)
+    rebl_dist_traveled_mm = fleet_state_array_view("rebl_dist_traveled_mm", float)
+    time_traveled_ms = fleet_state_array_view("time_traveled_ms", float)
+    loaded_time_traveled_ms = fleet_state_array_view("loaded_time_traveled_ms", float)
+    empty_time_traveled_ms = fleet_state_array_view("empty_time_traveled_ms", float)
+    rebl_time_traveled_ms = fleet_state_array_view("rebl_time_traveled_ms", float)
+
+    @property
+    def status(self) -> VehicleStatus:
+        return VEHICLE_STATUSES_BY_VALUE[self.fleet_state.statuses[self.fleet_state_idx]]
+
+    @status.setter
+    def status(self, status: VehicleStatus):
+        self.fleet_state.statuses[self.fleet_state_idx] = status.value
+
+    @property
+    def pos(self) -> Pos:
+        return self.fleet_state.poses[self.fleet_state_idx]
+
+    @pos.setter
+    def pos(self, pos: Pos):
+        self.fleet_state.poses[self.fleet_state_idx] = pos
+        self.fleet_state.node_ids[self.fleet_state_idx] = pos.node_id
+
+    @property
+    def step_to_pos(self) -> Step:
+        # Build the step to pos from the fleet state. (It is a new Step, changing it does not change the vehicle.)
+        step = Step()
+        idx = self.fleet_state_idx
+        step.duration_ms = float(self.fleet_state.step_to_pos_durations_ms[idx])
+        if step.duration_ms == 0:
+            return step
+        step.distance_mm = float(self.fleet_state.step_to_pos_distances_mm[idx])
+        node_id = int(self.fleet_state.node_ids[idx])
+        step.poses.append(Pos(node_id, float(self.fleet_state.step_to_pos_from_lons[idx]),
+                              float(self.fleet_state.step_to_pos_from_lats[idx])))
+        step.poses.append(Pos(node_id, float(self.fleet_state.step_to_pos_to_lons[idx]),
+                              float(self.fleet_state.step_to_pos_to_lats[idx])))
+        return step
+
+    @step_to_pos.setter
+    def step_to_pos(self, step: Step):
+        idx = self.fleet_state_idx
+        self.fleet_state.step_to_pos_durations_ms[idx] = step.duration_ms
+        self.fleet_state.step_to_pos_distances_mm[idx] = step.distance_mm
+        if len(step.poses) == 2:
+            self.fleet_state.step_to_pos_from_lons[idx] = step.poses[0].lon
+            self.fleet_state.step_to_pos_from_lats[idx] = step.poses[0].lat
+            self.fleet_state.step_to_pos_to_lons[idx] = step.poses[1].lon
+            self.fleet_state.step_to_pos_to_lats[idx] = step.poses[1].lat
 
 
 ##################################################################################
@@ -1,68 +1,304 @@
 
-from src.simulator.types import *
+from src.simulator.router import *
 
 
-def truncate_step_by_time(step: Step, time_ms: int):
-    assert (len(step.poses) == 2)
-    assert (step.distance_mm > 0)
-    assert (step.duration_ms > 0)
+def truncate_route_by_time(route: Route, time_ms: int):
+    # Advance the route's cursor by time_ms: finish (or truncate) the head step, then binary search the cumulative
+    # durations for the road link that the vehicle is on after time_ms, which becomes the new head step.
+    assert (route.has_steps())
+    assert (route.distance_mm > 0)
+    assert (route.duration_ms > 0)
     assert (time_ms >= 0)
-    assert (time_ms < step.duration_ms)
+    assert (time_ms < route.duration_ms)
 
     if time_ms == 0:
         return
 
-    ratio = time_ms / step.duration_ms
-    new_pos = Pos()
-    new_pos.node_id = step.poses[1].node_id
-    new_pos.lon = step.poses[0].lon + ratio * (step.poses[1].lon - step.poses[0].lon)
-    new_pos.lat = step.poses[0].lat + ratio * (step.poses[1].lat - step.poses[0].lat)
-    step.poses[0] = new_pos
-    step.distance_mm *= (1 - ratio)
-    step.duration_ms -= time_ms  # we do not use "*= (1 - ratio)" to avoid bug cases, e.g. "11119 / 11120 = 1.0"
-    assert (len(step.poses) == 2)
-    assert (step.distance_mm >= 0)
-    assert (step.duration_ms > 0)
+    # 1. The head step.
+    if route.head_duration_ms > 0:
+        if route.head_duration_ms > time_ms:
+            # (The same element-wise operations as in advance_idle_vehicles.)
+            ratio = time_ms / route.head_duration_ms
+            to_pos = route.get_node_pos_at(route.start_idx)
+            route.head_pos = Pos(to_pos.node_id,
+                                 route.head_pos.lon + ratio * (to_pos.lon - route.head_pos.lon),
+                                 route.head_pos.lat + ratio * (to_pos.lat - route.head_pos.lat))
+            route.head_distance_mm *= (1 - ratio)
+            route.head_duration_ms -= time_ms  # we do not use "*= (1 - ratio)" to avoid bug cases, e.g. 11119 / 11120
+            upd_route_duration_and_distance(route)
+            return
+        time_ms -= route.head_duration_ms
+        route.head_duration_ms = 0
+        route.head_distance_mm = 0
+        route.head_pos = None
 
+    # 2. The steps of the compact route. The vehicle passes all nodes up to end_idx - 1.
+    if time_ms > 0:
+        cumulative_duration_ms = route.compact_route.cumulative_duration_ms
+        cumulative_distance_mm = route.compact_route.cumulative_distance_mm
+        target_duration_ms = cumulative_duration_ms[route.start_idx] + time_ms
+        end_idx = int(np.searchsorted(cumulative_duration_ms, target_duration_ms, side="right"))
+        assert (route.start_idx < end_idx < len(cumulative_duration_ms))
+        traveled_duration_ms = float(target_duration_ms - cumulative_duration_ms[end_idx - 1])
+        if traveled_duration_ms == 0:
+            # The vehicle is exactly at node end_idx - 1.
+            route.start_idx = end_idx - 1
+        else:
+            step_duration_ms = float(cumulative_duration_ms[end_idx] - cumulative_duration_ms[end_idx - 1])
+            step_distance_mm = float(cumulative_distance_mm[end_idx] - cumulative_distance_mm[end_idx - 1])
+            ratio = traveled_duration_ms / step_duration_ms
+            from_pos = route.get_node_pos_at(end_idx - 1)
+            to_pos = route.get_node_pos_at(end_idx)
+            route.head_pos = Pos(to_pos.node_id,
+                                 from_pos.lon + ratio * (to_pos.lon - from_pos.lon),
+                                 from_pos.lat + ratio * (to_pos.lat - from_pos.lat))
+            route.head_distance_mm = step_distance_mm * (1 - ratio)
+            route.head_duration_ms = step_duration_ms - traveled_duration_ms
+            route.start_idx = end_idx
 
-def truncate_route_by_time(route: Route, time_ms: int):
-    assert (len(route.steps) >= 2)
-    assert (route.distance_mm > 0)
+    upd_route_duration_and_distance(route)
+    assert (route.distance_mm >= 0)
     assert (route.duration_ms > 0)
-    assert (time_ms >= 0)
-    assert (time_ms < route.duration_ms)
 
-    if time_ms == 0:
+
+def upd_route_duration_and_distance(route: Route):
+    # The remaining duration (distance) is the head step's plus the difference of the cumulative durations (distances).
+    compact_route = route.compact_route
+    route.duration_ms = route.head_duration_ms + float(compact_route.cumulative_duration_ms[-1]
+                                                       - compact_route.cumulative_duration_ms[route.start_idx])
+    route.distance_mm = route.head_distance_mm + float(compact_route.cumulative_distance_mm[-1]
+                                                       - compact_route.cumulative_distance_mm[route.start_idx])
+
+
+def advance_idle_vehicles(fleet_state: FleetState,
+                          vehicle_indices: np.ndarray,
+                          time_ms: int,
+                          update_vehicle_statistics: bool = True):
+    # Advance the given idle vehicles by time_ms in bulk. An idle vehicle only moves if it is still finishing its step
+    # to pos, which is raised when the vehicle's assigned orders are reassigned to other vehicles and it becomes idle.
+    # (The element-wise operations are the same as for a head step in truncate_route_by_time.)
+    vehicle_indices = vehicle_indices[fleet_state.step_to_pos_durations_ms[vehicle_indices] > 0]
+    if time_ms == 0 or len(vehicle_indices) == 0:
         return
+    durations_ms = fleet_state.step_to_pos_durations_ms[vehicle_indices]
+    distances_mm = fleet_state.step_to_pos_distances_mm[vehicle_indices]
 
-    for i in range(len(route.steps)):
-        step = route.steps[i]
-        # If we can finish this step within the time, remove the entire step.
-        if step.duration_ms <= time_ms:
-            time_ms -= step.duration_ms
-            continue
-        # If we can not finish this step, truncate the step.
-        truncate_step_by_time(step, time_ms)
-        del route.steps[:i]
+    # 1. The vehicles that finish their steps within the time.
+    finishing = durations_ms <= time_ms
+    finishing_indices = vehicle_indices[finishing]
+    if update_vehicle_statistics:
+        for statistic, traveled in (("dist_traveled_mm", distances_mm[finishing]),
+                                    ("time_traveled_ms", durations_ms[finishing]),
+                                    ("empty_dist_traveled_mm", distances_mm[finishing]),
+                                    ("empty_time_traveled_ms", durations_ms[finishing])):
+            add_travel_to_fleet_statistics(fleet_state, finishing_indices, statistic, traveled)
+    fleet_state.step_to_pos_durations_ms[finishing_indices] = 0
+    fleet_state.step_to_pos_distances_mm[finishing_indices] = 0
 
-        break
+    # 2. The vehicles that can not finish their steps, whose steps are truncated.
+    truncating_indices = vehicle_indices[~finishing]
+    ratios = time_ms / durations_ms[~finishing]
+    for from_array, to_array in ((fleet_state.step_to_pos_from_lons, fleet_state.step_to_pos_to_lons),
+                                 (fleet_state.step_to_pos_from_lats, fleet_state.step_to_pos_to_lats)):
+        from_array[truncating_indices] += ratios * (to_array[truncating_indices] - from_array[truncating_indices])
+    original_distances_mm = distances_mm[~finishing]
+    truncated_distances_mm = original_distances_mm * (1 - ratios)
+    fleet_state.step_to_pos_distances_mm[truncating_indices] = truncated_distances_mm
+    fleet_state.step_to_pos_durations_ms[truncating_indices] -= time_ms
+    if update_vehicle_statistics:
+        traveled_distances_mm = original_distances_mm - truncated_distances_mm
+        traveled_durations_ms = np.full(len(truncating_indices), float(time_ms))
+        for statistic, traveled in (("dist_traveled_mm", traveled_distances_mm),
+                                    ("time_traveled_ms", traveled_durations_ms),
+                                    ("empty_dist_traveled_mm", traveled_distances_mm),
+                                    ("empty_time_traveled_ms", traveled_durations_ms)):
+            add_travel_to_fleet_statistics(fleet_state, truncating_indices, statistic, traveled)
 
-    # Recalculate the total duration and distance.
-    route.distance_mm = 0
-    route.duration_ms = 0
-    for step in route.steps:
-        route.distance_mm += step.distance_mm
-        route.duration_ms += step.duration_ms
 
-    assert (len(route.steps) >= 2)
-    assert (route.distance_mm >= 0)
-    assert (route.duration_ms > 0)
+def advance_vehicles_within_first_legs(vehicles: list[Vehicle],
+                                       time_ms: int,
+                                       router_func: Router,
+                                       update_vehicle_statistics: bool = True):
+    # Advance the given non-idle vehicles by time_ms in bulk. None of them reaches its first waypoint within the time
+    # (i.e. its first leg has the full route and lasts longer than time_ms), so no order is picked up or dropped off
+    # and only the cursors of the first legs move. The cursors are gathered into arrays and the remaining cumulative
+    # arrays of the routes are concatenated, so that the element-wise operations of truncate_route_by_time() are done
+    # for all vehicles at once. They are the same operations in the same order, so that a vehicle ends up bit-identical
+    # whichever of the two advances it: whether a vehicle reaches a waypoint within the cycle decides which one is
+    # used, and any difference would make the simulation depend on the cycle length and on the vehicles around it.
+    if time_ms == 0 or len(vehicles) == 0:
+        return
+    fleet_state = vehicles[0].fleet_state
+    vehicle_indices = np.array([vehicle.fleet_state_idx for vehicle in vehicles])
+    routes = [vehicle.schedule[0].route for vehicle in vehicles]
+    start_indices = np.array([route.start_idx for route in routes])
+    head_durations_ms = np.array([route.head_duration_ms for route in routes], dtype=np.float64)
+    head_distances_mm = np.array([route.head_distance_mm for route in routes], dtype=np.float64)
+    original_durations_ms = np.array([route.duration_ms for route in routes], dtype=np.float64)
+    original_distances_mm = np.array([route.distance_mm for route in routes], dtype=np.float64)
+    assert (np.all(original_durations_ms > time_ms))
+
+    # 1. The head steps. A vehicle that can not finish its head step within the time stays on it.
+    staying_on_head = head_durations_ms > time_ms
+    ratios = np.where(staying_on_head, time_ms / np.where(staying_on_head, head_durations_ms, 1), 0)
+    head_lons = np.array([route.head_pos.lon if route.head_pos is not None else 0 for route in routes])
+    head_lats = np.array([route.head_pos.lat if route.head_pos is not None else 0 for route in routes])
+    to_node_ids = [int(route.compact_route.node_ids[route.start_idx]) for route in routes]
+    remaining_times_ms = np.where(staying_on_head, 0, time_ms - head_durations_ms)
+    head_durations_ms = np.where(staying_on_head, head_durations_ms - time_ms, 0)
+    head_distances_mm = np.where(staying_on_head, head_distances_mm * (1 - ratios), 0)
+
+    # 2. The steps of the compact routes, from each route's start_idx on. A vehicle passes all nodes up to
+    #    end_idx - 1, where end_idx is the number of nodes whose cumulative duration is at most the target duration
+    #    (i.e. np.searchsorted(..., side="right") on each route).
+    segment_lengths = np.array([len(route.compact_route.node_ids) - route.start_idx for route in routes])
+    segment_offsets = np.concatenate(([0], np.cumsum(segment_lengths)[:-1]))
+    cumulative_durations_ms = np.concatenate([route.compact_route.cumulative_duration_ms[route.start_idx:]
+                                              for route in routes])
+    cumulative_distances_mm = np.concatenate([route.compact_route.cumulative_distance_mm[route.start_idx:]
+                                              for route in routes])
+    node_ids = np.concatenate([route.compact_route.node_ids[route.start_idx:] for route in routes])
+    target_durations_ms = cumulative_durations_ms[segment_offsets] + remaining_times_ms
+    num_of_passed_nodes = np.add.reduceat(cumulative_durations_ms <= np.repeat(target_durations_ms, segment_lengths),
+                                          segment_offsets)
+    moving_on_steps = remaining_times_ms > 0
+    assert (np.all(num_of_passed_nodes[moving_on_steps] < segment_lengths[moving_on_steps]))
+    # The vehicle moving on the steps has passed the node at end_idx - 1 (num_of_passed_nodes >= 1) and not the last
+    # one. The positions of the other vehicles are only kept within their own segments (a route having only its head
+    # step left has a segment of 1 node), and their values are not used.
+    end_positions = segment_offsets + np.where(moving_on_steps, num_of_passed_nodes, np.minimum(segment_lengths - 1, 1))
+    passed_positions = np.maximum(end_positions - 1, segment_offsets)
+    traveled_durations_ms = target_durations_ms - cumulative_durations_ms[passed_positions]
+    step_durations_ms = cumulative_durations_ms[end_positions] - cumulative_durations_ms[passed_positions]
+    step_distances_mm = cumulative_distances_mm[end_positions] - cumulative_distances_mm[passed_positions]
+    entering_steps = moving_on_steps & (traveled_durations_ms > 0)
+    step_ratios = np.where(entering_steps, traveled_durations_ms / np.where(entering_steps, step_durations_ms, 1), 0)
+    head_durations_ms = np.where(entering_steps, step_durations_ms - traveled_durations_ms, head_durations_ms)
+    head_distances_mm = np.where(entering_steps, step_distances_mm * (1 - step_ratios), head_distances_mm)
+    # (A vehicle that is exactly at node end_idx - 1 starts there.)
+    new_start_positions = np.where(entering_steps, end_positions,
+                                   np.where(moving_on_steps, passed_positions, segment_offsets))
+    new_start_indices = start_indices + new_start_positions - segment_offsets
+
+    # 3. The remaining durations and distances of the routes (as in upd_route_duration_and_distance()).
+    durations_ms = head_durations_ms + (cumulative_durations_ms[segment_offsets + segment_lengths - 1]
+                                        - cumulative_durations_ms[new_start_positions])
+    distances_mm = head_distances_mm + (cumulative_distances_mm[segment_offsets + segment_lengths - 1]
+                                        - cumulative_distances_mm[new_start_positions])
+    assert (np.all(distances_mm >= 0) and np.all(durations_ms > 0))
+
+    # 4. Write the cursors back to the routes, and the positions and the steps to pos to the fleet state.
+    passed_node_ids = node_ids[passed_positions].tolist()
+    entered_node_ids = node_ids[end_positions].tolist()
+    ratios, step_ratios = ratios.tolist(), step_ratios.tolist()
+    head_lons, head_lats = head_lons.tolist(), head_lats.tolist()
+    for i, route in enumerate(routes):
+        route.start_idx = int(new_start_indices[i])
+        route.head_duration_ms = float(head_durations_ms[i])
+        route.head_distance_mm = float(head_distances_mm[i])
+        route.duration_ms = float(durations_ms[i])
+        route.distance_mm = float(distances_mm[i])
+        if staying_on_head[i]:
+            to_pos = route.node_poses[to_node_ids[i] - 1]
+            route.head_pos = Pos(to_pos.node_id,
+                                 head_lons[i] + ratios[i] * (to_pos.lon - head_lons[i]),
+                                 head_lats[i] + ratios[i] * (to_pos.lat - head_lats[i]))
+        elif entering_steps[i]:
+            from_pos = route.node_poses[passed_node_ids[i] - 1]
+            to_pos = route.node_poses[entered_node_ids[i] - 1]
+            route.head_pos = Pos(to_pos.node_id,
+                                 from_pos.lon + step_ratios[i] * (to_pos.lon - from_pos.lon),
+                                 from_pos.lat + step_ratios[i] * (to_pos.lat - from_pos.lat))
+        else:
+            route.head_pos = None
+        vehicles[i].pos = route.get_start_pos()
+        if PREFETCH_NEXT_LEG_FULL_ROUTE and len(vehicles[i].schedule) > 1:
+            build_full_route_of_leg(vehicles[i], 1, router_func)
+    on_links = head_durations_ms > 0
+    fleet_state.step_to_pos_durations_ms[vehicle_indices] = head_durations_ms
+    fleet_state.step_to_pos_distances_mm[vehicle_indices] = np.where(on_links, head_distances_mm, 0)
+    on_link_indices = vehicle_indices[on_links]
+    fleet_state.step_to_pos_from_lons[on_link_indices] = [routes[i].head_pos.lon for i in np.flatnonzero(on_links)]
+    fleet_state.step_to_pos_from_lats[on_link_indices] = [routes[i].head_pos.lat for i in np.flatnonzero(on_links)]
+    fleet_state.step_to_pos_to_lons[on_link_indices] = \
+        [routes[i].get_node_pos_at(routes[i].start_idx).lon for i in np.flatnonzero(on_links)]
+    fleet_state.step_to_pos_to_lats[on_link_indices] = \
+        [routes[i].get_node_pos_at(routes[i].start_idx).lat for i in np.flatnonzero(on_links)]
+
+    # 5. The travel statistics (as in add_travel_to_vehicle_statistics()).
+    if update_vehicle_statistics:
+        traveled_distances_mm = original_distances_mm - distances_mm
+        traveled_durations_ms = original_durations_ms - durations_ms
+        loads = fleet_state.loads[vehicle_indices]
+        statuses = fleet_state.statuses[vehicle_indices]
+        empty = (statuses == VehicleStatus.WORKING.value) & (loads == 0)
+        rebalancing = statuses == VehicleStatus.REBALANCING.value
+        for statistic, traveled, traveling in (
+                ("dist_traveled_mm", traveled_distances_mm, None),
+                ("loaded_dist_traveled_mm", traveled_distances_mm * loads, None),
+                ("time_traveled_ms", traveled_durations_ms, None),
+                ("loaded_time_traveled_ms", traveled_durations_ms * loads, None),
+                ("empty_dist_traveled_mm", traveled_distances_mm, empty),
+                ("empty_time_traveled_ms", traveled_durations_ms, empty),
+                ("rebl_dist_traveled_mm", traveled_distances_mm, rebalancing),
+                ("rebl_time_traveled_ms", traveled_durations_ms, rebalancing)):
+            if traveling is None:
+                add_travel_to_fleet_statistics(fleet_state, vehicle_indices, statistic, traveled)
+            elif np.any(traveling):
+                add_travel_to_fleet_statistics(fleet_state, vehicle_indices[traveling], statistic,
+                                               traveled[traveling])
+
+
+def add_travel_to_fleet_statistics(fleet_state: FleetState, vehicle_indices: np.ndarray, statistic: str,
+                                   traveled: np.ndarray):
+    getattr(fleet_state, statistic)[vehicle_indices] += traveled
+    if fleet_state.metrics is not None:
+        fleet_state.metrics.add_travel(statistic, float(traveled.sum()))
+
+
+def add_travel_to_vehicle_statistics(vehicle: Vehicle, distance_mm: float, duration_ms: float):
+    fleet_state = vehicle.fleet_state
+    idx = vehicle.fleet_state_idx
+    load = fleet_state.loads[idx]
+    status = vehicle.status
+    fleet_state.dist_traveled_mm[idx] += distance_mm
+    fleet_state.loaded_dist_traveled_mm[idx] += distance_mm * load
+    fleet_state.time_traveled_ms[idx] += duration_ms
+    fleet_state.loaded_time_traveled_ms[idx] += duration_ms * load
+    if status == VehicleStatus.WORKING and load == 0:
+        fleet_state.empty_dist_traveled_mm[idx] += distance_mm
+        fleet_state.empty_time_traveled_ms[idx] += duration_ms
+    if status == VehicleStatus.REBALANCING:
+        fleet_state.rebl_dist_traveled_mm[idx] += distance_mm
+        fleet_state.rebl_time_traveled_ms[idx] += duration_ms
+    metrics = fleet_state.metrics
+    if metrics is not None:
+        metrics.add_travel("dist_traveled_mm", distance_mm)
+        metrics.add_travel("loaded_dist_traveled_mm", distance_mm * load)
+        metrics.add_travel("time_traveled_ms", duration_ms)
+        metrics.add_travel("loaded_time_traveled_ms", duration_ms * load)
+        if status == VehicleStatus.WORKING and load == 0:
+            metrics.add_travel("empty_dist_traveled_mm", distance_mm)
+            metrics.add_travel("empty_time_traveled_ms", duration_ms)
+        if status == VehicleStatus.REBALANCING:
+            metrics.add_travel("rebl_dist_traveled_mm", distance_mm)
+            metrics.add_travel("rebl_time_traveled_ms", duration_ms)
+
+
+def build_full_route_of_leg(vehicle: Vehicle, leg_idx: int, router_func: Router):
+    # Replace the TIME_ONLY route of the leg to the vehicle's leg_idx-th waypoint by its full route, if not done yet.
+    wp = vehicle.schedule[leg_idx]
+    if wp.route.has_steps():
+        return
+    pre_pos = vehicle.pos if leg_idx == 0 else vehicle.schedule[leg_idx - 1].pos
+    wp.route = router_func.get_route(pre_pos, wp.pos, RoutingType.FULL_ROUTE)
 
 
 def upd_vehicle_pos(vehicle: Vehicle,
-                    orders: list[Order],
+                    orders: OrderStore,
                     system_time_ms: int,
                     time_ms: int,
+                    router_func: Router,
                     update_vehicle_statistics: bool = True) -> tuple[list[int], list[int]]:
     new_picked_order_ids = []
     new_dropped_order_ids = []
@@ -73,25 +309,8 @@ def upd_vehicle_pos(vehicle: Vehicle,
     # Move the vehicle's pos by step_to_pos, if it is not empty while the vehicle's schedule is empty.
     # (This case is raised when the vehicle's assigned orders are reassigned to other vehicles and it becomes idle.)
     if vehicle.status == VehicleStatus.IDLE:
-        if vehicle.step_to_pos.duration_ms == 0:
-            return new_picked_order_ids, new_dropped_order_ids
-        if vehicle.step_to_pos.duration_ms <= time_ms:
-            if update_vehicle_statistics:
-                vehicle.dist_traveled_mm += vehicle.step_to_pos.distance_mm
-                vehicle.time_traveled_ms += vehicle.step_to_pos.duration_ms
-                vehicle.empty_dist_traveled_mm += vehicle.step_to_pos.distance_mm
-                vehicle.empty_time_traveled_ms += vehicle.step_to_pos.duration_ms
-            empty_step = Step()
-            vehicle.step_to_pos = empty_step
-        if vehicle.step_to_pos.duration_ms > time_ms:
-            origin_distance_mm = vehicle.step_to_pos.distance_mm
-            truncate_step_by_time(vehicle.step_to_pos, time_ms)
-            dist_traveled_mm = origin_distance_mm - vehicle.step_to_pos.distance_mm
-            if update_vehicle_statistics:
-                vehicle.dist_traveled_mm += dist_traveled_mm
-                vehicle.time_traveled_ms += time_ms
-                vehicle.empty_dist_traveled_mm += dist_traveled_mm
-                vehicle.empty_time_traveled_ms += time_ms
+        advance_idle_vehicles(vehicle.fleet_state, np.array([vehicle.fleet_state_idx]), time_ms,
+                              update_vehicle_statistics)
         return new_picked_order_ids, new_dropped_order_ids
 
     # Clear vehicle's step_to_pos to be prepared for the case when vehicle's pos is at a waypoint node.
@@ -100,6 +319,8 @@ def upd_vehicle_pos(vehicle: Vehicle,
 
     # Move the vehicle's pos by the schedule.
     for i in range(len(vehicle.schedule)):
+        # The vehicle begins the leg to this waypoint (if it has not yet), so the leg needs its full route.
+        build_full_route_of_leg(vehicle, i, router_func)
         wp = vehicle.schedule[i]
 
         # If we can finish this waypoint within the time.
@@ -110,22 +331,13 @@ def upd_vehicle_pos(vehicle: Vehicle,
             vehicle.pos = wp.pos
 
             if update_vehicle_statistics:
-                vehicle.dist_traveled_mm += wp.route.distance_mm
-                vehicle.loaded_dist_traveled_mm += wp.route.distance_mm * vehicle.load
-                vehicle.time_traveled_ms += wp.route.duration_ms
-                vehicle.loaded_time_traveled_ms += wp.route.duration_ms * vehicle.load
-                if vehicle.status == VehicleStatus.WORKING and vehicle.load == 0:
-                    vehicle.empty_dist_traveled_mm += wp.route.distance_mm
-                    vehicle.empty_time_traveled_ms += wp.route.duration_ms
-                if vehicle.status == VehicleStatus.REBALANCING:
-                    vehicle.rebl_dist_traveled_mm += wp.route.distance_mm
-                    vehicle.rebl_time_traveled_ms += wp.route.duration_ms
+                add_travel_to_vehicle_statistics(vehicle, wp.route.distance_mm, wp.route.duration_ms)
 
             if wp.op == WaypointOp.PICKUP:
                 assert (vehicle.load < vehicle.capacity)
                 assert (orders[wp.order_id].status == OrderStatus.PICKING)
                 orders[wp.order_id].pickup_time_ms = system_time_ms
-                orders[wp.order_id].status = OrderStatus.ONBOARD
+                orders.set_order_status(wp.order_id, OrderStatus.ONBOARD)
                 vehicle.load += 1
                 vehicle.onboard_order_ids.append(wp.order_id)
                 new_picked_order_ids.append(wp.order_id)
@@ -133,7 +345,7 @@ def upd_vehicle_pos(vehicle: Vehicle,
                 assert (vehicle.load > 0)
                 assert (orders[wp.order_id].status == OrderStatus.ONBOARD)
                 orders[wp.order_id].dropoff_time_ms = system_time_ms
-                orders[wp.order_id].status = OrderStatus.COMPLETE
+                orders.set_order_status(wp.order_id, OrderStatus.COMPLETE)
                 vehicle.load -= 1
                 vehicle.onboard_order_ids.remove(wp.order_id)
                 new_dropped_order_ids.append(wp.order_id)
@@ -146,30 +358,21 @@ def upd_vehicle_pos(vehicle: Vehicle,
         original_duration_ms = wp.route.duration_ms
 
         truncate_route_by_time(wp.route, time_ms)
-        vehicle.pos = wp.route.steps[0].poses[0]
+        vehicle.pos = wp.route.get_start_pos()
 
         if update_vehicle_statistics:
-            dist_traveled_mm = original_distance_mm - wp.route.distance_mm
-            time_traveled_ms = original_duration_ms - wp.route.duration_ms
-            vehicle.dist_traveled_mm += dist_traveled_mm
-            vehicle.loaded_dist_traveled_mm += dist_traveled_mm * vehicle.load
-            vehicle.time_traveled_ms += time_traveled_ms
-            vehicle.loaded_time_traveled_ms += time_traveled_ms * vehicle.load
-            if vehicle.status == VehicleStatus.WORKING and vehicle.load == 0:
-                vehicle.empty_dist_traveled_mm += dist_traveled_mm
-                vehicle.empty_time_traveled_ms += time_traveled_ms
-            if vehicle.status == VehicleStatus.REBALANCING:
-                vehicle.rebl_dist_traveled_mm += dist_traveled_mm
-                vehicle.rebl_time_traveled_ms += time_traveled_ms
+            add_travel_to_vehicle_statistics(vehicle, original_distance_mm - wp.route.distance_mm,
+                                             original_duration_ms - wp.route.duration_ms)
 
         del vehicle.schedule[:i]
+        if PREFETCH_NEXT_LEG_FULL_ROUTE and len(vehicle.schedule) > 1:
+            build_full_route_of_leg(vehicle, 1, router_func)
 
-        # If the vehicle is currently on a link, we store its unfinished step to step_to_pos.
-        first_step_of_route = vehicle.schedule[0].route.steps[0]
-        if first_step_of_route.poses[0].node_id == first_step_of_route.poses[1].node_id:
-            vehicle.step_to_pos = copy.deepcopy(first_step_of_route)
-            assert (first_step_of_route.duration_ms != 0)
-            assert (vehicle.pos.node_id == vehicle.step_to_pos.poses[0].node_id)
+        # If the vehicle is currently on a link, we store its unfinished step (the route's head step) to step_to_pos.
+        first_route = vehicle.schedule[0].route
+        if first_route.head_duration_ms > 0:
+            vehicle.step_to_pos = first_route.get_head_step()
+            assert (vehicle.pos.node_id == first_route.head_pos.node_id)
 
         return new_picked_order_ids, new_dropped_order_ids
 
@@ -0,0 +1,57 @@
+from src.simulator.router import *
+
+
+class VehiclePositionIndex(object):
+    # Node-based buckets of the fleet's positions, used to find the vehicles within a travel time of a node without
+    # scanning the whole fleet. The vehicles' node ids are updated incrementally as they move, while the buckets (in
+    # CSR form) are only regrouped, with one vectorized sort, when they are queried after some vehicle has changed node.
+    # The vehicles' ids are their indices in the fleet state.
+    def __init__(self, fleet_state: FleetState, router_func: Router):
+        self.router_func = router_func
+        self.num_of_nodes = router_func.get_num_of_nodes()
+        self.fleet_state = fleet_state
+        # The node ids that the buckets are grouped by, and the (shared) durations of the vehicles' steps to pos.
+        self.vehicles_node_ids = fleet_state.node_ids.copy()
+        self.vehicles_step_to_pos_duration_ms = fleet_state.step_to_pos_durations_ms
+        # The ids of the vehicles at node_id are vehicle_ids_by_node[indptr[node_id - 1]:indptr[node_id]].
+        self.indptr = np.zeros(self.num_of_nodes + 1, dtype=np.int64)
+        self.vehicle_ids_by_node = np.zeros(0, dtype=np.int64)
+        self.buckets_are_outdated = True
+
+    def upd_vehicles(self):
+        # Called after the fleet has moved, to check whether any vehicle has changed node.
+        if not np.array_equal(self.vehicles_node_ids, self.fleet_state.node_ids):
+            self.vehicles_node_ids[:] = self.fleet_state.node_ids
+            self.buckets_are_outdated = True
+
+    def get_vehicle_ids_at_nodes(self, node_ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        # Return the ids of the vehicles at the given nodes, and for each vehicle the index of its node in node_ids.
+        if self.buckets_are_outdated:
+            self.vehicle_ids_by_node = np.argsort(self.vehicles_node_ids, kind="stable")
+            np.cumsum(np.bincount(self.vehicles_node_ids - 1, minlength=self.num_of_nodes), out=self.indptr[1:])
+            self.buckets_are_outdated = False
+        starts = self.indptr[node_ids - 1]
+        lengths = self.indptr[node_ids] - starts
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        return self.vehicle_ids_by_node[offsets], np.repeat(np.arange(len(node_ids)), lengths)
+
+    def get_vehicle_ids_within_duration_to(self, node_id: int, max_duration_ms: int,
+                                           include_step_to_pos: bool = True) -> np.ndarray:
+        # Return the ids (sorted) of the vehicles that can reach the node within max_duration_ms. The time for a
+        # vehicle to finish its current step (to its pos) is included, if include_step_to_pos is true.
+        if max_duration_ms < 0:
+            return np.zeros(0, dtype=np.int64)
+        nearby_node_ids, durations_ms = self.router_func.get_nodes_within_duration_to(node_id, max_duration_ms)
+        vehicle_ids, node_indices = self.get_vehicle_ids_at_nodes(nearby_node_ids)
+        if include_step_to_pos:
+            vehicle_ids = vehicle_ids[durations_ms[node_indices] + self.vehicles_step_to_pos_duration_ms[vehicle_ids]
+                                      <= max_duration_ms]
+        return np.sort(vehicle_ids)
+
+    def get_vehicle_ids_within_duration_from(self, node_id: int, max_duration_ms: int) -> np.ndarray:
+        # Return the ids (sorted) of the vehicles whose pos can be reached from the node within max_duration_ms.
+        if max_duration_ms < 0:
+            return np.zeros(0, dtype=np.int64)
+        nearby_node_ids, _ = self.router_func.get_nodes_within_duration_from(node_id, max_duration_ms)
+        vehicle_ids, _ = self.get_vehicle_ids_at_nodes(nearby_node_ids)
+        return np.sort(vehicle_ids)
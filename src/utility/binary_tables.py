@@ -0,0 +1,311 @@
+import json
+import numpy as np
+from src.utility.utility_functions import *
+
+##################################################################################
+# Binary Travel Table Format
+##################################################################################
+# Each table is stored as a raw ".npy" file (C-order, fixed dtype) next to a small ".header.json" file, e.g.
+#   mean-table.npy + mean-table.header.json
+# The header records the format version, dtype, shape and unit of the table. Tables are opened with numpy.memmap,
+# so that the loading is near-instant and concurrent simulation processes share one page-cached copy.
+TRAVEL_TABLE_FORMAT_NAME = "amod-travel-table"
+TRAVEL_TABLE_FORMAT_VERSION = 1
+
+
+def get_path_to_binary_table(path_to_table: str) -> str:
+    return os.path.splitext(path_to_table)[0] + ".npy"
+
+
+def get_path_to_binary_table_header(path_to_table: str) -> str:
+    return os.path.splitext(path_to_table)[0] + ".header.json"
+
+
+def save_table_to_binary_file(table: np.ndarray, path_to_table: str, unit: str, node_order: str = None):
+    # node_order names the binary file (in the same folder) of the node permutation that the table's rows and columns
+    # follow, if the nodes have been renumbered (see node_reordering.py).
+    table = np.ascontiguousarray(table)
+    path_to_npy = get_path_to_binary_table(path_to_table)
+    np.save(path_to_npy, table, allow_pickle=False)
+    header = {"format": TRAVEL_TABLE_FORMAT_NAME,
+              "version": TRAVEL_TABLE_FORMAT_VERSION,
+              "name": os.path.basename(os.path.splitext(path_to_table)[0]),
+              "dtype": table.dtype.str,
+              "shape": list(table.shape),
+              "unit": unit}
+    if node_order is not None:
+        header["node_order"] = node_order
+    with open(get_path_to_binary_table_header(path_to_table), "w") as f:
+        json.dump(header, f, indent=2)
+
+
+def load_binary_table_header(path_to_table: str) -> dict:
+    with open(get_path_to_binary_table_header(path_to_table), "r") as f:
+        header = json.load(f)
+    assert (header["format"] == TRAVEL_TABLE_FORMAT_NAME and "Not a travel table header!")
+    assert (header["version"] == TRAVEL_TABLE_FORMAT_VERSION and "Unsupported travel table format version!")
+    return header
+
+
+def has_binary_table(path_to_table: str) -> bool:
+    return os.path.exists(get_path_to_binary_table(path_to_table)) \
+        and os.path.exists(get_path_to_binary_table_header(path_to_table))
+
+
+def load_table_from_binary_file(path_to_table: str) -> np.memmap:
+    header = load_binary_table_header(path_to_table)
+    table = np.load(get_path_to_binary_table(path_to_table), mmap_mode="r", allow_pickle=False)
+    assert (table.dtype.str == header["dtype"] and list(table.shape) == header["shape"])
+    return table
+
+
+def load_table(path_to_table: str, default_unit: str) -> tuple[np.ndarray, str]:
+    # Prefer the memory-mapped binary table if it has been converted, otherwise fall back to the pickle file.
+    # The unit of the table is returned as well, since binary tables might be stored in compact units (e.g. "ms").
+    if has_binary_table(path_to_table):
+        return load_table_from_binary_file(path_to_table), load_binary_table_header(path_to_table)["unit"]
+    with open(path_to_table, "rb") as f:
+        return pickle.load(f), default_unit
+
+
+def load_table_node_order(path_to_table: str) -> np.ndarray:
+    # Return the node permutation of a renumbered binary table (node_order[row] = original node id), or None.
+    if not has_binary_table(path_to_table):
+        return None
+    header = load_binary_table_header(path_to_table)
+    if "node_order" not in header:
+        return None
+    return load_table_from_binary_file(os.path.join(os.path.dirname(path_to_table), header["node_order"] + ".npy"))
+
+
+def convert_pickle_table_to_binary_file(path_to_pickle: str, unit: str):
+    with open(path_to_pickle, "rb") as f:
+        table = np.asarray(pickle.load(f))
+    save_table_to_binary_file(table, path_to_pickle, unit)
+    print(f"[INFO] Converted \"{path_to_pickle}\" to binary table {table.dtype} {table.shape}.")
+
+
+##################################################################################
+# Compact Travel Tables
+##################################################################################
+# The compact tables store the mean travel time in int32 milliseconds, the travel distance in uint32 millimeters and
+# the shortest path (predecessor) table in uint16 node ids (when there are less than 65535 nodes). Rounding to ms/mm
+# keeps every entry within 0.5 ms/mm of the original value, but the rounding errors of the steps add up along a route.
+# So, with compact tables, the deviation that the router allows between the sum of a route's steps and its (rounded)
+# origin-destination entry grows by 0.5 ms/mm per step and for the entry (see get_max_route_deviation()), and the
+# compact tables are only accepted if the routes of all origin-destination pairs are within it.
+ROUTE_DEVIATION_DUE_TO_DATA_STRUCTURE = 5   # ms/mm, between the sum of a route's steps and its entry in the tables
+COMPACT_TABLE_ROUNDING_ERROR = 0.5          # ms/mm, of each entry of a compact table
+
+
+def get_max_route_deviation(num_of_steps, compact: bool):
+    # num_of_steps can be a number or an array (of the routes' numbers of steps).
+    if not compact:
+        return ROUTE_DEVIATION_DUE_TO_DATA_STRUCTURE
+    return ROUTE_DEVIATION_DUE_TO_DATA_STRUCTURE + COMPACT_TABLE_ROUNDING_ERROR * (num_of_steps + 1)
+
+
+def compute_route_sums_of_rows(step_tables: list[np.ndarray],
+                               path_table: np.ndarray,
+                               start_row: int,
+                               end_row: int) -> tuple[list[np.ndarray], np.ndarray]:
+    # Return, for the origins of rows [start_row, end_row), the sum of each step table along the shortest path to every
+    # destination (i.e. sum[o, d] = sum[o, pred(o, d)] + step(pred(o, d), d)), and the number of steps of the path.
+    # The sums are computed for all destinations at once by pointer doubling: each entry holds the sum from an
+    # ancestor of the destination on the path on, and jumps to the ancestor's ancestor, which halves the remaining
+    # path in each iteration. (An origin, or a destination without predecessor, is its own ancestor with sum 0.)
+    num_of_nodes = path_table.shape[1]
+    origin_rows = np.arange(start_row, end_row)[:, None]
+    predecessors = np.asarray(path_table[start_row:end_row], dtype=np.int64)
+    has_predecessor = predecessors > 0
+    ancestors = np.where(has_predecessor, predecessors - 1, origin_rows)
+    destination_rows = np.broadcast_to(np.arange(num_of_nodes), ancestors.shape)
+    sums = [np.where(has_predecessor, step_table[ancestors, destination_rows], 0).astype(np.int64)
+            for step_table in step_tables]
+    num_of_steps = has_predecessor.astype(np.int64)
+    for _ in range(int(np.ceil(np.log2(max(num_of_nodes, 2)))) + 1):
+        if np.array_equal(ancestors, np.broadcast_to(origin_rows, ancestors.shape)):
+            return sums, num_of_steps
+        sums = [np.take_along_axis(route_sums, ancestors, axis=1) + route_sums for route_sums in sums]
+        num_of_steps = np.take_along_axis(num_of_steps, ancestors, axis=1) + num_of_steps
+        ancestors = np.take_along_axis(ancestors, ancestors, axis=1)
+    assert (False and "The shortest path table has a cycle!")
+
+
+def compact_travel_tables(mean_table: np.ndarray,
+                          dist_table: np.ndarray,
+                          path_table: np.ndarray,
+                          tolerance: float = COMPACT_TABLE_ROUNDING_ERROR,
+                          num_of_rows_per_block: int = 256) -> tuple[np.ndarray, np.ndarray, np.ndarray, dict]:
+    mean_table_ms = np.asarray(mean_table, dtype=np.float64) * 1000
+    dist_table_mm = np.asarray(dist_table, dtype=np.float64) * 1000
+    path_table = np.asarray(path_table)
+    assert (mean_table_ms.max() < np.iinfo(np.int32).max and dist_table_mm.max() < np.iinfo(np.uint32).max)
+    assert (mean_table_ms.min() >= 0 and dist_table_mm.min() >= 0)
+
+    compact_mean_table = np.rint(mean_table_ms).astype(np.int32)
+    compact_dist_table = np.rint(dist_table_mm).astype(np.uint32)
+    # Negative values in the path table only mean "no predecessor", which is represented by 0 in the compact table.
+    path_dtype = np.uint16 if path_table.shape[0] < np.iinfo(np.uint16).max else np.int32
+    compact_path_table = np.where(path_table > 0, path_table, 0).astype(path_dtype)
+
+    # 1. Entry-level deviations. The path table is exact if it is restored from the compact one, with 0 mapped back to
+    #    the original "no predecessor" value (e.g. -1), which catches the node ids that do not fit in its dtype.
+    no_predecessor_values = path_table[path_table <= 0]
+    no_predecessor_value = no_predecessor_values[0] if len(no_predecessor_values) > 0 else 0
+    restored_path_table = np.where(compact_path_table > 0, compact_path_table, no_predecessor_value)
+    report = {"max_time_deviation_ms": float(np.abs(compact_mean_table - mean_table_ms).max()),
+              "max_distance_deviation_mm": float(np.abs(compact_dist_table - dist_table_mm).max()),
+              "path_table_exact": bool(np.array_equal(restored_path_table.astype(path_table.dtype), path_table))}
+
+    # 2. Route-level deviations, i.e. the sum of the compact steps along the shortest path of every origin-destination
+    #    pair against its compact entry, which is what the router asserts (see Router.get_compact_route()), and the
+    #    largest of them relative to the deviation that the router allows for the route's number of steps.
+    #    (The paths follow the original path table, which the compact one has been checked against above.)
+    max_route_time_deviation_ms = max_route_distance_deviation_mm = 0
+    max_route_deviation_ratio = 0.0
+    for start_row in range(0, path_table.shape[0], num_of_rows_per_block):
+        end_row = min(start_row + num_of_rows_per_block, path_table.shape[0])
+        (route_durations_ms, route_distances_mm), num_of_steps = \
+            compute_route_sums_of_rows([compact_mean_table, compact_dist_table], path_table, start_row, end_row)
+        route_time_deviations_ms = np.abs(route_durations_ms - compact_mean_table[start_row:end_row])
+        route_distance_deviations_mm = np.abs(route_distances_mm - compact_dist_table[start_row:end_row])
+        max_route_deviations = get_max_route_deviation(num_of_steps, compact=True)
+        max_route_time_deviation_ms = max(max_route_time_deviation_ms, int(route_time_deviations_ms.max()))
+        max_route_distance_deviation_mm = max(max_route_distance_deviation_mm, int(route_distance_deviations_mm.max()))
+        max_route_deviation_ratio = max(max_route_deviation_ratio,
+                                        float((route_time_deviations_ms / max_route_deviations).max()),
+                                        float((route_distance_deviations_mm / max_route_deviations).max()))
+    report["max_route_time_deviation_ms"] = float(max_route_time_deviation_ms)
+    report["max_route_distance_deviation_mm"] = float(max_route_distance_deviation_mm)
+    report["max_route_deviation_ratio"] = max_route_deviation_ratio     # (At most 1 if the router accepts all routes.)
+
+    # 3. Memory footprint.
+    report["original_size_mb"] = (np.asarray(mean_table).nbytes + np.asarray(dist_table).nbytes
+                                  + path_table.nbytes) / 1e6
+    report["compact_size_mb"] = (compact_mean_table.nbytes + compact_dist_table.nbytes
+                                 + compact_path_table.nbytes) / 1e6
+    report["within_tolerance"] = report["max_time_deviation_ms"] <= tolerance \
+        and report["max_distance_deviation_mm"] <= tolerance \
+        and report["max_route_deviation_ratio"] <= 1 and report["path_table_exact"]
+    return compact_mean_table, compact_dist_table, compact_path_table, report
+
+
+def print_compact_travel_tables_report(report: dict):
+    print(f"[INFO] Compact travel tables: {report['original_size_mb']:.1f} MB -> {report['compact_size_mb']:.1f} MB. "
+          f"Max deviation: time = {report['max_time_deviation_ms']:.3f} ms, "
+          f"distance = {report['max_distance_deviation_mm']:.3f} mm "
+          f"(routes: time = {report['max_route_time_deviation_ms']:.0f} ms, "
+          f"distance = {report['max_route_distance_deviation_mm']:.0f} mm, "
+          f"{report['max_route_deviation_ratio'] * 100:.0f}% of the allowed deviation). "
+          f"Path table exact: {report['path_table_exact']}. Within tolerance: {report['within_tolerance']}.")
+
+
+def convert_travel_tables_to_compact_binary_files(path_to_mean_table: str,
+                                                  path_to_dist_table: str,
+                                                  path_to_path_table: str):
+    tables = []
+    for path_to_table in (path_to_mean_table, path_to_dist_table, path_to_path_table):
+        with open(path_to_table, "rb") as f:
+            tables.append(pickle.load(f))
+    compact_mean_table, compact_dist_table, compact_path_table, report = compact_travel_tables(*tables)
+    print_compact_travel_tables_report(report)
+    assert (report["within_tolerance"] and "Compact travel tables are not accurate enough!")
+    save_table_to_binary_file(compact_mean_table, path_to_mean_table, "ms")
+    save_table_to_binary_file(compact_dist_table, path_to_dist_table, "mm")
+    save_table_to_binary_file(compact_path_table, path_to_path_table, "node_id")
+
+
+##################################################################################
+# Reachability Index
+##################################################################################
+# For each node, the reachability index lists the nodes that can reach it ("to") or that it can reach ("from")
+# within a given radius (e.g. the max pickup wait time), sorted by travel time. It is stored in CSR form as three
+# arrays next to the mean travel time table:
+#   indptr (num_of_nodes + 1): the entries of node_id are in [indptr[node_id - 1], indptr[node_id]).
+#   node_ids: the ids of the nodes that can reach node_id (or can be reached from node_id).
+#   durations_ms: the travel time between each of these nodes and node_id.
+# Like the travel tables, the index follows the (internal) node numbering of the table's rows, i.e. node_id - 1 is
+# the row index of the node in the table. The indices are built when the travel tables are converted (see
+# data_serializer.py), the Router only loads them.
+REACHABILITY_INDEX_ARRAY_NAMES = ("indptr", "node-ids", "durations")
+REACHABILITY_INDEX_ARRAY_UNITS = ("index", "node_id", "ms")
+
+
+def get_path_to_reachability_index(path_to_mean_table: str, radius_ms: int, direction: str, array_name: str) -> str:
+    return f"{os.path.splitext(path_to_mean_table)[0]}-reachability-{direction}-{radius_ms}ms-{array_name}.npy"
+
+
+def build_reachability_index(mean_table: np.ndarray,
+                             time_table_scale_to_ms: int,
+                             radius_ms: int,
+                             direction: str) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    assert (direction in ("to", "from"))
+    num_of_nodes = mean_table.shape[0]
+    indptr = np.zeros(num_of_nodes + 1, dtype=np.int64)
+    all_node_ids = []
+    all_durations_ms = []
+    block_size = 256
+    for block_start in range(0, num_of_nodes, block_size):
+        # Take a block of rows ("from") or a transposed block of columns ("to"), so that the durations from/to each
+        # node are contiguous.
+        if direction == "from":
+            block = np.asarray(mean_table[block_start:block_start + block_size])
+        else:
+            block = np.ascontiguousarray(mean_table[:, block_start:block_start + block_size].T)
+        block_durations_ms = np.rint(block * time_table_scale_to_ms).astype(np.int32)
+        for i, durations_ms in enumerate(block_durations_ms):
+            other_node_indices = np.flatnonzero(durations_ms <= radius_ms)
+            other_node_indices = other_node_indices[np.argsort(durations_ms[other_node_indices], kind="stable")]
+            all_node_ids.append((other_node_indices + 1).astype(np.int32))
+            all_durations_ms.append(durations_ms[other_node_indices])
+            indptr[block_start + i + 1] = indptr[block_start + i] + len(other_node_indices)
+    return indptr, np.concatenate(all_node_ids), np.concatenate(all_durations_ms)
+
+
+def load_reachability_index(path_to_mean_table: str,
+                            radius_ms: int,
+                            direction: str) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Return the memory-mapped index, or None if it has not been built for this table and radius.
+    paths = [get_path_to_reachability_index(path_to_mean_table, radius_ms, direction, name)
+             for name in REACHABILITY_INDEX_ARRAY_NAMES]
+    if not all(has_binary_table(path) for path in paths):
+        return None
+    return tuple(load_table_from_binary_file(path) for path in paths)
+
+
+def build_and_save_reachability_indices(path_to_mean_table: str,
+                                        mean_table: np.ndarray,
+                                        time_table_scale_to_ms: int,
+                                        radius_ms: int):
+    # Build the "to" and "from" indices of the table when it is converted, and save them next to it. If its folder is
+    # not writable (e.g. a read-only or shared data folder), they are not saved, and the Router builds them in memory.
+    t = timer_start()
+    if not os.access(os.path.dirname(os.path.abspath(path_to_mean_table)), os.W_OK):
+        print(f"[WARNING] The reachability indices of \"{path_to_mean_table}\" are not saved, its folder is not "
+              f"writable. The Router will build them in memory.")
+        return
+    for direction in ("to", "from"):
+        reachability_index = build_reachability_index(mean_table, time_table_scale_to_ms, radius_ms, direction)
+        for array, name, unit in zip(reachability_index, REACHABILITY_INDEX_ARRAY_NAMES,
+                                     REACHABILITY_INDEX_ARRAY_UNITS):
+            save_table_to_binary_file(array, get_path_to_reachability_index(path_to_mean_table, radius_ms, direction,
+                                                                            name), unit)
+    print(f"[INFO] Built the reachability indices within {radius_ms / 1000} s of \"{path_to_mean_table}\". "
+          f"({timer_end(t)})")
+
+
+def load_or_build_reachability_index(path_to_mean_table: str,
+                                     mean_table: np.ndarray,
+                                     time_table_scale_to_ms: int,
+                                     radius_ms: int,
+                                     direction: str) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Load the index built by the data conversion, or build it in memory (without saving it) if there is none.
+    reachability_index = load_reachability_index(path_to_mean_table, radius_ms, direction)
+    if reachability_index is not None:
+        return reachability_index
+    t = timer_start()
+    reachability_index = build_reachability_index(mean_table, time_table_scale_to_ms, radius_ms, direction)
+    print(f"[INFO] Built the reachability index ({direction}) within {radius_ms / 1000} s in memory "
+          f"({len(reachability_index[1])} entries), it has not been built with the travel tables. ({timer_end(t)})")
+    return reachability_index
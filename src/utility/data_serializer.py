@@ -2,50 +2,89 @@
 import sys
 import pickle
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
 sys.path.append("../..")
 from src.utility.utility_functions import *
+from src.utility.binary_tables import *
+from src.utility.demand_store import *
 
 
 def load_network_node_from_csv_file_and_save_it_to_pickle_file(path_to_csv: str):
-    all_nodes = []
-    nodes_csv = pd.read_csv(path_to_csv)
-    num_of_nodes = nodes_csv.shape[0]
+    nodes_csv = pd.read_csv(path_to_csv, usecols=["id", "lng", "lat"])
     print(f"[INFO] num_of_nodes {nodes_csv.shape}")
-    print(nodes_csv.head(2))
-    for idx in range(num_of_nodes):
-        node = Pos()
-        node.node_id = int(nodes_csv.iloc[idx]["id"])
-        node.lon = nodes_csv.iloc[idx]["lng"]
-        node.lat = nodes_csv.iloc[idx]["lat"]
-        all_nodes.append(node)
+    all_nodes = [Pos(node_id, lng, lat) for node_id, lng, lat in zip(nodes_csv["id"].astype(int).tolist(),
+                                                                      nodes_csv["lng"].tolist(),
+                                                                      nodes_csv["lat"].tolist())]
     path_to_pickle = path_to_csv.replace(".csv", ".pickle")
     with open(path_to_pickle, 'wb') as f:
         pickle.dump(all_nodes, f)
 
 
-def load_path_table_from_csv_file_and_save_it_to_pickle(path_to_csv: str):
-    path_table_csv = pd.read_csv(path_to_csv, index_col=0).values
-    path_to_pickle = path_to_csv.replace(".csv", ".pickle")
-    with open(path_to_pickle, 'wb') as f:
-        pickle.dump(path_table_csv, f)
+def convert_travel_table_csv_files_to_binary_files(path_to_mean_csv: str,
+                                                   path_to_dist_csv: str,
+                                                   path_to_path_csv: str,
+                                                   compact: bool = False,
+                                                   reachability_radius_ms: int = REACHABILITY_RADIUS_MS):
+    # Read the tables straight from the csv files and save them as the binary tables of the ".pickle" paths that the
+    # Router is given (i.e. mean-table.pickle -> mean-table.npy), without going through the pickle files. The
+    # reachability indices of the mean table (within reachability_radius_ms) are built and saved with them.
+    t = timer_start()
+    mean_table, dist_table, path_table = \
+        [pd.read_csv(path_to_csv, index_col=0, float_precision="round_trip").to_numpy()
+         for path_to_csv in (path_to_mean_csv, path_to_dist_csv, path_to_path_csv)]
+    units = ("s", "m", "node_id")
+    if compact:
+        mean_table, dist_table, path_table, report = compact_travel_tables(mean_table, dist_table, path_table)
+        print_compact_travel_tables_report(report)
+        assert (report["within_tolerance"] and "Compact travel tables are not accurate enough!")
+        units = ("ms", "mm", "node_id")
+    for table, path_to_csv, unit in zip((mean_table, dist_table, path_table),
+                                        (path_to_mean_csv, path_to_dist_csv, path_to_path_csv), units):
+        save_table_to_binary_file(table, path_to_csv.replace(".csv", ".pickle"), unit)
+    build_and_save_reachability_indices(path_to_mean_csv.replace(".csv", ".pickle"), mean_table,
+                                        1 if compact else 1000, reachability_radius_ms)
+    print(f"[INFO] Converted the travel tables {mean_table.shape} to binary tables. ({timer_end(t)})")
 
 
-def load_request_data_from_csv_file_and_save_it_to_pickle_file(path_to_csv: str):
-    all_requests = []
-    requests_csv = pd.read_csv(path_to_csv)
-    num_of_requests = requests_csv.shape[0]
-    print(f"[INFO] num_of_requests {requests_csv.shape}")
-    print(requests_csv.head(2))
-    for idx in tqdm(range(num_of_requests), "loading requests"):
-        request = Request()
-        request.origin_node_id = int(requests_csv.iloc[idx]["onid"])
-        request.destination_node_id = int(requests_csv.iloc[idx]["dnid"])
-        request.request_time_date = requests_csv.iloc[idx]["ptime"]
-        request.request_time_ms = compute_the_accumulated_seconds_from_0_clock(request.request_time_date) * 1000
-        all_requests.append(request)
-    path_to_pickle = path_to_csv.replace(".csv", ".pickle")
-    with open(path_to_pickle, 'wb') as f:
-        pickle.dump(all_requests, f)
+def load_request_columns_from_csv_file(path_to_csv: str) -> DemandStore:
+    # Parse the request times column-wise: the seconds since 0 clock of each request's own day, as in
+    # compute_the_accumulated_seconds_from_0_clock.
+    requests_csv = pd.read_csv(path_to_csv, usecols=["onid", "dnid", "ptime"])
+    request_times = pd.to_datetime(requests_csv["ptime"])
+    request_times_ms = \
+        (request_times - request_times.dt.normalize()).dt.total_seconds().to_numpy().astype(np.int64) * 1000
+    date = str(requests_csv["ptime"].iloc[0])[:10] if requests_csv.shape[0] > 0 else "0000-00-00"
+    return build_demand_store_from_columns(requests_csv["onid"].to_numpy(), requests_csv["dnid"].to_numpy(),
+                                           request_times_ms, date)
+
+
+def convert_request_data_csv_file_to_demand_store(path_to_csv: str):
+    # The demand store is saved next to the ".pickle" path that the DemandGenerator is given.
+    t = timer_start()
+    demand_store = load_request_columns_from_csv_file(path_to_csv)
+    save_demand_store(demand_store, path_to_csv.replace(".csv", ".pickle"))
+    print(f"[INFO] Converted \"{path_to_csv}\" to demand store ({demand_store.get_num_of_requests()} requests). "
+          f"({timer_end(t)})")
+
+
+def convert_dataset_csv_files_in_parallel(node_files: list[str],
+                                          table_files: tuple[str, str, str],
+                                          taxi_data_files: list[str],
+                                          compact_tables: bool = False,
+                                          reachability_radius_ms: int = REACHABILITY_RADIUS_MS,
+                                          num_of_workers: int = None):
+    # Each node file, the travel tables and each day of taxi data are converted in their own worker process.
+    t = timer_start()
+    with ProcessPoolExecutor(max_workers=num_of_workers) as executor:
+        futures = [executor.submit(load_network_node_from_csv_file_and_save_it_to_pickle_file, node_file)
+                   for node_file in node_files]
+        futures.append(executor.submit(convert_travel_table_csv_files_to_binary_files, *table_files, compact_tables,
+                                       reachability_radius_ms))
+        futures.extend(executor.submit(convert_request_data_csv_file_to_demand_store, taxi_data_file)
+                       for taxi_data_file in taxi_data_files)
+        for future in futures:
+            future.result()
+    print(f"[INFO] Converted the dataset ({len(taxi_data_files)} days of taxi data). ({timer_end(t)})")
 
 
 if __name__ == '__main__':
@@ -54,13 +93,9 @@ if __name__ == '__main__':
     mean_table = f"{ROOT_PATH}/datalog-gitignore/map-data/mean-table.csv"
     dist_table = f"{ROOT_PATH}/datalog-gitignore/map-data/dist-table.csv"
     path_table = f"{ROOT_PATH}/datalog-gitignore/map-data/path-table.csv"
+    taxi_data_files = [f"{ROOT_PATH}/datalog-gitignore/taxi-data/manhattan-taxi-201605{day}-peak.csv"
+                       for day in ["03", "04", "05", "10", "11", "12", "17", "19", "24", "25", "26"]]
 
-    for node_file in [vehicle_stations, network_nodes]:
-        load_network_node_from_csv_file_and_save_it_to_pickle_file(node_file)
-
-    for table_file in [mean_table, dist_table, path_table]:
-        load_path_table_from_csv_file_and_save_it_to_pickle(table_file)
-
-    for day in ["03", "04", "05", "10", "11", "12", "17", "19", "24", "25", "26"]:
-        taxi_data = f"{ROOT_PATH}/datalog-gitignore/taxi-data/manhattan-taxi-201605{day}-peak.csv"
-        load_request_data_from_csv_file_and_save_it_to_pickle_file(taxi_data)
+    convert_dataset_csv_files_in_parallel([vehicle_stations, network_nodes], (mean_table, dist_table, path_table),
+                                          taxi_data_files, compact_tables=USE_COMPACT_TRAVEL_TABLES,
+                                          reachability_radius_ms=REACHABILITY_RADIUS_MS)
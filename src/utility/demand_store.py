@@ -0,0 +1,126 @@
+import json
+import numpy as np
+from src.utility.utility_functions import *
+
+##################################################################################
+# Columnar Demand Store
+##################################################################################
+# The requests of a day are stored column by column in a folder next to the taxi data, e.g.
+#   manhattan-taxi-20160526-peak-demand/{origin-node-ids, destination-node-ids, request-times-ms, minute-offsets}.npy
+# plus a "header.json" file. The requests are sorted by their request time (in ms from 0 clock of the day), and
+# minute_offsets[m] is the index of the first request at or after minute m, so that a time window is located with a
+# lookup and a binary search inside one minute. The columns are opened with numpy.memmap, so only the pages of the
+# simulated window are ever read, no matter how many days of data are kept.
+DEMAND_STORE_FORMAT_NAME = "amod-demand-store"
+DEMAND_STORE_FORMAT_VERSION = 1
+DEMAND_STORE_COLUMNS = ("origin-node-ids", "destination-node-ids", "request-times-ms", "minute-offsets")
+
+
+def get_path_to_demand_store(path_to_taxi_data: str) -> str:
+    return os.path.splitext(path_to_taxi_data)[0] + "-demand"
+
+
+def has_demand_store(path_to_taxi_data: str) -> bool:
+    path_to_store = get_path_to_demand_store(path_to_taxi_data)
+    return os.path.exists(os.path.join(path_to_store, "header.json")) \
+        and all(os.path.exists(os.path.join(path_to_store, f"{column}.npy")) for column in DEMAND_STORE_COLUMNS)
+
+
+def compute_minute_offsets(request_times_ms: np.ndarray) -> np.ndarray:
+    num_of_minutes = int(request_times_ms[-1]) // 60000 + 1 if len(request_times_ms) > 0 else 0
+    return np.searchsorted(request_times_ms, np.arange(num_of_minutes + 1, dtype=np.int64) * 60000,
+                           side="left").astype(np.int64)
+
+
+class DemandStore(object):
+    def __init__(self,
+                 _origin_node_ids: np.ndarray,
+                 _destination_node_ids: np.ndarray,
+                 _request_times_ms: np.ndarray,
+                 _date: str,
+                 _minute_offsets: np.ndarray = None):
+        self.origin_node_ids = _origin_node_ids
+        self.destination_node_ids = _destination_node_ids
+        self.request_times_ms = _request_times_ms
+        self.date = _date   # e.g. "2016-05-26", to rebuild the request time dates.
+        self.minute_offsets = _minute_offsets if _minute_offsets is not None \
+            else compute_minute_offsets(_request_times_ms)
+
+    def get_num_of_requests(self) -> int:
+        return len(self.request_times_ms)
+
+    def get_first_request_idx_at_or_after(self, time_ms: int) -> int:
+        minute = time_ms // 60000
+        if minute >= len(self.minute_offsets) - 1:
+            return self.get_num_of_requests()
+        start = int(self.minute_offsets[max(minute, 0)])
+        end = int(self.minute_offsets[max(minute, 0) + 1])
+        return start + int(np.searchsorted(self.request_times_ms[start:end], time_ms, side="left"))
+
+    def get_requests(self, request_indices: list[int], time_offset_ms: int = 0) -> list[Request]:
+        # Build fresh Request records of the given requests, with their request times shifted by -time_offset_ms.
+        origin_node_ids = self.origin_node_ids[request_indices].tolist()
+        destination_node_ids = self.destination_node_ids[request_indices].tolist()
+        request_times_ms = self.request_times_ms[request_indices].tolist()
+        return [Request(onid, dnid, request_time_ms - time_offset_ms, self.convert_time_ms_to_date(request_time_ms))
+                for onid, dnid, request_time_ms in zip(origin_node_ids, destination_node_ids, request_times_ms)]
+
+    def convert_time_ms_to_date(self, time_ms: int) -> str:
+        seconds = time_ms // 1000
+        return f"{self.date} {seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def build_demand_store_from_columns(origin_node_ids: np.ndarray,
+                                    destination_node_ids: np.ndarray,
+                                    request_times_ms: np.ndarray,
+                                    date: str) -> DemandStore:
+    request_times_ms = np.asarray(request_times_ms, dtype=np.int64)
+    order = np.argsort(request_times_ms, kind="stable")
+    return DemandStore(np.asarray(origin_node_ids, dtype=np.int32)[order],
+                       np.asarray(destination_node_ids, dtype=np.int32)[order],
+                       request_times_ms[order], date)
+
+
+def build_demand_store_from_requests(all_requests: list[Request]) -> DemandStore:
+    return build_demand_store_from_columns([request.origin_node_id for request in all_requests],
+                                           [request.destination_node_id for request in all_requests],
+                                           [request.request_time_ms for request in all_requests],
+                                           all_requests[0].request_time_date[:10] if all_requests else "0000-00-00")
+
+
+def save_demand_store(demand_store: DemandStore, path_to_taxi_data: str):
+    path_to_store = get_path_to_demand_store(path_to_taxi_data)
+    os.makedirs(path_to_store, exist_ok=True)
+    columns = (demand_store.origin_node_ids, demand_store.destination_node_ids, demand_store.request_times_ms,
+               demand_store.minute_offsets)
+    for column_name, column in zip(DEMAND_STORE_COLUMNS, columns):
+        np.save(os.path.join(path_to_store, f"{column_name}.npy"), np.ascontiguousarray(column), allow_pickle=False)
+    header = {"format": DEMAND_STORE_FORMAT_NAME,
+              "version": DEMAND_STORE_FORMAT_VERSION,
+              "date": demand_store.date,
+              "num_of_requests": demand_store.get_num_of_requests()}
+    with open(os.path.join(path_to_store, "header.json"), "w") as f:
+        json.dump(header, f, indent=2)
+
+
+def load_demand_store(path_to_taxi_data: str) -> DemandStore:
+    # Prefer the memory-mapped demand store if it has been converted, otherwise build it from the pickle file.
+    if not has_demand_store(path_to_taxi_data):
+        with open(path_to_taxi_data, "rb") as f:
+            return build_demand_store_from_requests(pickle.load(f))
+    path_to_store = get_path_to_demand_store(path_to_taxi_data)
+    with open(os.path.join(path_to_store, "header.json"), "r") as f:
+        header = json.load(f)
+    assert (header["format"] == DEMAND_STORE_FORMAT_NAME and "Not a demand store header!")
+    assert (header["version"] == DEMAND_STORE_FORMAT_VERSION and "Unsupported demand store format version!")
+    columns = [np.load(os.path.join(path_to_store, f"{column_name}.npy"), mmap_mode="r", allow_pickle=False)
+               for column_name in DEMAND_STORE_COLUMNS]
+    assert (len(columns[2]) == header["num_of_requests"])
+    return DemandStore(columns[0], columns[1], columns[2], header["date"], columns[3])
+
+
+def convert_taxi_data_to_demand_store(path_to_taxi_data: str):
+    with open(path_to_taxi_data, "rb") as f:
+        demand_store = build_demand_store_from_requests(pickle.load(f))
+    save_demand_store(demand_store, path_to_taxi_data)
+    print(f"[INFO] Converted \"{path_to_taxi_data}\" to demand store ({demand_store.get_num_of_requests()} requests).")
@@ -0,0 +1,87 @@
+import csv
+import json
+import time
+from src.simulator.config import *
+
+##################################################################################
+# Epoch Instrumentation
+##################################################################################
+# Records, for each epoch, the runtime of each phase (measured with the monotonic time.perf_counter_ns) and some counts
+# of the work done (e.g. the number of vehicle trip pairs), and streams them to a csv or jsonl file (one row per epoch),
+# so that the time of each epoch can be charted and compared between runs. The phases are timed by the code of each
+# phase, through the process-wide epoch_instrumentation below, which costs one attribute check when it is disabled:
+#     phase_start_ns = epoch_instrumentation.start_phase()
+#     ...
+#     epoch_instrumentation.end_phase("ilp_solve", phase_start_ns)
+EPOCH_PHASES = ("advance_vehicles", "walkaway", "generate_orders", "search", "score", "ilp_build", "ilp_solve",
+                "upd_schedules", "rebalance")
+EPOCH_COUNTS = ("num_of_new_orders", "num_of_considered_orders", "num_of_pairs", "num_of_trips",
+                "num_of_ilp_variables", "num_of_ilp_constraints", "num_of_rebalancing_vehicles")
+EPOCH_RECORD_FIELDS = ("epoch_start_time_ms", "epoch_ns") + tuple(f"{phase}_ns" for phase in EPOCH_PHASES) \
+    + EPOCH_COUNTS
+
+
+class EpochInstrumentation(object):
+    def __init__(self):
+        self.enabled = False
+        self.file = None
+        self.csv_writer = None  # None if the records are written as json lines.
+        self.record = None
+        self.epoch_start_ns = 0
+
+    def open(self, path_to_output: str):
+        # The records are written as json lines if the file ends with ".jsonl", otherwise as csv rows.
+        os.makedirs(os.path.dirname(os.path.abspath(path_to_output)), exist_ok=True)
+        self.file = open(path_to_output, "w", newline="")
+        if path_to_output.endswith(".jsonl"):
+            self.csv_writer = None
+        else:
+            self.csv_writer = csv.DictWriter(self.file, fieldnames=EPOCH_RECORD_FIELDS)
+            self.csv_writer.writeheader()
+        self.enabled = True
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+        self.detach()
+
+    def detach(self):
+        # Stop recording without closing the file, e.g. in a forked process that shares the file with its parent.
+        self.enabled = False
+        self.file = None
+        self.csv_writer = None
+        self.record = None
+
+    def start_epoch(self, epoch_start_time_ms: int):
+        if not self.enabled:
+            return
+        self.record = dict.fromkeys(EPOCH_RECORD_FIELDS, 0)
+        self.record["epoch_start_time_ms"] = epoch_start_time_ms
+        self.epoch_start_ns = time.perf_counter_ns()
+
+    def start_phase(self) -> int:
+        return time.perf_counter_ns() if self.enabled else 0
+
+    def end_phase(self, phase: str, phase_start_ns: int):
+        # The runtime of a phase run several times in an epoch adds up.
+        if self.enabled:
+            self.record[f"{phase}_ns"] += time.perf_counter_ns() - phase_start_ns
+
+    def add_count(self, count_name: str, count: int):
+        if self.enabled:
+            self.record[count_name] += count
+
+    def end_epoch(self):
+        if not self.enabled:
+            return
+        self.record["epoch_ns"] = time.perf_counter_ns() - self.epoch_start_ns
+        if self.csv_writer is not None:
+            self.csv_writer.writerow(self.record)
+        else:
+            self.file.write(json.dumps(self.record) + "\n")
+        # Flushed after each epoch, so that the records of a crashed run are kept.
+        self.file.flush()
+        self.record = None
+
+
+epoch_instrumentation = EpochInstrumentation()
@@ -0,0 +1,130 @@
+import sys
+import glob
+sys.path.append("../..")
+from src.simulator.router import *
+from src.utility.demand_store import *
+
+##################################################################################
+# Locality-Preserving Node Renumbering
+##################################################################################
+# The travel tables are indexed by the raw node id, so spatially adjacent nodes can be far apart in memory. This
+# offline step renumbers the nodes along a Hilbert curve over their lon/lat and rewrites the tables (as binary tables)
+# in the new order, so that the gathers among nearby nodes during dispatch touch nearby memory. The Router reads the
+# node permutation from the table headers and translates the external node ids to the internal rows transparently.
+NODE_ORDER_NAME = "node-order"
+
+
+def compute_hilbert_curve_order(lons: np.ndarray, lats: np.ndarray, num_of_bits: int = 16) -> np.ndarray:
+    # Return the indices of the points sorted by their distance along a Hilbert curve over the bounding box.
+    side = 1 << num_of_bits
+    x = np.rint((lons - lons.min()) / max(lons.max() - lons.min(), 1e-12) * (side - 1)).astype(np.int64)
+    y = np.rint((lats - lats.min()) / max(lats.max() - lats.min(), 1e-12) * (side - 1)).astype(np.int64)
+    distances = np.zeros(len(x), dtype=np.int64)
+    s = side >> 1
+    while s > 0:
+        rx = ((x & s) > 0).astype(np.int64)
+        ry = ((y & s) > 0).astype(np.int64)
+        distances += s * s * ((3 * rx) ^ ry)
+        # Rotate the quadrant, so that the curve is continuous.
+        flip = (ry == 0) & (rx == 1)
+        x = np.where(flip, side - 1 - x, x)
+        y = np.where(flip, side - 1 - y, y)
+        swap = ry == 0
+        x, y = np.where(swap, y, x), np.where(swap, x, y)
+        s >>= 1
+    return np.argsort(distances, kind="stable")
+
+
+def reorder_travel_tables(router_func: Router,
+                          path_to_mean_table: str,
+                          path_to_dist_table: str,
+                          path_to_path_table: str,
+                          output_dir: str):
+    # Write the router's travel tables, renumbered along a Hilbert curve, as binary tables into output_dir.
+    t = timer_start()
+    os.makedirs(output_dir, exist_ok=True)
+    # new_node_order[new_row] = external node id.
+    new_node_order = router_func.node_ids[compute_hilbert_curve_order(router_func.node_lons, router_func.node_lats)]
+    new_rows = router_func.row_of_node[new_node_order]
+
+    # 1. Permute the rows and columns of the tables.
+    time_unit = "s" if router_func.time_table_scale_to_ms == 1000 else "ms"
+    distance_unit = "m" if router_func.distance_table_scale_to_mm == 1000 else "mm"
+    reordered_mean_table = np.asarray(router_func.mean_travel_time_table)[np.ix_(new_rows, new_rows)]
+    reordered_dist_table = np.asarray(router_func.travel_distance_table)[np.ix_(new_rows, new_rows)]
+    reordered_path_table = np.asarray(router_func.shortest_path_table)[np.ix_(new_rows, new_rows)]
+
+    # 2. The predecessors in the path table are internal node ids as well, which are translated to the new order.
+    #    (Values <= 0 only mean "no predecessor".)
+    new_row_of_old_row = np.empty(len(new_rows), dtype=np.int64)
+    new_row_of_old_row[new_rows] = np.arange(len(new_rows))
+    has_predecessor = reordered_path_table > 0
+    reordered_path_table = reordered_path_table.copy()
+    reordered_path_table[has_predecessor] = \
+        (new_row_of_old_row[reordered_path_table[has_predecessor] - 1] + 1).astype(reordered_path_table.dtype)
+
+    # 3. Save the tables and the node order.
+    save_table_to_binary_file(new_node_order, os.path.join(output_dir, NODE_ORDER_NAME), "node_id")
+    for table, path_to_table, unit in ((reordered_mean_table, path_to_mean_table, time_unit),
+                                       (reordered_dist_table, path_to_dist_table, distance_unit),
+                                       (reordered_path_table, path_to_path_table, "node_id")):
+        path_to_reordered_table = os.path.join(output_dir, os.path.basename(path_to_table))
+        save_table_to_binary_file(table, path_to_reordered_table, unit, NODE_ORDER_NAME)
+        # The reachability indices of a previous order are stale.
+        for path_to_stale_file in glob.glob(os.path.splitext(path_to_reordered_table)[0] + "-reachability-*"):
+            os.remove(path_to_stale_file)
+
+    # 4. Build the reachability indices of the new order, within the router's radius.
+    build_and_save_reachability_indices(os.path.join(output_dir, os.path.basename(path_to_mean_table)),
+                                        reordered_mean_table, router_func.time_table_scale_to_ms,
+                                        router_func.reachability_radius_ms)
+    print(f"[INFO] Renumbered {len(new_node_order)} nodes along a Hilbert curve into \"{output_dir}\". "
+          f"({timer_end(t)})")
+
+
+def benchmark_table_gathers(routers: dict, origin_node_ids: np.ndarray, vehicles_node_ids: np.ndarray,
+                            num_of_repeats: int = 5):
+    # Replay the gathers of candidate generation in dispatch (the travel times from all vehicles to each order's
+    # origin) and of schedule insertion (scalar lookups between an order's origin and the nearby nodes) on each router.
+    results_ms = {}
+    for name, router_func in routers.items():
+        best_runtime_ms = np.inf
+        for _ in range(num_of_repeats):
+            t = timer_start()
+            for onid in origin_node_ids:
+                router_func.get_durations_ms(vehicles_node_ids, onid)
+                nearby_node_ids, _ = router_func.get_nodes_within_duration_to(onid, router_func.reachability_radius_ms)
+                for nid in nearby_node_ids[:50]:
+                    router_func.get_duration_ms(nid, onid)
+                    router_func.get_duration_ms(onid, nid)
+            best_runtime_ms = min(best_runtime_ms, get_runtime_ms_from_t_to_now(t))
+        results_ms[name] = best_runtime_ms
+        print(f"[INFO] Table gathers with the {name} node order: {best_runtime_ms:.1f} ms "
+              f"({len(origin_node_ids)} orders x {len(vehicles_node_ids)} vehicles).")
+    return results_ms
+
+
+if __name__ == '__main__':
+    original_router = Router(PATH_TO_NETWORK_NODES, PATH_TO_VEHICLE_STATIONS, PATH_TO_SHORTEST_PATH_TABLE,
+                             PATH_TO_MEAN_TRAVEL_TIME_TABLE, PATH_TO_TRAVEL_DISTANCE_TABLE, REACHABILITY_RADIUS_MS)
+    hilbert_dir = f"{ROOT_PATH}/datalog-gitignore/map-data/hilbert"
+    reorder_travel_tables(original_router, PATH_TO_MEAN_TRAVEL_TIME_TABLE, PATH_TO_TRAVEL_DISTANCE_TABLE,
+                          PATH_TO_SHORTEST_PATH_TABLE, hilbert_dir)
+    reordered_router = Router(PATH_TO_NETWORK_NODES, PATH_TO_VEHICLE_STATIONS,
+                              os.path.join(hilbert_dir, os.path.basename(PATH_TO_SHORTEST_PATH_TABLE)),
+                              os.path.join(hilbert_dir, os.path.basename(PATH_TO_MEAN_TRAVEL_TIME_TABLE)),
+                              os.path.join(hilbert_dir, os.path.basename(PATH_TO_TRAVEL_DISTANCE_TABLE)),
+                              REACHABILITY_RADIUS_MS)
+
+    # Use the requests of the peak hour as the dispatch workload: the orders' origins, and the destinations of the
+    # previous requests as the vehicles' positions.
+    demand_store = load_demand_store(PATH_TO_TAXI_DATA)
+    start_time_ms = compute_the_accumulated_seconds_from_0_clock(SIMULATION_START_TIME) * 1000
+    window_start_idx = demand_store.get_first_request_idx_at_or_after(start_time_ms)
+    window_end_idx = demand_store.get_first_request_idx_at_or_after(start_time_ms + CYCLE_S * 1000)
+    workload_origin_node_ids = np.asarray(demand_store.origin_node_ids[window_start_idx:window_end_idx])
+    workload_vehicles_node_ids = \
+        np.asarray(demand_store.destination_node_ids[max(window_start_idx - FLEET_SIZE, 0):window_start_idx])
+    runtimes_ms = benchmark_table_gathers({"original": original_router, "hilbert": reordered_router},
+                                          workload_origin_node_ids, workload_vehicles_node_ids)
+    print(f"[INFO] Speedup: {runtimes_ms['original'] / runtimes_ms['hilbert']:.2f}x")
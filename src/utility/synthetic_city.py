@@ -0,0 +1,144 @@
+import glob
+import heapq
+from src.utility.binary_tables import *
+from src.utility.demand_store import *
+
+##################################################################################
+# Synthetic Grid City
+##################################################################################
+# A small city generated from a seed, for the benchmarks (see benchmark.py), which cannot rely on the (git-ignored)
+# Manhattan data: a square grid of intersections joined by two-way streets, each direction at its own random speed,
+# a few vehicle stations, and a day of requests whose origins are concentrated downtown (the center of the grid).
+# The files are laid out as the converted real data, so that the Router and the DemandGenerator load them unchanged:
+#   nodes.pickle, stations.pickle, {path, mean, dist}-table.npy + .header.json, the reachability indices of the mean
+#   table (within REACHABILITY_RADIUS_MS), taxi-demand/ and city.json
+# where city.json records the parameters that the city was generated with. The same parameters give the same city.
+SYNTHETIC_CITY_FORMAT_NAME = "amod-synthetic-city"
+SYNTHETIC_CITY_FORMAT_VERSION = 1
+SYNTHETIC_CITY_DATE = "2016-05-26"
+# 400 nodes about 200 m apart (a 4 km x 4 km city), and 1800 requests/h (about a tenth of the Manhattan peak demand).
+SYNTHETIC_CITY_DEFAULT_PARAMS = {"grid_width": 20,
+                                 "block_length_m": 200.0,
+                                 "num_of_stations": 40,
+                                 "num_of_requests_per_hour": 1800,
+                                 "seed": 0}
+
+
+def get_paths_of_synthetic_city(path_to_city: str) -> dict:
+    # The paths to pass to the Router and to SimulationConfig(path_to_taxi_data=...).
+    return {"network_nodes": f"{path_to_city}/nodes.pickle",
+            "vehicle_stations": f"{path_to_city}/stations.pickle",
+            "shortest_path_table": f"{path_to_city}/path-table.pickle",
+            "mean_travel_time_table": f"{path_to_city}/mean-table.pickle",
+            "travel_distance_table": f"{path_to_city}/dist-table.pickle",
+            "taxi_data": f"{path_to_city}/taxi.pickle"}
+
+
+def build_synthetic_city(path_to_city: str,
+                         grid_width: int,
+                         block_length_m: float,
+                         num_of_stations: int,
+                         num_of_requests_per_hour: int,
+                         seed: int):
+    t = timer_start()
+    rng = np.random.default_rng(seed)
+    num_of_nodes = grid_width * grid_width
+    os.makedirs(path_to_city, exist_ok=True)
+    paths = get_paths_of_synthetic_city(path_to_city)
+
+    # 1. The nodes, numbered row by row from 1, around midtown Manhattan (1 degree of latitude is about 111 km).
+    rows, cols = np.divmod(np.arange(num_of_nodes), grid_width)
+    node_lons = -73.99 + cols * block_length_m / 84000.0
+    node_lats = 40.75 + rows * block_length_m / 111000.0
+    nodes = [Pos(node_idx + 1, lon, lat)
+             for node_idx, (lon, lat) in enumerate(zip(node_lons.tolist(), node_lats.tolist()))]
+
+    # 2. The streets between neighbouring nodes. Each direction of a street has its own speed, of 4 - 12 m/s.
+    out_edges = [[] for _ in range(num_of_nodes)]
+    for node_idx in range(num_of_nodes):
+        for neighbour_idx in (node_idx + 1 if cols[node_idx] < grid_width - 1 else None,
+                              node_idx + grid_width if rows[node_idx] < grid_width - 1 else None):
+            if neighbour_idx is None:
+                continue
+            length_m = block_length_m * rng.uniform(0.9, 1.1)
+            for from_idx, to_idx in ((node_idx, neighbour_idx), (neighbour_idx, node_idx)):
+                out_edges[from_idx].append((to_idx, length_m / rng.uniform(4.0, 12.0), length_m))
+
+    # 3. The travel tables, by Dijkstra from each node: the mean travel time (s), the travel distance (m) and the
+    #    predecessor of each node on the shortest path from the origin (node id, -1 for the origin itself).
+    mean_table = np.zeros((num_of_nodes, num_of_nodes), dtype=np.float64)
+    dist_table = np.zeros((num_of_nodes, num_of_nodes), dtype=np.float64)
+    path_table = np.full((num_of_nodes, num_of_nodes), -1, dtype=np.int64)
+    for origin_idx in range(num_of_nodes):
+        durations_s = [np.inf] * num_of_nodes
+        distances_m = [0.0] * num_of_nodes
+        predecessors = [-1] * num_of_nodes
+        durations_s[origin_idx] = 0.0
+        heap = [(0.0, origin_idx)]
+        while heap:
+            duration_s, node_idx = heapq.heappop(heap)
+            if duration_s > durations_s[node_idx]:
+                continue
+            for to_idx, edge_duration_s, edge_length_m in out_edges[node_idx]:
+                if duration_s + edge_duration_s < durations_s[to_idx]:
+                    durations_s[to_idx] = duration_s + edge_duration_s
+                    distances_m[to_idx] = distances_m[node_idx] + edge_length_m
+                    predecessors[to_idx] = node_idx + 1
+                    heapq.heappush(heap, (durations_s[to_idx], to_idx))
+        mean_table[origin_idx] = durations_s
+        dist_table[origin_idx] = distances_m
+        path_table[origin_idx] = predecessors
+
+    # 4. The vehicle stations, spread evenly over the nodes.
+    station_node_indices = np.linspace(0, num_of_nodes - 1, num_of_stations).round().astype(int)
+    stations = [nodes[node_idx] for node_idx in station_node_indices]
+
+    # 5. A day of requests (Poisson arrivals, in whole seconds). The origins are drawn with a weight decaying with the
+    #    distance to the center, the destinations uniformly.
+    center = (grid_width - 1) / 2
+    origin_weights = np.exp(-((rows - center) ** 2 + (cols - center) ** 2) / (2 * (grid_width / 4) ** 2))
+    num_of_requests = int(rng.poisson(num_of_requests_per_hour * 24))
+    request_times_ms = np.sort(rng.integers(0, 24 * 3600, num_of_requests)) * 1000
+    origin_node_ids = rng.choice(num_of_nodes, num_of_requests, p=origin_weights / origin_weights.sum()) + 1
+    destination_offsets = rng.integers(1, num_of_nodes, num_of_requests)
+    destination_node_ids = (origin_node_ids - 1 + destination_offsets) % num_of_nodes + 1
+
+    # 6. Save the files. (The reachability indices of a previous city in the folder, which the Router would load
+    #    instead of the ones of the new tables, are removed.)
+    for path_to_index in glob.glob(f"{path_to_city}/mean-table-reachability-*"):
+        os.remove(path_to_index)
+    for path_to_pickle, content in ((paths["network_nodes"], nodes), (paths["vehicle_stations"], stations)):
+        with open(path_to_pickle, "wb") as f:
+            pickle.dump(content, f)
+    save_table_to_binary_file(path_table, paths["shortest_path_table"], "node_id")
+    save_table_to_binary_file(mean_table, paths["mean_travel_time_table"], "s")
+    save_table_to_binary_file(dist_table, paths["travel_distance_table"], "m")
+    build_and_save_reachability_indices(paths["mean_travel_time_table"], mean_table, 1000, REACHABILITY_RADIUS_MS)
+    save_demand_store(build_demand_store_from_columns(origin_node_ids, destination_node_ids, request_times_ms,
+                                                      SYNTHETIC_CITY_DATE), paths["taxi_data"])
+    city = {"format": SYNTHETIC_CITY_FORMAT_NAME,
+            "version": SYNTHETIC_CITY_FORMAT_VERSION,
+            "grid_width": grid_width,
+            "block_length_m": block_length_m,
+            "num_of_stations": num_of_stations,
+            "num_of_requests_per_hour": num_of_requests_per_hour,
+            "seed": seed}
+    with open(f"{path_to_city}/city.json", "w") as f:
+        json.dump(city, f, indent=2)
+    print(f"[INFO] Built the synthetic city of {num_of_nodes} nodes and {num_of_requests} requests "
+          f"in \"{path_to_city}\". ({timer_end(t)})")
+
+
+def load_or_build_synthetic_city(path_to_city: str, **city_params) -> dict:
+    # Build the city (with the default params, overridden by the given ones), unless it has been built before with the
+    # same params, and return its paths.
+    city_params = dict(SYNTHETIC_CITY_DEFAULT_PARAMS, **city_params)
+    expected_city = {"format": SYNTHETIC_CITY_FORMAT_NAME, "version": SYNTHETIC_CITY_FORMAT_VERSION, **city_params}
+    path_to_header = f"{path_to_city}/city.json"
+    city = {}
+    if os.path.exists(path_to_header):
+        with open(path_to_header, "r") as f:
+            city = json.load(f)
+    if city != expected_city:
+        build_synthetic_city(path_to_city, **city_params)
+    return get_paths_of_synthetic_city(path_to_city)
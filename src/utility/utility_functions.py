@@ -10,6 +10,7 @@ from tqdm import tqdm
 
 from src.simulator.types import *
 from src.simulator.config import *
+from src.utility.epoch_instrumentation import *
 
 
 # def convert_time_date_to_seconds(time_date):
@@ -64,8 +64,9 @@ class Experience(object):
 
 def convert_and_store_feasible_schedules_as_an_experience(feasible_vehicle_trip_pairs: list[SchedulingResult],
                                                           num_of_new_orders: int,
-                                                          orders: list[Order],
+                                                          orders: OrderStore,
                                                           vehicles: list[Vehicle],
+                                                          vehicle_index: VehiclePositionIndex,
                                                           system_time_ms: int,
                                                           router_func: Router,
                                                           cycle_ms: int) -> Experience:
@@ -80,14 +81,14 @@ def convert_and_store_feasible_schedules_as_an_experience(feasible_vehicle_trip_
 
     for vehicle in vehicles:
         # 1. Add each vehicle's id, location node id, the number of its nearby vehicles
-        # and the length of its complete schedule pos.
-        num_of_nearby_vehicles = 0
-        for vehicle_2 in vehicles:
-            if router_func.get_route(vehicle.pos, vehicle_2.pos, RoutingType.TIME_ONLY).duration_ms \
-                    < max_pickup_wait_time_ms \
-                    or router_func.get_route(vehicle_2.pos, vehicle.pos, RoutingType.TIME_ONLY).duration_ms \
-                    < max_pickup_wait_time_ms:
-                num_of_nearby_vehicles += 1
+        # and the length of its complete schedule pos. (Nearby: the travel time in either direction is less than
+        # max_pickup_wait_time_ms. The queries of the vehicle index include the max duration, so "less than" is
+        # queried as "at most max_pickup_wait_time_ms - 1", which only holds because the durations of the reachability
+        # index are rounded to whole milliseconds.)
+        num_of_nearby_vehicles = len(np.union1d(
+            vehicle_index.get_vehicle_ids_within_duration_to(vehicle.pos.node_id, max_pickup_wait_time_ms - 1,
+                                                             include_step_to_pos=False),
+            vehicle_index.get_vehicle_ids_within_duration_from(vehicle.pos.node_id, max_pickup_wait_time_ms - 1)))
         assert (len(vehicles_info) == vehicle.id)
         vehicles_info.append([vehicle.id, vehicle.pos.node_id, num_of_nearby_vehicles, len(vehicle.schedule) + 1])
 
@@ -116,7 +117,7 @@ def convert_and_store_feasible_schedules_as_an_experience(feasible_vehicle_trip_
         vehicle_pos_node_id = vehicle.pos.node_id
         candidate_schedule_start_idx = 0
         candidate_schedule = vt_pair.feasible_schedules[vt_pair.best_schedule_idx]
-        remaining_time = cycle_ms - vehicle.step_to_pos.duration_ms
+        remaining_time = cycle_ms - vehicle.step_to_pos_duration_ms
         if remaining_time > 0:
             for wp in candidate_schedule:
                 if wp.route.duration_ms <= remaining_time:
@@ -124,7 +125,7 @@ def convert_and_store_feasible_schedules_as_an_experience(feasible_vehicle_trip_
                     vehicle_pos_node_id = wp.pos.node_id
                     candidate_schedule_start_idx += 1
                 else:
-                    for step in wp.route:
+                    for step in wp.route.steps:
                         if step.duration_ms <= remaining_time:
                             remaining_time -= step.duration_ms
                             vehicle_pos_node_id = step.poses[1].node_id
@@ -139,7 +140,7 @@ def convert_and_store_feasible_schedules_as_an_experience(feasible_vehicle_trip_
                                                     schedule_start_idx=candidate_schedule_start_idx,
                                                     orders=orders,
                                                     max_pickup_wait_time_ms=max_pickup_wait_time_ms,
-                                                    accumulated_time_ms=vehicle.step_to_pos.duration_ms,
+                                                    accumulated_time_ms=vehicle.step_to_pos_duration_ms,
                                                     system_time_ms=system_time_ms)
         vehicles_candidate_schedules_info_updated_to_next_epoch.append(
             [vehicle.id, len(vehicle.schedule) + 1 - candidate_schedule_start_idx])
@@ -159,7 +160,7 @@ def convert_schedule_to_list_data_structure(vehicle_pos_node_id: int,
                                             vehicle_capacity: int,
                                             schedule: list[Waypoint],
                                             schedule_start_idx: int,
-                                            orders: list[Order],
+                                            orders: OrderStore,
                                             max_pickup_wait_time_ms: int,
                                             accumulated_time_ms: int,
                                             system_time_ms: int) -> tuple[list[int], list[int]]:
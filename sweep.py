@@ -0,0 +1,14 @@
+from src.simulator.sweep import *
+
+
+if __name__ == '__main__':
+    print("Initializing the sweep ...")
+    router = Router(PATH_TO_NETWORK_NODES, PATH_TO_VEHICLE_STATIONS, PATH_TO_SHORTEST_PATH_TABLE,
+                    PATH_TO_MEAN_TRAVEL_TIME_TABLE, PATH_TO_TRAVEL_DISTANCE_TABLE, REACHABILITY_RADIUS_MS)
+    # The settings of SimulationConfig to sweep, each with the list of its values.
+    config_grid = {"fleet_size": [1000, 1500, 2000],
+                   "veh_capacity": [4, 8],
+                   "dispatcher": ["SBA", "OSP"]}
+    sweep_time_stamp = get_time_stamp_datetime().strftime('%Y-%m-%d-%H-%M-%S')
+    run_parameter_sweep(router, expand_config_grid(config_grid),
+                        f"{ROOT_PATH}/datalog-gitignore/sweeps/sweep-{sweep_time_stamp}.csv")